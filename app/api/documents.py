@@ -1,65 +1,238 @@
+import hashlib
 import os
 import uuid
+from typing import Optional, Tuple
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import JSONResponse
 from app.core.config import settings
+from app.core.metrics import span
+from app.core.registry import registry
+from app.db.catalog import catalog
+from app.db.indexes import ingest_slot
 from app.db.vectorstore import VectorStore
-from app.services.pdf import extract_text_from_pdf
-from app.services.chunking import chunk_text
+from app.services.jobs import JobConflict, JobQueueFull, job_manager
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+def _append(f, hasher, piece: bytes) -> None:
+    hasher.update(piece)
+    f.write(piece)
+
+def _open_part(tmp_path: str):
+    os.makedirs(os.path.dirname(tmp_path) or ".", exist_ok=True)
+    return open(tmp_path, "wb")
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _find_duplicate(content_hash: str) -> Tuple[Optional[str], int]:
+    """doc_id and chunk count of an identical file already indexed (made the active doc), if any."""
+    vs = VectorStore()
+    doc_id = vs.find_by_content_hash(content_hash)
+    if not doc_id:
+        return None, 0
+    vs.set_active_doc(doc_id)
+    return doc_id, (catalog.get(doc_id) or {}).get("chunks", 0)
+
 @router.post("/upload")
 async def upload_document(file: UploadFile = File(...)):
+    """
+    Store the PDF and queue it for ingestion (202 + job_id); an identical
+    file already indexed is reused. Disk writes and lookups run on the
+    upload pool; 429/503 + Retry-After when uploads are saturated.
+    """
+    async with registry.get_admission_gate("upload").admit():
+        return await _store_upload(file)
+
+async def _receive_pdf(file: UploadFile, pool):
+    """
+    Stream the upload to disk in fixed-size pieces, hashing as we go.
+    Returns (final file path, temp path holding the bytes, sha256).
+    """
+    filename = file.filename
+    if not filename.lower().endswith(".pdf"):
+        logger.warning(f"Upload rejected: not a PDF - {filename}")
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+
+    upload_dir = getattr(settings, "UPLOAD_DIR", "./uploads")
+    file_path = os.path.join(upload_dir, f"{uuid.uuid4()}_{filename}")
+    tmp_path = f"{file_path}.part"
+
+    hasher = hashlib.sha256()
+    # File operations block on disk, so all of them run on the upload pool
+    f = await pool.run(_open_part, tmp_path)
+    try:
+        with span("upload_write"):
+            while True:
+                piece = await file.read(settings.upload_chunk_bytes)
+                if not piece:
+                    break
+                await pool.run(_append, f, hasher, piece)
+        await pool.run(f.close)
+    except BaseException:
+        await pool.run(f.close)
+        await pool.run(_remove, tmp_path)
+        raise
+    return file_path, tmp_path, hasher.hexdigest()
+
+async def _store_upload(file: UploadFile):
+    pool = registry.get_upload_executor()
     try:
         filename = file.filename
-        if not filename.lower().endswith(".pdf"):
-            logger.warning(f"Upload rejected: not a PDF - {filename}")
-            raise HTTPException(status_code=400, detail="Only PDF files are supported")
+        file_path, tmp_path, content_hash = await _receive_pdf(file, pool)
+        try:
+            # Identical file already indexed -> reuse it, skip the whole pipeline
+            pending = None
+            with span("dedupe_lookup"):
+                existing_doc_id, chunks = await pool.run(_find_duplicate, content_hash)
+                if not existing_doc_id:
+                    # Same file still being ingested -> that job covers this upload too
+                    pending = await pool.run(job_manager.store.find_pending_by_hash, content_hash)
+            if not existing_doc_id and pending is None:
+                await pool.run(os.replace, tmp_path, file_path)
+        finally:
+            # Already moved into place unless it was a duplicate or the lookup failed
+            await pool.run(_remove, tmp_path)
 
-        # Save uploaded file locally
-        upload_dir = getattr(settings, "UPLOAD_DIR", "./uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, f"{uuid.uuid4()}_{filename}")
+        if existing_doc_id:
+            logger.info(f"Duplicate upload of {filename}; reusing doc_id={existing_doc_id}")
+            return {
+                "status": "success",
+                "doc_id": existing_doc_id,
+                "filename": filename,
+                "chunks": chunks,
+                "duplicate": True,
+            }
+        if pending is not None:
+            logger.info(f"Upload of {filename} matches pending job {pending['job_id']}; not stored again")
+            job = pending
+        else:
+            logger.info(f"File uploaded and saved: {file_path}")
 
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        logger.info(f"File uploaded and saved: {file_path}")
+            # Extraction, chunking and indexing run on the background worker pool
+            try:
+                with span("enqueue"):
+                    job = await pool.run(job_manager.submit, file_path, filename, content_hash=content_hash)
+            except JobQueueFull as e:
+                await pool.run(_remove, file_path)
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(settings.retry_after_s)})
+            if job.get("file_path") != file_path:
+                # An identical upload was queued in the meantime; its job reads its own copy
+                await pool.run(_remove, file_path)
 
-        # Extract raw text + page map
-        full_text, page_map = extract_text_from_pdf(file_path)
-        if not full_text.strip():
-            logger.warning(f"No text extracted from PDF: {file_path}")
-            raise HTTPException(status_code=400, detail="No text could be extracted from PDF")
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
+            "job_id": job["job_id"],
+            "filename": filename,
+            "duplicate": False,
+        })
 
-        # Build chunks per page
-        chunks = []
-        for page_num, page_text in page_map.items():
-            page_chunks = chunk_text(page_text, settings.chunk_size, settings.chunk_overlap)
-            for ch in page_chunks:
-                chunks.append({"text": ch, "page": page_num})
-        logger.info(f"Created {len(chunks)} chunks from PDF: {filename}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Upload failed", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@router.put("/documents/{doc_id}")
+async def replace_document(doc_id: str, file: UploadFile = File(...)):
+    """
+    Upload a new revision of an existing document, keeping its doc_id.
+    The job re-chunks the PDF and re-embeds only chunks that changed;
+    chunks that disappeared are deleted. 409 if the document already has
+    a pending job.
+    """
+    async with registry.get_admission_gate("upload").admit():
+        return await _store_replacement(doc_id, file)
 
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No chunks were created from PDF")
+async def _store_replacement(doc_id: str, file: UploadFile):
+    pool = registry.get_upload_executor()
+    try:
+        record = await pool.run(catalog.get, doc_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Unknown doc_id: {doc_id}")
 
-        # Store to vectorstore (embeddings computed internally)
-        vs = VectorStore()
-        doc_id = vs.add_document(doc_name=filename, chunks=chunks)
-        logger.info(f"Document indexed with doc_id={doc_id}")
+        file_path, tmp_path, content_hash = await _receive_pdf(file, pool)
+        unchanged = content_hash == record.get("content_hash")
+        try:
+            if not unchanged:
+                await pool.run(os.replace, tmp_path, file_path)
+        finally:
+            await pool.run(_remove, tmp_path)
+        if unchanged:
+            logger.info(f"Replacement of doc_id={doc_id} is identical; nothing to do")
+            return {"status": "unchanged", "doc_id": doc_id, "chunks": record.get("chunks", 0)}
 
+        try:
+            with span("enqueue"):
+                job = await pool.run(
+                    job_manager.submit, file_path, file.filename, content_hash=content_hash, replace_doc_id=doc_id
+                )
+        except JobConflict as e:
+            await pool.run(_remove, file_path)
+            raise HTTPException(status_code=409, detail=str(e))
+        except JobQueueFull as e:
+            await pool.run(_remove, file_path)
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(settings.retry_after_s)})
 
-        return {
-            "status": "success",
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
+            "job_id": job["job_id"],
             "doc_id": doc_id,
-            "filename": filename,
-            "chunks": len(chunks)
-        }
+            "filename": file.filename,
+        })
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error("Upload failed", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+        logger.error("Replacement upload failed", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Replacement failed: {str(e)}")
+
+def _delete_document(doc_id: str) -> bool:
+    with ingest_slot():
+        return VectorStore().delete_document(doc_id)
+
+@router.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """Remove a document's chunks, catalog entry and cached answers."""
+    pool = registry.get_upload_executor()
+    async with registry.get_admission_gate("upload").admit():
+        try:
+            if await pool.run(job_manager.store.find_pending_by_doc, doc_id):
+                raise HTTPException(status_code=409, detail=f"Document {doc_id} has a pending ingestion job")
+            deleted = await pool.run(_delete_document, doc_id)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Delete of doc_id={doc_id} failed", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Unknown doc_id: {doc_id}")
+    logger.info(f"Deleted doc_id={doc_id}")
+    return {"status": "deleted", "doc_id": doc_id}
+
+@router.post("/compact")
+async def compact_index():
+    """
+    Reclaim index space left by deleted and replaced chunks (rewrites the
+    memory-mapped matrix, VACUUMs the SQLite files). Safe while serving;
+    expect it to take a while on large indexes.
+    """
+    async with registry.get_admission_gate("upload").admit():
+        try:
+            return await registry.get_upload_executor().run(lambda: VectorStore().compact())
+        except Exception as e:
+            logger.error("Compaction failed", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Compaction failed: {str(e)}")
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Ingestion status: stage, page/chunk progress, doc_id once done, error if failed."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job_id: {job_id}")
+    return job
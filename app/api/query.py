@@ -1,6 +1,21 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from app.services.retrieval import retrieve, answer_with_context
+import asyncio
+import json
+from typing import List, Literal
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.core.config import settings
+from app.core.metrics import metrics, span
+from app.core.registry import registry
+from app.db.vectorstore import VectorStore
+from app.services.retrieval import (
+    ALL_DOCS,
+    resolve_scope,
+    retrieve,
+    retrieve_batch,
+    answer_with_context_async,
+    astream_answer_with_context,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,15 +24,185 @@ router = APIRouter()
 class QueryRequest(BaseModel):
     query: str
     doc_id: str | None = None  # Optional override of active doc
+    doc_ids: List[str] | Literal["all"] | None = None  # Several docs, or "all" for the whole corpus
+    rerank_budget_ms: float | None = Field(None, ge=0)  # Cross-encoder time budget (default RERANK_BUDGET_MS)
+
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest] = Field(..., min_length=1)
+    top_k: int | None = None
+    rerank_budget_ms: float | None = Field(None, ge=0)  # Per query, for the whole batch
+    answer: bool = False  # Also run LLM answering (bounded concurrency)
+
+async def _embed_query(query: str):
+    with span("embed"):
+        if settings.embed_batching:
+            return await registry.get_embedding_batcher().embed(query)
+        return await registry.get_query_executor().run(registry.get_embedder().embed_one, query)
+
+def _cache_result(response: Response, result: str) -> None:
+    metrics.inc("rag_answer_cache_total", result=result)
+    response.headers["X-Answer-Cache"] = result
 
 @router.post("/query")
-async def query_docs(req: QueryRequest):
+async def query_docs(req: QueryRequest, response: Response):
+    """
+    Answer a query. With the answer cache enabled, a repeated (exact after
+    normalization) or semantically similar query on the same documents is
+    served from the cache, skipping retrieval and the LLM call; the
+    `X-Answer-Cache` header says exact / semantic / miss.
+    Blocking work runs on the query pool; 429/503 when the endpoint is saturated.
+    """
+    async with registry.get_admission_gate("query").admit():
+        return await _answer_query(req, response)
+
+async def _answer_query(req: QueryRequest, response: Response):
+    pool = registry.get_query_executor()
+    try:
+        logger.info(f"Received query: '{req.query}' for doc_id: {req.doc_id}, doc_ids: {req.doc_ids}")
+        cache = registry.get_answer_cache()
+        # Resolve the scope once so lookups, retrieval and the stored entry agree
+        scope = await pool.run(lambda: resolve_scope(VectorStore(), req.doc_id, req.doc_ids))
+        if scope is not None and not scope:
+            cache = None  # nothing targeted, no active doc
+
+        if cache is not None:
+            hit = cache.get_exact(scope, req.query)
+            if hit is not None:
+                _cache_result(response, "exact")
+                return hit
+
+        query_embedding = await _embed_query(req.query)
+        if cache is not None:
+            hit = cache.get_similar(scope, query_embedding)
+            if hit is not None:
+                _cache_result(response, "semantic")
+                return hit
+            _cache_result(response, "miss")
+
+        sources = []
+        if scope is None or scope:
+            sources = await pool.run(
+                retrieve,
+                req.query,
+                target_doc_ids=ALL_DOCS if scope is None else scope,
+                query_embedding=query_embedding,
+                rerank_budget_ms=req.rerank_budget_ms,
+            )
+        answer, used_sources, citations = await answer_with_context_async(req.query, sources)
+        result = {"answer": answer, "sources": used_sources, "citations": citations}
+        if cache is not None:
+            cache.put(scope, req.query, query_embedding, result)
+        logger.info(f"Query answered; sources used: {len(used_sources)}, citations: {len(citations)}")
+        return result
+    except Exception as e:
+        logger.error("Query failed", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+
+@router.post("/query/batch")
+async def query_docs_batch(req: BatchQueryRequest):
+    """
+    Many queries in one request: one embed_batch, one multi-vector search
+    per target document, per-query re-ranking, optional answering.
+    Results keep request order; a failing query gets an `error` instead.
+    Batches have their own, smaller admission limits than single queries.
+    """
+    if len(req.queries) > settings.batch_query_max:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_query_max} queries per batch")
+
+    async with registry.get_admission_gate("batch").admit():
+        return await _answer_batch(req)
+
+async def _answer_batch(req: BatchQueryRequest):
+    logger.info(f"Received batch of {len(req.queries)} queries (answer={req.answer})")
     try:
-        logger.info(f"Received query: '{req.query}' for doc_id: {req.doc_id}")
-        sources = retrieve(req.query, target_doc_id=req.doc_id)
-        answer, used_sources = answer_with_context(req.query, sources)
-        logger.info(f"Query answered; sources used: {len(used_sources)}")
-        return {"answer": answer, "sources": used_sources}
+        retrieved = await registry.get_query_executor().run(
+            retrieve_batch,
+            [q.query for q in req.queries],
+            [q.doc_ids or q.doc_id for q in req.queries],
+            req.top_k,
+            req.rerank_budget_ms,
+        )
+    except Exception as e:
+        logger.error("Batch query failed", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch query failed: {str(e)}")
+
+    semaphore = asyncio.Semaphore(max(1, settings.batch_answer_concurrency))
+
+    async def finish(q: QueryRequest, sources) -> dict:
+        item = {"query": q.query, "doc_id": q.doc_id, "answer": None, "sources": [], "citations": [], "error": None}
+        if isinstance(sources, Exception):
+            item["error"] = f"Query failed: {str(sources)}"
+            return item
+        if not req.answer:
+            item["sources"] = sources
+            return item
+        try:
+            async with semaphore:
+                item["answer"], item["sources"], item["citations"] = await answer_with_context_async(q.query, sources)
+        except Exception as e:
+            logger.warning(f"Batch item failed: '{q.query}'", exc_info=True)
+            item["error"] = f"Query failed: {str(e)}"
+        return item
+
+    results = await asyncio.gather(*(finish(q, s) for q, s in zip(req.queries, retrieved)))
+    failed = sum(1 for r in results if r["error"])
+    logger.info(f"Batch answered; {len(results) - failed} ok, {failed} failed")
+    return {"results": results}
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_sources(req: QueryRequest) -> list:
+    try:
+        logger.info(f"Received streaming query: '{req.query}' for doc_id: {req.doc_id}, doc_ids: {req.doc_ids}")
+        query_embedding = None
+        if settings.embed_batching:
+            with span("embed"):
+                query_embedding = await registry.get_embedding_batcher().embed(req.query)
+        return await registry.get_query_executor().run(
+            retrieve,
+            req.query,
+            target_doc_id=req.doc_id,
+            target_doc_ids=req.doc_ids,
+            query_embedding=query_embedding,
+            rerank_budget_ms=req.rerank_budget_ms,
+        )
     except Exception as e:
         logger.error("Query failed", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+
+@router.post("/query/stream")
+async def query_docs_stream(req: QueryRequest):
+    """
+    Server-sent events: `sources` first, then `token` events as the LLM
+    generates, then `final` with the refined answer and supporting sources.
+    Admission covers retrieval (before the first byte); generation is
+    bounded by LLM_MAX_CONCURRENCY.
+    """
+    async with registry.get_admission_gate("query").admit():
+        sources = await _stream_sources(req)
+
+    async def events():
+        try:
+            async for event, data in astream_answer_with_context(req.query, sources):
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error("Streaming answer failed", exc_info=True)
+            yield _sse("error", {"detail": f"Query failed: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stats/embedding")
+async def embedding_stats():
+    """Micro-batcher metrics: batch sizes, queue wait and encode latency."""
+    return registry.get_embedding_batcher().stats()
+
+@router.get("/stats/answer-cache")
+async def answer_cache_stats():
+    """Answer cache size and exact/semantic hit counts."""
+    cache = registry.get_answer_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
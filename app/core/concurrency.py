@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+from app.core.metrics import profiled
+
+
+class Overloaded(Exception):
+    """Raised when an endpoint refuses a request; turned into 429/503 + Retry-After."""
+
+    def __init__(self, endpoint: str, detail: str, status_code: int, retry_after_s: float):
+        super().__init__(detail)
+        self.endpoint = endpoint
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """
+    Fixed-size thread pool that tracks how much work is waiting and running.
+    - `await run(fn, ...)` runs blocking code off the event loop, carrying
+      the caller's context variables (timing spans) like asyncio.to_thread,
+      and is added to the caller's request profile if one is being captured
+    - `queued` / `running` feed the queue-depth gauges
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        super().__init__(max_workers=max(1, int(max_workers)), thread_name_prefix=name)
+        self.name = name
+        self._counts_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        def call():
+            with self._counts_lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._counts_lock:
+                    self.running -= 1
+
+        with self._counts_lock:
+            self.queued += 1
+        try:
+            future = super().submit(call)
+        except BaseException:  # shut down: nothing was queued
+            with self._counts_lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        if future.cancelled():  # never started (shutdown with cancel_futures)
+            with self._counts_lock:
+                self.queued -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, profiled, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self, call)
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool whose workers never inherit this process's threads: they
+    are forked from a clean forkserver (spawned where there is none).
+    Forking the server itself (embedder thread pools, the warm-up thread,
+    open sqlite connections) can deadlock a child on a lock another thread
+    held. Submitted functions must be importable and their arguments
+    picklable.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=max(1, int(max_workers)), mp_context=multiprocessing.get_context(method))
+
+
+class AdmissionGate:
+    """
+    Admission control for one endpoint.
+    - At most `max_inflight` requests are handled at once
+    - Up to `max_queue` more may wait for a slot; beyond that the request is
+      rejected straight away with 429
+    - A request that waited `timeout_s` without getting a slot gets 503
+    Both carry Retry-After so well-behaved clients back off instead of
+    piling onto a saturated worker. max_inflight <= 0 disables the gate.
+    """
+
+    def __init__(self, name: str, max_inflight: int, max_queue: int, timeout_s: float, retry_after_s: float):
+        self.name = name
+        self.max_inflight = int(max_inflight)
+        self.max_queue = max(0, int(max_queue))
+        self.timeout_s = float(timeout_s)
+        self.retry_after_s = float(retry_after_s)
+        self._semaphore = asyncio.Semaphore(max(1, self.max_inflight))
+        self.inflight = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        if self.max_inflight <= 0:
+            yield
+            return
+
+        # Counters change before any await, so the check sees every earlier arrival
+        if self.inflight + self.waiting >= self.max_inflight + self.max_queue:
+            raise Overloaded(self.name, f"Too many pending {self.name} requests", 429, self.retry_after_s)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout_s)
+        except asyncio.TimeoutError:
+            raise Overloaded(self.name, f"Timed out waiting for a {self.name} slot", 503, self.retry_after_s)
+        finally:
+            self.waiting -= 1
+
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
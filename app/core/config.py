@@ -11,10 +11,145 @@ class Settings(BaseSettings):
     gemini_model: str = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 
     persist_dir: str = os.getenv("PERSIST_DIR", "./persistence")
+    # Vector storage: "chroma" or "mmap" (float16 matrix memory-mapped from
+    # persist_dir; documents with >= MMAP_ANN_MIN_ROWS chunks get an HNSW index)
+    vector_backend: str = os.getenv("VECTOR_BACKEND", "chroma")
+    mmap_ann_min_rows: int = int(os.getenv("MMAP_ANN_MIN_ROWS", 20000))
+    mmap_ann_m: int = int(os.getenv("MMAP_ANN_M", 16))
+    mmap_ann_ef: int = int(os.getenv("MMAP_ANN_EF", 64))
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    # torch | onnx | onnx-int8; ONNX exports are cached under persist_dir/onnx
+    # and rejected if their probe embeddings fall below the cosine tolerance
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    embedding_threads: int = int(os.getenv("EMBEDDING_THREADS", 0))
+    embedding_onnx_min_cosine: float = float(os.getenv("EMBEDDING_ONNX_MIN_COSINE", 0.98))
+    # Chunking: "tokens" sizes chunks with the embedding model's tokenizer
+    # (CHUNK_MAX_TOKENS=0 -> the model's max sequence length) and lets chunks
+    # span pages; "chars" is the per-page CHUNK_SIZE/CHUNK_OVERLAP splitter
+    chunking: str = os.getenv("CHUNKING", "tokens")
+    chunk_max_tokens: int = int(os.getenv("CHUNK_MAX_TOKENS", 0))
+    chunk_overlap_tokens: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
     chunk_size: int = int(os.getenv("CHUNK_SIZE", 900))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", 150))
     top_k: int = int(os.getenv("TOP_K", 5))
+    # Hybrid retrieval: vector candidates and BM25 candidates per query,
+    # fused with reciprocal rank fusion (RRF_K is the usual k=60 constant)
+    hybrid_search: bool = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+    vector_fetch_k: int = int(os.getenv("VECTOR_FETCH_K", 20))
+    bm25_top_n: int = int(os.getenv("BM25_TOP_N", 20))
+    rrf_k: int = int(os.getenv("RRF_K", 60))
+    # Adaptive candidate depth: fetch max(2*top_k, ADAPTIVE_FETCH_MIN) vector
+    # candidates and double (up to ADAPTIVE_FETCH_MAX) while the last one
+    # is within ADAPTIVE_GAP cosine similarity of the k-th (a flat distribution)
+    adaptive_depth: bool = os.getenv("ADAPTIVE_DEPTH", "true").lower() in ("1", "true", "yes")
+    adaptive_fetch_min: int = int(os.getenv("ADAPTIVE_FETCH_MIN", 10))
+    adaptive_fetch_max: int = int(os.getenv("ADAPTIVE_FETCH_MAX", 80))
+    adaptive_gap: float = float(os.getenv("ADAPTIVE_GAP", 0.05))
+    # Two-level search: a page vector layer (mean of each page's chunk
+    # embeddings) is built at ingest; searches scoped to documents with at
+    # least HIERARCHICAL_MIN_PAGES pages in total pick the HIERARCHICAL_TOP_PAGES
+    # closest pages first and only score those pages' chunks
+    hierarchical_search: bool = os.getenv("HIERARCHICAL_SEARCH", "true").lower() in ("1", "true", "yes")
+    hierarchical_min_pages: int = int(os.getenv("HIERARCHICAL_MIN_PAGES", 200))
+    hierarchical_top_pages: int = int(os.getenv("HIERARCHICAL_TOP_PAGES", 32))
+    # Optional local cross-encoder over the top candidates (empty = off),
+    # scoring only what fits in RERANK_BUDGET_MS per request
+    reranker_model: str = os.getenv("RERANKER_MODEL", "")
+    rerank_budget_ms: float = float(os.getenv("RERANK_BUDGET_MS", 150))
+    rerank_max_candidates: int = int(os.getenv("RERANK_MAX_CANDIDATES", 30))
+    # Multi-document search: doc ids per `$in` shard, shards searched in parallel
+    search_shard_size: int = int(os.getenv("SEARCH_SHARD_SIZE", 32))
+    search_parallelism: int = int(os.getenv("SEARCH_PARALLELISM", 8))
+    # /api/query/batch: max queries per request, concurrent LLM answers
+    batch_query_max: int = int(os.getenv("BATCH_QUERY_MAX", 1000))
+    batch_answer_concurrency: int = int(os.getenv("BATCH_ANSWER_CONCURRENCY", 4))
+    # Prompt context: MMR (relevance vs redundancy, MMR_LAMBDA) over the
+    # retrieved chunks, trimmed to their best sentences within a token budget
+    context_packing: bool = os.getenv("CONTEXT_PACKING", "true").lower() in ("1", "true", "yes")
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", 800))
+    mmr_lambda: float = float(os.getenv("MMR_LAMBDA", 0.7))
+    # Answer attribution: an answer sentence cites its most similar chunk
+    # when the cosine similarity reaches this threshold
+    attribution_min_similarity: float = float(os.getenv("ATTRIBUTION_MIN_SIMILARITY", 0.5))
     max_tokens_answer: int = int(os.getenv("MAX_TOKENS_ANSWER", 512))
 
+    # LLM call policy: per-call deadline, jittered exponential-backoff retries,
+    # in-flight cap, and the pooled HTTP client size for HTTP providers
+    llm_timeout_s: float = float(os.getenv("LLM_TIMEOUT_S", 30))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", 2))
+    llm_backoff_base_s: float = float(os.getenv("LLM_BACKOFF_BASE_S", 0.25))
+    llm_backoff_max_s: float = float(os.getenv("LLM_BACKOFF_MAX_S", 4))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    llm_http_max_connections: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 20))
+
+    # Startup: load the embedder + vector backend in the background and
+    # optionally run one encode so the first query doesn't pay for it.
+    preload_models: bool = os.getenv("PRELOAD_MODELS", "true").lower() in ("1", "true", "yes")
+    warmup_encode: bool = os.getenv("WARMUP_ENCODE", "true").lower() in ("1", "true", "yes")
+
+    # Query embedding micro-batching: concurrent queries arriving within the
+    # window (or until the batch is full) share one encode call.
+    embed_batching: bool = os.getenv("EMBED_BATCHING", "true").lower() in ("1", "true", "yes")
+    embed_batch_window_ms: float = float(os.getenv("EMBED_BATCH_WINDOW_MS", 5))
+    embed_batch_max_size: int = int(os.getenv("EMBED_BATCH_MAX_SIZE", 32))
+
+    # Persistent (model, sha256(chunk)) -> embedding cache used at ingest
+    embed_cache_enabled: bool = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    embed_cache_max_entries: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", 200000))
+
+    # Answer cache for /api/query: exact (normalized query) + semantic
+    # (query-embedding cosine >= threshold) layers per document scope
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    answer_cache_max_entries: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+    answer_cache_ttl_s: float = float(os.getenv("ANSWER_CACHE_TTL_S", 3600))
+    answer_cache_min_similarity: float = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", 0.95))
+
+    # Request handling: blocking work of query and upload requests runs on
+    # these bounded thread pools, never on the event loop
+    query_workers: int = int(os.getenv("QUERY_WORKERS", 8))
+    upload_workers: int = int(os.getenv("UPLOAD_WORKERS", 2))
+    # Admission control per endpoint: requests handled at once / allowed to
+    # wait (0 in-flight = no limit). Over the queue -> 429, waited longer than
+    # ADMISSION_TIMEOUT_S -> 503; both with Retry-After: RETRY_AFTER_S
+    query_max_inflight: int = int(os.getenv("QUERY_MAX_INFLIGHT", 16))
+    query_max_queue: int = int(os.getenv("QUERY_MAX_QUEUE", 64))
+    batch_max_inflight: int = int(os.getenv("BATCH_MAX_INFLIGHT", 2))
+    batch_max_queue: int = int(os.getenv("BATCH_MAX_QUEUE", 4))
+    upload_max_inflight: int = int(os.getenv("UPLOAD_MAX_INFLIGHT", 4))
+    upload_max_queue: int = int(os.getenv("UPLOAD_MAX_QUEUE", 16))
+    admission_timeout_s: float = float(os.getenv("ADMISSION_TIMEOUT_S", 10))
+    retry_after_s: int = int(os.getenv("RETRY_AFTER_S", 2))
+
+    # Background ingestion: concurrent pipelines and max queued/running jobs
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", 1))
+    ingest_max_pending: int = int(os.getenv("INGEST_MAX_PENDING", 100))
+    # Job store: progress-only writes at most every JOB_SAVE_INTERVAL_S;
+    # finished jobs kept for JOB_RETENTION_S, at most JOB_MAX_FINISHED of them
+    job_save_interval_s: float = float(os.getenv("JOB_SAVE_INTERVAL_S", 2.0))
+    job_retention_s: float = float(os.getenv("JOB_RETENTION_S", 7 * 86400))
+    job_max_finished: int = int(os.getenv("JOB_MAX_FINISHED", 1000))
+    # Streaming ingestion: chunks embedded + written per batch, and the size
+    # of each piece read from the upload stream
+    ingest_batch_size: int = int(os.getenv("INGEST_BATCH_SIZE", 256))
+    upload_chunk_bytes: int = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+    # Keep each page's extracted text (persist_dir/page_text.sqlite3) so the
+    # reindex CLI can rebuild the index without re-reading the PDFs
+    page_text_store: bool = os.getenv("PAGE_TEXT_STORE", "true").lower() in ("1", "true", "yes")
+    # Reindex CLI: processes extracting + chunking documents ahead of the
+    # embedding stage (0 = all cores)
+    reindex_workers: int = int(os.getenv("REINDEX_WORKERS", 0))
+    # Longest the index switch waits for in-flight uploads/deletes to finish
+    reindex_fence_timeout_s: float = float(os.getenv("REINDEX_FENCE_TIMEOUT_S", 300))
+
+    # PDF extraction: process count (0 = all cores) and the page count below
+    # which extraction stays single-process (pool startup isn't worth it)
+    pdf_workers: int = int(os.getenv("PDF_WORKERS", 0))
+    pdf_parallel_min_pages: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+
+    # Observability: /metrics + Server-Timing headers, and opt-in cProfile
+    # capture of requests sent with `X-Profile: 1` (written to profile_dir)
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    profile_requests: bool = os.getenv("PROFILE_REQUESTS", "false").lower() in ("1", "true", "yes")
+    profile_dir: str = os.getenv("PROFILE_DIR", "./profiles")
+
 settings = Settings()
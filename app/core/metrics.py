@@ -0,0 +1,294 @@
+import bisect
+import cProfile
+import contextvars
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.n += 1
+
+
+class Metrics:
+    """
+    In-process metrics in Prometheus text exposition format.
+    - Histograms and counters keyed by (name, labels), updated under one lock
+    - Gauges are callbacks read at scrape time (queue depths, pool sizes)
+    No client library needed; render() output is served at /metrics.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, Callable[[], float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(self.buckets)
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: object) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def gauge(self, name: str, fn: Callable[[], float], help_text: Optional[str] = None, **labels: object) -> None:
+        """Register a gauge whose value is `fn()` at scrape time (one callback per label set)."""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = fn
+        if help_text:
+            self._help[name] = help_text
+
+    def value(self, name: str, **labels: object) -> float:
+        """Current value of one counter series (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            histograms = {n: {k: (list(h.counts), h.total, h.n) for k, h in s.items()} for n, s in self._histograms.items()}
+            counters = {n: dict(s) for n, s in self._counters.items()}
+
+        for name in sorted(counters):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_fmt_labels(key)} {value:g}")
+
+        for name in sorted(histograms):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, total, n) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_fmt_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {n}")
+                lines.append(f"{name}_sum{_fmt_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_fmt_labels(key)} {n}")
+
+        with self._lock:
+            gauges = {n: dict(s) for n, s in self._gauges.items()}
+        for name in sorted(gauges):
+            values = []
+            for key, fn in sorted(gauges[name].items()):
+                try:
+                    values.append((key, float(fn())))
+                except Exception:
+                    continue
+            if not values:
+                continue
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in values:
+                lines.append(f"{name}{_fmt_labels(key)} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("rag_stage_seconds", "Time spent per pipeline stage")
+metrics.describe("rag_http_request_seconds", "HTTP request latency by route")
+metrics.describe("rag_http_requests_total", "HTTP requests by route and status")
+metrics.describe("rag_answer_cache_total", "Answer cache lookups by result")
+metrics.describe("rag_context_tokens_total", "Prompt context tokens, packed vs full top chunks")
+metrics.describe("rag_candidate_depth_total", "Queries by the vector candidate depth they stopped at")
+metrics.describe("rag_page_search_total", "Vector searches that went through the page layer")
+metrics.describe("rag_page_search_chunks_total", "Chunks scored by page-layer searches")
+metrics.describe("rag_cross_encoder_pairs_total", "Candidates scored by the cross-encoder")
+metrics.describe("rag_executor_queued", "Tasks waiting for a thread, by pool")
+metrics.describe("rag_executor_running", "Tasks running, by pool")
+metrics.describe("rag_admission_waiting", "Requests waiting for an admission slot, by endpoint")
+metrics.describe("rag_admission_inflight", "Requests being handled, by endpoint")
+metrics.describe("rag_admission_rejected_total", "Requests refused by admission control, by endpoint and status")
+
+
+# -------------------------------
+# Per-request timing spans
+# -------------------------------
+
+# (stage, seconds) pairs of the current request; None outside a request.
+# Context variables are copied into asyncio.to_thread workers, so spans
+# recorded there land in the same list.
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+def start_request() -> Tuple[List[Tuple[str, float]], contextvars.Token]:
+    spans: List[Tuple[str, float]] = []
+    return spans, _request_spans.set(spans)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _request_spans.reset(token)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Observe a finished stage: stage histogram + the current request's breakdown."""
+    metrics.observe("rag_stage_seconds", seconds, stage=stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as pipeline stage `stage` (recorded even if it raises)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0)
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value; repeated stages are summed, in first-seen order."""
+    merged: Dict[str, float] = {}
+    for stage, seconds in spans:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000.0:.2f}" for stage, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000.0:.2f}")
+    return ", ".join(parts)
+
+
+# -------------------------------
+# Opt-in request profiler
+# -------------------------------
+
+# One request is profiled at a time
+_profile_lock = threading.Lock()
+# Before 3.12 a cProfile profiler only sees the thread that enabled it; from
+# 3.12 on it is built on sys.monitoring and sees every thread of the process
+_PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+class _Capture:
+    """Profilers of one profiled request: its event-loop thread plus its worker calls."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.workers: List[cProfile.Profile] = []
+        self.open = True
+
+
+# The capture of the request being profiled; copied into its worker calls
+_profile_capture: contextvars.ContextVar[Optional[_Capture]] = contextvars.ContextVar(
+    "profile_capture", default=None
+)
+
+
+def profiled(fn: Callable, *args, **kwargs):
+    """
+    Run `fn` on a worker thread on behalf of the current request, adding
+    it to the request's profile when it is being captured. Used by
+    BoundedExecutor.run and the LLM thread adapter.
+    """
+    capture = _profile_capture.get()
+    if capture is None or not _PER_THREAD_PROFILES:
+        return fn(*args, **kwargs)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        with capture.lock:
+            if capture.open:
+                capture.workers.append(profiler)
+
+
+@contextmanager
+def profile_to(directory: str, name: str) -> Iterator[Optional[str]]:
+    """
+    cProfile the block into `directory/<epoch_ms>_<name>.prof` and yield that path.
+    Yields None (no capture) when another request is already being profiled.
+    The capture holds:
+    - the event-loop thread while the block runs, so coroutine steps of
+      other requests served meanwhile show up too
+    - every worker call this request makes through BoundedExecutor.run or
+      the LLM thread adapter (retrieval, reranking, uploads, blocking LLM
+      calls), merged in when it finishes before the block does. On
+      Python 3.12+ the profiler sees all threads, so other requests'
+      worker calls show up as well
+    Query embeddings encoded by the shared batcher are not attributed to
+    one request; they appear only on 3.12+.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() else "_" for c in name).strip("_") or "request"
+        path = os.path.join(directory, f"{int(time.time() * 1000)}_{safe}.prof")
+        capture = _Capture()
+        token = _profile_capture.set(capture)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            _profile_capture.reset(token)
+            with capture.lock:
+                capture.open = False
+            stats = pstats.Stats(profiler)
+            for worker in capture.workers:
+                stats.add(worker)
+            stats.dump_stats(path)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,400 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# How often a server re-reads the active-index pointer (reindex CLI switches)
+_INDEX_CHECK_INTERVAL_S = 1.0
+# Resources bound to one index; rebuilt when the active index changes
+_INDEX_RESOURCES = ("collection", "vector_backend", "lexical_index", "page_index")
+
+
+class ResourceRegistry:
+    """
+    Process-wide holder for the expensive, shareable resources.
+    - Embedder (SentenceTransformer weights), optional cross-encoder reranker
+    - Vector backend (Chroma persistent client + "documents" collection, or
+      the memory-mapped index), BM25 index, page vector layer
+    - Query embedding micro-batcher, persistent chunk embedding cache and
+      the answer cache
+    - LLM client, its async/resilient wrapper and pooled HTTP clients
+    - Bounded thread pools for request work and per-endpoint admission gates
+    - The extracted page text store
+    Index-bound resources follow the active-index pointer (app.db.indexes):
+    when the reindex CLI switches indexes they are rebuilt on next use.
+    Each resource is built once, on first use, behind its own lock so that
+    concurrent requests never load the same weights twice. Heavy libraries
+    are only imported inside the factories.
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._ready = threading.Event()
+        self._index_name: Optional[str] = None
+        self._index_mtime: Optional[float] = None
+        self._index_checked_at = 0.0
+        self._index_pinned = False
+
+    # ---------- Internals ----------
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    def _get_or_create(self, name: str, factory: Callable[[], Any]) -> Any:
+        value = self._resources.get(name)
+        if value is not None:
+            return value
+        with self._lock_for(name):
+            value = self._resources.get(name)
+            if value is None:
+                logger.info(f"Loading shared resource: {name}")
+                with span(f"load_{name}"):
+                    value = factory()
+                self._resources[name] = value
+        return value
+
+    # ---------- Factories ----------
+    @staticmethod
+    def _create_embedder():
+        backend = (settings.embedding_backend or "torch").lower()
+        if backend in ("onnx", "onnx-int8"):
+            from app.services.onnx_embedding import OnnxEmbedder
+            return OnnxEmbedder.load_or_export(
+                settings.embedding_model,
+                cache_dir=os.path.join(getattr(settings, "persist_dir", "./persistence"), "onnx"),
+                quantize=backend == "onnx-int8",
+                threads=settings.embedding_threads,
+                min_cosine=settings.embedding_onnx_min_cosine,
+            )
+        if backend != "torch":
+            raise RuntimeError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+        from app.services.embedding import LocalEmbedder
+        return LocalEmbedder(model_name=settings.embedding_model, threads=settings.embedding_threads)
+
+    @staticmethod
+    def _create_chroma_client():
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+
+        persist_path = getattr(settings, "persist_dir", "./persistence")
+        os.makedirs(persist_path, exist_ok=True)
+        return chromadb.PersistentClient(path=persist_path, settings=ChromaSettings(allow_reset=False))
+
+    def _create_collection(self):
+        from app.db.indexes import index_paths
+        return self.get_chroma_client().get_or_create_collection(name=index_paths(self.index_name())["collection"])
+
+    def _create_vector_backend(self):
+        from app.db.indexes import index_paths
+        backend = (settings.vector_backend or "chroma").lower()
+        if backend == "mmap":
+            from app.db.mmap_index import MmapVectorIndex
+            return MmapVectorIndex(
+                index_paths(self.index_name())["mmap_dir"],
+                ann_min_rows=settings.mmap_ann_min_rows,
+                ann_m=settings.mmap_ann_m,
+                ann_ef=settings.mmap_ann_ef,
+            )
+        if backend != "chroma":
+            raise RuntimeError(f"Unsupported VECTOR_BACKEND: {backend}")
+        from app.db.backends import ChromaBackend
+        return ChromaBackend(self.get_collection())
+
+    def _create_embedding_batcher(self):
+        from app.services.batching import EmbeddingBatcher
+        return EmbeddingBatcher(
+            get_embedder=self.get_embedder,
+            executor=self.get_query_executor(),
+            window_ms=settings.embed_batch_window_ms,
+            max_batch=settings.embed_batch_max_size,
+        )
+
+    @staticmethod
+    def _create_reranker():
+        from app.services.cross_encoder import CrossEncoderReranker
+        return CrossEncoderReranker(settings.reranker_model, threads=settings.embedding_threads)
+
+    @staticmethod
+    def _create_embedding_cache():
+        from app.services.embedding_cache import EmbeddingCache
+        path = os.path.join(getattr(settings, "persist_dir", "./persistence"), "embedding_cache.sqlite3")
+        return EmbeddingCache(path=path, max_entries=settings.embed_cache_max_entries)
+
+    @staticmethod
+    def _create_answer_cache():
+        from app.core.metrics import metrics
+        from app.services.answer_cache import AnswerCache
+        cache = AnswerCache(
+            max_entries=settings.answer_cache_max_entries,
+            ttl_s=settings.answer_cache_ttl_s,
+            min_similarity=settings.answer_cache_min_similarity,
+        )
+        metrics.gauge("rag_answer_cache_entries", lambda: len(cache), "Entries in the answer cache")
+        return cache
+
+    def _create_lexical_index(self):
+        from app.db.indexes import index_paths
+        from app.db.lexical import BM25Index
+        return BM25Index(path=index_paths(self.index_name())["bm25"])
+
+    def _create_page_index(self):
+        from app.db.indexes import index_paths
+        from app.db.page_index import PageVectorIndex
+        return PageVectorIndex(path=index_paths(self.index_name())["pages"])
+
+    @staticmethod
+    def _create_page_store():
+        from app.db.page_store import PageTextStore
+        return PageTextStore(os.path.join(getattr(settings, "persist_dir", "./persistence"), "page_text.sqlite3"))
+
+    @staticmethod
+    def _create_executor(name: str, max_workers: int):
+        from app.core.concurrency import BoundedExecutor
+        from app.core.metrics import metrics
+        pool = BoundedExecutor(name, max_workers)
+        metrics.gauge("rag_executor_queued", lambda: pool.queued, pool=name)
+        metrics.gauge("rag_executor_running", lambda: pool.running, pool=name)
+        return pool
+
+    @staticmethod
+    def _create_admission_gate(endpoint: str):
+        from app.core.concurrency import AdmissionGate
+        from app.core.metrics import metrics
+        gate = AdmissionGate(
+            endpoint,
+            max_inflight=getattr(settings, f"{endpoint}_max_inflight"),
+            max_queue=getattr(settings, f"{endpoint}_max_queue"),
+            timeout_s=settings.admission_timeout_s,
+            retry_after_s=settings.retry_after_s,
+        )
+        metrics.gauge("rag_admission_waiting", lambda: gate.waiting, endpoint=endpoint)
+        metrics.gauge("rag_admission_inflight", lambda: gate.inflight, endpoint=endpoint)
+        return gate
+
+    @staticmethod
+    def _create_http_client():
+        import httpx
+        return httpx.Client(
+            timeout=settings.llm_timeout_s,
+            limits=httpx.Limits(max_connections=settings.llm_http_max_connections),
+        )
+
+    @staticmethod
+    def _create_async_http_client():
+        import httpx
+        return httpx.AsyncClient(
+            timeout=settings.llm_timeout_s,
+            limits=httpx.Limits(max_connections=settings.llm_http_max_connections),
+        )
+
+    def _create_llm(self):
+        from app.services.llm_providers import get_llm
+        return get_llm(client=self.get_http_client(), async_client=self.get_async_http_client())
+
+    def _create_async_llm(self):
+        from app.services.llm_providers import get_async_llm
+        return get_async_llm(
+            self.get_llm(),
+            timeout_s=settings.llm_timeout_s,
+            max_retries=settings.llm_max_retries,
+            backoff_base_s=settings.llm_backoff_base_s,
+            backoff_max_s=settings.llm_backoff_max_s,
+            max_concurrency=settings.llm_max_concurrency,
+        )
+
+    # ---------- Active index ----------
+    def index_name(self, refresh: bool = False) -> str:
+        """
+        Name of the index this process reads and writes: the active-index
+        pointer (checked at most once per _INDEX_CHECK_INTERVAL_S, or now
+        with `refresh`), unless pinned with use_index().
+        """
+        now = time.monotonic()
+        fresh = (
+            not refresh
+            and self._index_name is not None
+            and now - self._index_checked_at < _INDEX_CHECK_INTERVAL_S
+        )
+        if self._index_pinned or fresh:
+            return self._index_name
+        from app.db.indexes import pointer_mtime, read_active_index
+
+        with self._lock_for("index_pointer"):
+            self._index_checked_at = now
+            mtime = pointer_mtime()
+            if self._index_name is None or mtime != self._index_mtime:
+                self._index_mtime = mtime
+                info = read_active_index()
+                if info["name"] != self._index_name:
+                    if self._index_name is not None:
+                        logger.info(f"Active index switched: {self._index_name} -> {info['name']}")
+                        self._drop_index_resources()
+                    built_with = info.get("embedding_model")
+                    if built_with and built_with != settings.embedding_model:
+                        logger.warning(
+                            f"Index {info['name']} was built with {built_with} but EMBEDDING_MODEL is "
+                            f"{settings.embedding_model}; query embeddings will not match it"
+                        )
+                    self._index_name = info["name"]
+        return self._index_name
+
+    def use_index(self, name: str) -> None:
+        """Pin this process to index `name` (the reindex CLI builds a new index while servers serve the active one)."""
+        with self._lock_for("index_pointer"):
+            self._index_name = name
+            self._index_pinned = True
+            self._drop_index_resources()
+
+    def _drop_index_resources(self) -> None:
+        with self._locks_guard:
+            for name in _INDEX_RESOURCES:
+                self._resources.pop(name, None)
+        cache = self._resources.get("answer_cache")
+        if cache is not None:
+            cache.invalidate()
+
+    # ---------- Public accessors ----------
+    def get_embedder(self):
+        return self._get_or_create("embedder", self._create_embedder)
+
+    def get_chroma_client(self):
+        return self._get_or_create("chroma_client", self._create_chroma_client)
+
+    def get_collection(self):
+        self.index_name()
+        return self._get_or_create("collection", self._create_collection)
+
+    def get_vector_backend(self):
+        self.index_name()
+        return self._get_or_create("vector_backend", self._create_vector_backend)
+
+    def get_embedding_batcher(self):
+        return self._get_or_create("embedding_batcher", self._create_embedding_batcher)
+
+    def get_reranker(self):
+        """Cross-encoder reranker, or None when RERANKER_MODEL is unset."""
+        if not settings.reranker_model:
+            return None
+        return self._get_or_create("reranker", self._create_reranker)
+
+    def get_embedding_cache(self):
+        """Chunk embedding cache, or None when disabled via EMBED_CACHE_ENABLED."""
+        if not settings.embed_cache_enabled:
+            return None
+        return self._get_or_create("embedding_cache", self._create_embedding_cache)
+
+    def get_answer_cache(self):
+        """Answer cache for /api/query, or None when disabled via ANSWER_CACHE_ENABLED."""
+        if not settings.answer_cache_enabled:
+            return None
+        return self._get_or_create("answer_cache", self._create_answer_cache)
+
+    def get_lexical_index(self):
+        self.index_name()
+        return self._get_or_create("lexical_index", self._create_lexical_index)
+
+    def get_page_index(self):
+        """Page vector layer of the active index, or None when disabled via HIERARCHICAL_SEARCH."""
+        if not settings.hierarchical_search:
+            return None
+        self.index_name()
+        return self._get_or_create("page_index", self._create_page_index)
+
+    def get_page_store(self):
+        """Extracted page text store, or None when disabled via PAGE_TEXT_STORE."""
+        if not settings.page_text_store:
+            return None
+        return self._get_or_create("page_store", self._create_page_store)
+
+    def get_search_executor(self):
+        """Thread pool for fanning a vector search out over document shards."""
+        return self._get_or_create(
+            "search_executor", lambda: self._create_executor("search", settings.search_parallelism)
+        )
+
+    def get_query_executor(self):
+        """Thread pool for the blocking parts of query requests (embed, search, prompt, attribution)."""
+        return self._get_or_create("query_executor", lambda: self._create_executor("query", settings.query_workers))
+
+    def get_upload_executor(self):
+        """Thread pool for the blocking parts of upload requests (disk writes, dedupe lookup)."""
+        return self._get_or_create(
+            "upload_executor", lambda: self._create_executor("upload", settings.upload_workers)
+        )
+
+    def get_admission_gate(self, endpoint: str):
+        """Admission gate for "query", "batch" or "upload" requests."""
+        return self._get_or_create(f"gate_{endpoint}", lambda: self._create_admission_gate(endpoint))
+
+    def get_http_client(self):
+        return self._get_or_create("http_client", self._create_http_client)
+
+    def get_async_http_client(self):
+        return self._get_or_create("async_http_client", self._create_async_http_client)
+
+    def get_llm(self):
+        return self._get_or_create("llm", self._create_llm)
+
+    def get_async_llm(self):
+        """LLM behind deadlines, jittered retries and a concurrency cap."""
+        return self._get_or_create("async_llm", self._create_async_llm)
+
+    def override(self, name: str, value: Any) -> None:
+        """Install a pre-built resource (fakes in benchmarks, alternate stores)."""
+        with self._lock_for(name):
+            self._resources[name] = value
+
+    def reset(self, name: Optional[str] = None) -> None:
+        """Drop one (or every) cached resource so it is rebuilt on next use."""
+        with self._locks_guard:
+            if name is None:
+                self._resources.clear()
+                self._ready.clear()
+            else:
+                self._resources.pop(name, None)
+
+    # ---------- Startup ----------
+    def warm_up(self, encode: bool = True) -> None:
+        """
+        Eagerly build the embedder, the vector backend and the reranker
+        (its warm-up also seeds the cost estimate behind RERANK_BUDGET_MS).
+        The LLM client is left lazy: a missing API key must not break startup.
+        """
+        try:
+            embedder = self.get_embedder()
+            self.get_vector_backend()
+            reranker = self.get_reranker()
+            if encode:
+                embedder.warm_up()
+                if reranker is not None:
+                    reranker.warm_up()
+            self._ready.set()
+            logger.info("Shared resources are warm")
+        except Exception:
+            logger.error("Resource warm-up failed", exc_info=True)
+
+    async def aclose(self) -> None:
+        """Close pooled HTTP connections (lifespan shutdown)."""
+        client = self._resources.pop("async_http_client", None)
+        if client is not None:
+            await client.aclose()
+        client = self._resources.pop("http_client", None)
+        if client is not None:
+            client.close()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+
+registry = ResourceRegistry()
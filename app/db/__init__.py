@@ -1,3 +1,4 @@
 from .vectorstore import VectorStore
+from .catalog import DocumentCatalog, catalog
 
-__all__ = ["VectorStore"]
+__all__ = ["VectorStore", "DocumentCatalog", "catalog"]
@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class VectorBackend:
+    """
+    Storage interface behind VectorStore.
+    Results use Chroma's shapes so callers don't care which backend runs:
+    - get():   {"ids", "documents", "metadatas"[, "embeddings"]}
+    - query(): {"ids", "documents", "metadatas", "distances"}, one inner list
+      per query embedding, distances being squared L2
+    Scopes are a list of doc ids, or None for the whole collection.
+    """
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Sequence[Sequence[float]],
+    ) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def delete_document(self, doc_id: str) -> None:
+        raise NotImplementedError
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def chunk_ids(self, doc_id: str, after_page: Optional[int] = None) -> List[str]:
+        """Ids of `doc_id`'s chunks (only those starting after `after_page` if given)."""
+        raise NotImplementedError
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        doc_ids: Optional[List[str]],
+        top_k: int,
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def optimize_document(self, doc_id: str) -> None:
+        """Hook run once a document is fully written (e.g. build an ANN index)."""
+        return None
+
+    def compact(self) -> Dict[str, Any]:
+        """Reclaim space left by deleted/replaced chunks; returns what was done."""
+        return {}
+
+
+class ChromaBackend(VectorBackend):
+    """The Chroma "documents" collection (embeddings stored explicitly)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def where_for(doc_ids: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        """Metadata filter for a set of documents (None = whole collection)."""
+        if doc_ids is None:
+            return None
+        if len(doc_ids) == 1:
+            return {"doc_id": doc_ids[0]}
+        return {"doc_id": {"$in": list(doc_ids)}}
+
+    def upsert(self, ids, documents, metadatas, embeddings) -> None:
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def delete(self, ids: List[str]) -> None:
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def delete_document(self, doc_id: str) -> None:
+        self.collection.delete(where={"doc_id": doc_id})
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        return self.collection.get(ids=ids, include=include)
+
+    def chunk_ids(self, doc_id: str, after_page: Optional[int] = None) -> List[str]:
+        where: Dict[str, Any] = {"doc_id": doc_id}
+        if after_page is not None:
+            where = {"$and": [{"doc_id": doc_id}, {"page": {"$gt": after_page}}]}
+        return list(self.collection.get(where=where, include=[]).get("ids") or [])
+
+    def query(self, query_embeddings, doc_ids, top_k) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"query_embeddings": query_embeddings, "n_results": top_k}
+        where = self.where_for(doc_ids)
+        if where:
+            kwargs["where"] = where
+        return self.collection.query(**kwargs)
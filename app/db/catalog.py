@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+_CATALOG_FILE = os.path.join(getattr(settings, "persist_dir", "./persistence"), "documents.json")
+
+
+class DocumentCatalog:
+    """
+    Small JSON-backed index of ingested documents.
+    - doc_id -> {doc_name, content_hash, chunks, created_at, ...}
+    - Lets an identical upload (same sha256) resolve to its existing doc_id
+    Writes go through a temp file + os.replace so a crash never leaves a
+    half-written catalog behind. The parsed file (plus a content_hash ->
+    doc_id map) is cached and only re-read when the file's stat changes,
+    so lookups don't parse the JSON; writes by other processes (the
+    reindex CLI) replace the file and are picked up.
+    """
+
+    def __init__(self, path: str = _CATALOG_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._by_hash: Dict[str, str] = {}
+
+    # ---------- File helpers ----------
+    def _file_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _cache(self, stamp: Optional[Tuple[int, int, int]], data: Dict[str, Dict[str, Any]]) -> None:
+        self._stamp = stamp
+        self._data = data
+        self._by_hash = {}
+        for doc_id, rec in data.items():
+            if rec.get("content_hash"):
+                self._by_hash.setdefault(rec["content_hash"], doc_id)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """The cached catalog, re-read if the file changed. Callers must not mutate it."""
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp:
+            return self._data
+        data: Dict[str, Dict[str, Any]] = {}
+        if stamp is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f) or {}
+            except Exception:
+                data = {}
+        self._cache(stamp, data)
+        return data
+
+    def _load_copy(self) -> Dict[str, Dict[str, Any]]:
+        return {doc_id: dict(rec) for doc_id, rec in self._load().items()}
+
+    def _save(self, data: Dict[str, Dict[str, Any]]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, self.path)
+        self._cache(self._file_stamp(), data)
+
+    # ---------- Queries ----------
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rec = self._load().get(doc_id)
+            return dict(rec) if rec is not None else None
+
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        with self._lock:
+            self._load()
+            return self._by_hash.get(content_hash)
+
+    def page_counts(self, doc_ids: List[str]) -> Dict[str, int]:
+        """Pages per document, from its recorded page hashes (documents without them are absent)."""
+        with self._lock:
+            data = self._load()
+            return {d: len(data[d]["page_hashes"]) for d in doc_ids if (data.get(d) or {}).get("page_hashes")}
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return self._load_copy()
+
+    def doc_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._load())
+
+    # ---------- Mutations ----------
+    def put(self, doc_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            data = self._load_copy()
+            rec = data.get(doc_id, {})
+            rec.update(record)
+            rec.setdefault("created_at", time.time())
+            rec["updated_at"] = time.time()
+            data[doc_id] = rec
+            self._save(data)
+
+    def put_many(self, records: Dict[str, Dict[str, Any]]) -> None:
+        """put() for many documents in one load/save (known doc_ids only)."""
+        with self._lock:
+            data = self._load_copy()
+            now = time.time()
+            for doc_id, record in records.items():
+                if doc_id in data:
+                    data[doc_id].update(record)
+                    data[doc_id]["updated_at"] = now
+            self._save(data)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            data = self._load_copy()
+            if data.pop(doc_id, None) is not None:
+                self._save(data)
+
+
+catalog = DocumentCatalog()
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+# The index every install starts with (Chroma collection "documents")
+DEFAULT_INDEX = "documents"
+
+logger = logging.getLogger(__name__)
+
+_POINTER_FILE = os.path.join(getattr(settings, "persist_dir", "./persistence"), "active_index.json")
+# Ingestion fence: writers hold a shared lock on _FENCE_LOCK, the reindex
+# switch an exclusive one; _FENCE_FLAG (the fencing pid) stops new writers
+# from starting while the switch waits for the running ones
+_FENCE_LOCK = os.path.join(getattr(settings, "persist_dir", "./persistence"), "ingest.lock")
+_FENCE_FLAG = os.path.join(getattr(settings, "persist_dir", "./persistence"), "ingest_fence")
+_FENCE_POLL_S = 0.2
+
+
+def read_active_index() -> Dict[str, Any]:
+    """
+    The pointer naming the index that serves queries:
+    {"name", "embedding_model", "chunking", "switched_at"}.
+    Missing file -> the default index.
+    """
+    try:
+        with open(_POINTER_FILE, "r", encoding="utf-8") as f:
+            info = json.load(f) or {}
+        if info.get("name"):
+            return info
+    except Exception:
+        pass
+    return {"name": DEFAULT_INDEX}
+
+
+def active_index_name() -> str:
+    return read_active_index()["name"]
+
+
+def pointer_mtime() -> Optional[float]:
+    try:
+        return os.stat(_POINTER_FILE).st_mtime
+    except OSError:
+        return None
+
+
+def switch_active_index(name: str, info: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Make `name` the active index. The pointer is replaced with os.replace,
+    so readers see either the old index or the new one, never a mix.
+    """
+    record = dict(info or {})
+    record.update({"name": name, "switched_at": time.time()})
+    os.makedirs(os.path.dirname(_POINTER_FILE) or ".", exist_ok=True)
+    tmp = f"{_POINTER_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _POINTER_FILE)
+
+
+def index_paths(name: str) -> Dict[str, str]:
+    """
+    Where index `name` keeps its data under persist_dir:
+    - "collection": Chroma collection name
+    - "mmap_dir": MmapVectorIndex directory
+    - "bm25": BM25 SQLite file
+    - "pages": page vector layer (PageVectorIndex) SQLite file
+    The default index keeps the original locations.
+    """
+    base = getattr(settings, "persist_dir", "./persistence")
+    if name == DEFAULT_INDEX:
+        return {
+            "collection": DEFAULT_INDEX,
+            "mmap_dir": os.path.join(base, "mmap_index"),
+            "bm25": os.path.join(base, "bm25.sqlite3"),
+            "pages": os.path.join(base, "page_vectors.sqlite3"),
+        }
+    return {
+        "collection": name,
+        "mmap_dir": os.path.join(base, "indexes", name, "mmap_index"),
+        "bm25": os.path.join(base, "indexes", name, "bm25.sqlite3"),
+        "pages": os.path.join(base, "indexes", name, "page_vectors.sqlite3"),
+    }
+
+
+def _load_fcntl():
+    """POSIX only; without it the fence is a no-op."""
+    try:
+        import fcntl
+    except Exception:
+        return None
+    return fcntl
+
+
+def _fence_holder() -> Optional[int]:
+    """pid that raised the fence, if it is still up and that process is alive."""
+    try:
+        with open(_FENCE_FLAG, "r", encoding="utf-8") as f:
+            pid = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None  # left behind by a crashed reindex
+    except OSError:
+        pass
+    return pid
+
+
+@contextmanager
+def ingest_slot(on_wait: Optional[Callable[[], None]] = None) -> Iterator[None]:
+    """
+    Held by anything writing documents into the active index (ingestion
+    jobs, deletes, bulk import). Waits while a reindex switch is fenced
+    off, calling `on_wait` once first, and re-reads the active-index
+    pointer once admitted so the write goes to the index now active.
+    """
+    from app.core.registry import registry  # the registry imports this module
+
+    fcntl = _load_fcntl()
+    if fcntl is None:
+        registry.index_name(refresh=True)
+        yield
+        return
+    os.makedirs(os.path.dirname(_FENCE_LOCK) or ".", exist_ok=True)
+    waited = False
+    while _fence_holder() is not None:
+        if not waited and on_wait is not None:
+            on_wait()
+        waited = True
+        time.sleep(_FENCE_POLL_S)
+    with open(_FENCE_LOCK, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            registry.index_name(refresh=True)
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def ingest_fence(timeout_s: float) -> Iterator[None]:
+    """
+    Exclusive counterpart of ingest_slot for the reindex switch: new writers
+    wait, and this returns once the running ones are done (TimeoutError
+    after `timeout_s`). Nothing reaches any index while it is held.
+    """
+    fcntl = _load_fcntl()
+    if fcntl is None:
+        logger.warning("No fcntl on this platform; the index switch cannot fence off ingestion")
+        yield
+        return
+    os.makedirs(os.path.dirname(_FENCE_FLAG) or ".", exist_ok=True)
+    with open(_FENCE_FLAG, "w", encoding="utf-8") as flag:
+        flag.write(str(os.getpid()))
+    try:
+        with open(_FENCE_LOCK, "a+") as f:
+            deadline = time.monotonic() + timeout_s
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Ingestion still running after {timeout_s:g}s")
+                    time.sleep(_FENCE_POLL_S)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        try:
+            os.remove(_FENCE_FLAG)
+        except FileNotFoundError:
+            pass
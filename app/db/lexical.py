@@ -0,0 +1,169 @@
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# Keep well under SQLite's bound-parameter limit
+_SQL_BATCH = 500
+
+
+def _batched(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BM25Index:
+    """
+    Persistent BM25 inverted index, partitioned by doc_id (statistics are
+    per document unless the whole corpus is searched).
+    - Lives in a SQLite file next to the Chroma data (settings.persist_dir)
+    - Updated incrementally: every batch written to the vector store is
+      also posted here, and re-posting a chunk_id replaces its postings
+    - Lets retrieval recover exact identifiers (part numbers, error codes,
+      section ids) that the embedding search ranks poorly
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " chunk_id TEXT PRIMARY KEY,"
+                " doc_id TEXT NOT NULL,"
+                " length INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " doc_id TEXT NOT NULL,"
+                " term TEXT NOT NULL,"
+                " chunk_id TEXT NOT NULL,"
+                " tf INTEGER NOT NULL,"
+                " PRIMARY KEY (doc_id, term, chunk_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    # ---------- Writes ----------
+    def add(self, doc_id: str, chunks: Sequence[Tuple[str, str]]) -> None:
+        """Index (chunk_id, text) pairs for `doc_id`, replacing existing postings of those chunks."""
+        if not chunks:
+            return
+        from app.services.rerank import tokenize  # app.services imports this module
+
+        chunk_rows = []
+        posting_rows = []
+        for chunk_id, text in chunks:
+            tf = Counter(tokenize(text))
+            chunk_rows.append((chunk_id, doc_id, sum(tf.values())))
+            posting_rows.extend((doc_id, term, chunk_id, n) for term, n in tf.items())
+
+        with self._lock, self._connect() as conn:
+            ids = [c[0] for c in chunk_rows]
+            for part in _batched(ids, _SQL_BATCH):
+                marks = ",".join("?" * len(part))
+                conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", list(part))
+            conn.executemany("INSERT OR REPLACE INTO chunks(chunk_id, doc_id, length) VALUES (?, ?, ?)", chunk_rows)
+            conn.executemany("INSERT INTO postings(doc_id, term, chunk_id, tf) VALUES (?, ?, ?, ?)", posting_rows)
+
+    def delete_chunks(self, chunk_ids: Sequence[str]) -> None:
+        with self._lock, self._connect() as conn:
+            for part in _batched(list(chunk_ids), _SQL_BATCH):
+                marks = ",".join("?" * len(part))
+                conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", list(part))
+                conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", list(part))
+
+    def delete_document(self, doc_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+
+    def compact(self) -> Dict[str, int]:
+        """VACUUM the index file after heavy deletes; returns its size before/after."""
+        before = os.path.getsize(self.path)
+        with self._lock, self._connect() as conn:
+            conn.execute("VACUUM")
+        return {"bytes_before": before, "bytes_after": os.path.getsize(self.path)}
+
+    # ---------- Search ----------
+    def search(
+        self,
+        doc_ids: Union[str, Sequence[str], None],
+        query: str,
+        top_n: int = 20,
+    ) -> List[Tuple[str, float]]:
+        """
+        Top `top_n` (chunk_id, bm25_score) for `query`, best first.
+        `doc_ids` is one doc_id, a list (each document scored with its own
+        statistics, then merged) or None for the whole corpus as one index.
+        """
+        from app.services.rerank import tokenize  # app.services imports this module
+
+        terms = sorted(set(tokenize(query)))
+        if not terms or top_n <= 0:
+            return []
+        if isinstance(doc_ids, str):
+            doc_ids = [doc_ids]
+        if doc_ids is not None and not doc_ids:
+            return []
+
+        term_marks = ",".join("?" * len(terms))
+        with self._connect() as conn:
+            if doc_ids is None:
+                n_chunks, avg_len = conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+                stats = {None: (n_chunks, avg_len)}
+                rows = conn.execute(
+                    "SELECT NULL, p.term, p.chunk_id, p.tf, c.length FROM postings p"
+                    " JOIN chunks c ON c.chunk_id = p.chunk_id"
+                    f" WHERE p.term IN ({term_marks})",
+                    terms,
+                ).fetchall()
+            else:
+                stats = {}
+                rows = []
+                for part in _batched(list(doc_ids), _SQL_BATCH - len(terms)):
+                    doc_marks = ",".join("?" * len(part))
+                    for d, n, avg in conn.execute(
+                        "SELECT doc_id, COUNT(*), AVG(length) FROM chunks"
+                        f" WHERE doc_id IN ({doc_marks}) GROUP BY doc_id",
+                        list(part),
+                    ):
+                        stats[d] = (n, avg)
+                    rows.extend(conn.execute(
+                        "SELECT p.doc_id, p.term, p.chunk_id, p.tf, c.length FROM postings p"
+                        " JOIN chunks c ON c.chunk_id = p.chunk_id"
+                        f" WHERE p.doc_id IN ({doc_marks}) AND p.term IN ({term_marks})",
+                        [*part, *terms],
+                    ).fetchall())
+
+        df: Dict[Tuple[Optional[str], str], int] = Counter((d, term) for d, term, _, _, _ in rows)
+        scores: Dict[str, float] = {}
+        for d, term, chunk_id, tf, length in rows:
+            n_chunks, avg_len = stats.get(d) or (0, None)
+            if not n_chunks:
+                continue
+            avg_len = float(avg_len or 1.0)
+            n_df = df[(d, term)]
+            idf = math.log(1.0 + (n_chunks - n_df + 0.5) / (n_df + 0.5))
+            norm = tf + self.k1 * (1.0 - self.b + self.b * length / avg_len)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1.0) / norm
+
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """RRF: sum over rankings of 1 / (k + rank), rank starting at 1."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return fused
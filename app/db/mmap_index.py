@@ -0,0 +1,466 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.db.backends import VectorBackend
+
+logger = logging.getLogger(__name__)
+
+# Keep well under SQLite's bound-parameter limit
+_SQL_BATCH = 500
+# Rows scored per brute-force block (bounds the float32 working copy)
+_BLOCK_ROWS = 65536
+
+
+def _batched(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _load_hnswlib():
+    """hnswlib is optional: without it every search is brute force."""
+    try:
+        import hnswlib
+    except Exception:
+        return None
+    return hnswlib
+
+
+class MmapVectorIndex(VectorBackend):
+    """
+    Local vector backend: a float16 embedding matrix memory-mapped from disk.
+    - vectors.f16: append-only rows of float16, mapped read-only with
+      np.memmap, so opening is instant and the OS page cache is shared by
+      every worker process serving the same persist_dir
+    - rows.sqlite3: row -> chunk_id, doc_id, page, text, metadata. Upserting
+      a chunk appends a new row and retires the old one (alive=0)
+    - compact() rewrites the live rows into a new matrix file (a new
+      "epoch"); readers notice the epoch change and retry
+    - Each document's live rows are cached as an index array, keyed by a
+      per-document version that every write bumps (so other processes'
+      writes are picked up)
+    - Small scopes are scored by NumPy brute force in blocks; documents with
+      at least `ann_min_rows` rows get an HNSW index (hnswlib, optional),
+      built when the document is finalized and saved next to the matrix
+    Distances are squared L2, like the Chroma collection.
+    """
+
+    def __init__(self, path: str, ann_min_rows: int = 20000, ann_m: int = 16, ann_ef: int = 64):
+        self.path = path
+        self.ann_min_rows = max(1, int(ann_min_rows))
+        self.ann_m = ann_m
+        self.ann_ef = ann_ef
+        self._db_path = os.path.join(path, "rows.sqlite3")
+        self._ann_dir = os.path.join(path, "ann")
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._matrix: Optional[np.memmap] = None
+        self._matrix_epoch = -1
+        self._dim: Optional[int] = None
+        self._rows_cache: Dict[Optional[str], Tuple[int, np.ndarray]] = {}
+        self._ann_cache: Dict[str, Tuple[int, Any]] = {}
+        os.makedirs(self._ann_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " row INTEGER PRIMARY KEY,"
+                " chunk_id TEXT NOT NULL,"
+                " doc_id TEXT NOT NULL,"
+                " page INTEGER NOT NULL DEFAULT 0,"
+                " text TEXT NOT NULL,"
+                " metadata TEXT NOT NULL,"
+                " alive INTEGER NOT NULL DEFAULT 1)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_doc ON rows(doc_id, alive)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_chunk ON rows(chunk_id, alive)")
+            conn.execute("CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    # ---------- Versions ----------
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, doc_ids: Iterable[str]) -> None:
+        for doc_id in set(doc_ids):
+            conn.execute(
+                "INSERT INTO docs(doc_id, version) VALUES (?, 1)"
+                " ON CONFLICT(doc_id) DO UPDATE SET version = version + 1",
+                (doc_id,),
+            )
+        conn.execute(
+            "INSERT INTO meta(key, value) VALUES ('generation', '1')"
+            " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def _versions(self, conn: sqlite3.Connection, doc_ids: Optional[List[str]]) -> Dict[Optional[str], int]:
+        if doc_ids is None:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            return {None: int(row[0]) if row else 0}
+        out: Dict[Optional[str], int] = {}
+        for part in _batched(list(doc_ids), _SQL_BATCH):
+            marks = ",".join("?" * len(part))
+            out.update(conn.execute(f"SELECT doc_id, version FROM docs WHERE doc_id IN ({marks})", list(part)).fetchall())
+        return out
+
+    # ---------- Matrix ----------
+    def _get_dim(self, conn: sqlite3.Connection) -> Optional[int]:
+        if self._dim is None:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            self._dim = int(row[0]) if row else None
+        return self._dim
+
+    @staticmethod
+    def _epoch(conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _vectors_path(self, epoch: int) -> str:
+        """Matrix file of an epoch; every compaction starts a new one."""
+        return os.path.join(self.path, "vectors.f16" if epoch == 0 else f"vectors.{epoch}.f16")
+
+    def _matrix_for(self, max_row: int, epoch: int) -> np.ndarray:
+        """Read-only mapping of `epoch`'s matrix covering rows 0..max_row (remapped after appends)."""
+        with self._cache_lock:
+            m = self._matrix
+            if m is None or self._matrix_epoch != epoch or m.shape[0] <= max_row:
+                path = self._vectors_path(epoch)
+                n = os.path.getsize(path) // (2 * self._dim)
+                m = self._matrix = np.memmap(path, dtype=np.float16, mode="r", shape=(n, self._dim))
+                self._matrix_epoch = epoch
+            return m
+
+    # ---------- Writes ----------
+    def upsert(self, ids, documents, metadatas, embeddings) -> None:
+        if not ids:
+            return
+        x = np.asarray(embeddings, dtype=np.float16)
+        with self._write_lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # serializes writers across processes
+            dim = self._get_dim(conn)
+            if dim is None:
+                dim = self._dim = int(x.shape[1])
+                conn.execute("INSERT INTO meta(key, value) VALUES ('dim', ?)", (str(dim),))
+            if x.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {x.shape[1]} does not match index dimension {dim}")
+
+            # Rows past the last committed one are leftovers of a crashed write
+            start = conn.execute("SELECT COALESCE(MAX(row), -1) + 1 FROM rows").fetchone()[0]
+            path = self._vectors_path(self._epoch(conn))
+            mode = "r+b" if os.path.exists(path) else "wb"
+            with open(path, mode) as f:
+                f.seek(start * dim * 2)
+                f.write(x.tobytes())
+
+            for part in _batched(list(ids), _SQL_BATCH):
+                marks = ",".join("?" * len(part))
+                conn.execute(f"UPDATE rows SET alive = 0 WHERE alive = 1 AND chunk_id IN ({marks})", list(part))
+            conn.executemany(
+                "INSERT INTO rows(row, chunk_id, doc_id, page, text, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (start + i, cid, meta.get("doc_id") or "", int(meta.get("page") or 0), text, json.dumps(meta))
+                    for i, (cid, text, meta) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            self._bump(conn, (m.get("doc_id") or "" for m in metadatas))
+
+    def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._write_lock, self._connect() as conn:
+            docs = set()
+            for part in _batched(list(ids), _SQL_BATCH):
+                marks = ",".join("?" * len(part))
+                docs.update(d for (d,) in conn.execute(
+                    f"SELECT DISTINCT doc_id FROM rows WHERE alive = 1 AND chunk_id IN ({marks})", list(part)
+                ))
+                conn.execute(f"UPDATE rows SET alive = 0 WHERE alive = 1 AND chunk_id IN ({marks})", list(part))
+            self._bump(conn, docs)
+
+    def delete_document(self, doc_id: str) -> None:
+        with self._write_lock, self._connect() as conn:
+            conn.execute("UPDATE rows SET alive = 0 WHERE doc_id = ? AND alive = 1", (doc_id,))
+            self._bump(conn, [doc_id])
+        self._drop_ann_files(doc_id)
+
+    # ---------- Reads ----------
+    def _consistent(self, read: Callable[[int], Any]) -> Any:
+        """Run `read(epoch)` until no compaction swapped the matrix underneath it."""
+        while True:
+            with self._connect() as conn:
+                epoch = self._epoch(conn)
+            try:
+                result = read(epoch)
+            except FileNotFoundError:
+                with self._connect() as conn:
+                    if self._epoch(conn) == epoch:
+                        raise
+                continue  # that epoch's matrix was compacted away mid-read
+            with self._connect() as conn:
+                if self._epoch(conn) == epoch:
+                    return result
+
+    def _fetch(self, conn: sqlite3.Connection, column: str, values: Sequence) -> List[Tuple]:
+        out: List[Tuple] = []
+        for part in _batched(list(values), _SQL_BATCH):
+            marks = ",".join("?" * len(part))
+            out.extend(conn.execute(
+                f"SELECT row, chunk_id, text, metadata FROM rows WHERE alive = 1 AND {column} IN ({marks})",
+                list(part),
+            ).fetchall())
+        return out
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> Dict[str, Any]:
+        return self._consistent(lambda epoch: self._get(ids, include_embeddings, epoch))
+
+    def _get(self, ids: List[str], include_embeddings: bool, epoch: int) -> Dict[str, Any]:
+        with self._connect() as conn:
+            found = {cid: (row, text, meta) for row, cid, text, meta in self._fetch(conn, "chunk_id", ids)}
+            self._get_dim(conn)
+        hits = [(cid, *found[cid]) for cid in dict.fromkeys(ids) if cid in found]
+        res: Dict[str, Any] = {
+            "ids": [h[0] for h in hits],
+            "documents": [h[2] for h in hits],
+            "metadatas": [json.loads(h[3]) for h in hits],
+        }
+        if include_embeddings:
+            rows = np.asarray([h[1] for h in hits], dtype=np.int64)
+            if len(rows):
+                res["embeddings"] = self._matrix_for(int(rows.max()), epoch)[rows].astype(np.float32)
+            else:
+                res["embeddings"] = np.zeros((0, self._dim or 0), dtype=np.float32)
+        return res
+
+    def chunk_ids(self, doc_id: str, after_page: Optional[int] = None) -> List[str]:
+        sql = "SELECT chunk_id FROM rows WHERE doc_id = ? AND alive = 1"
+        args: List[Any] = [doc_id]
+        if after_page is not None:
+            sql += " AND page > ?"
+            args.append(after_page)
+        with self._connect() as conn:
+            return [cid for (cid,) in conn.execute(sql, args)]
+
+    def _live_rows(self, conn: sqlite3.Connection, doc_ids: Optional[List[str]]) -> Dict[Optional[str], np.ndarray]:
+        """Live row indices per document (key None = whole index), from cache when current."""
+        versions = self._versions(conn, doc_ids)
+        out: Dict[Optional[str], np.ndarray] = {}
+        for key, version in versions.items():
+            cached = self._rows_cache.get(key)
+            if cached is not None and cached[0] == version:
+                out[key] = cached[1]
+                continue
+            if key is None:
+                cur = conn.execute("SELECT row FROM rows WHERE alive = 1 ORDER BY row")
+            else:
+                cur = conn.execute("SELECT row FROM rows WHERE doc_id = ? AND alive = 1 ORDER BY row", (key,))
+            rows = np.fromiter((r for (r,) in cur), dtype=np.int64)
+            with self._cache_lock:
+                self._rows_cache[key] = (version, rows)
+            out[key] = rows
+        return out
+
+    # ---------- Search ----------
+    @staticmethod
+    def _merge(best: Tuple[np.ndarray, np.ndarray], rows: np.ndarray, dist: np.ndarray, k: int):
+        rows = np.concatenate([best[0], rows])
+        dist = np.concatenate([best[1], dist])
+        if len(dist) > k:
+            keep = np.argpartition(dist, k - 1)[:k]
+            rows, dist = rows[keep], dist[keep]
+        return rows, dist
+
+    def _brute_force(self, q: np.ndarray, rows: np.ndarray, k: int, epoch: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k (rows, squared L2) per query over `rows`, scored in float32 blocks."""
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        best = [empty for _ in range(len(q))]
+        if not len(rows):
+            return best
+        m = self._matrix_for(int(rows.max()), epoch)
+        q_sq = (q * q).sum(axis=1)[:, None]
+        for i in range(0, len(rows), _BLOCK_ROWS):
+            block = rows[i:i + _BLOCK_ROWS]
+            x = m[block].astype(np.float32)
+            dist = q_sq + (x * x).sum(axis=1)[None, :] - 2.0 * (q @ x.T)
+            for j in range(len(q)):
+                best[j] = self._merge(best[j], block, dist[j], k)
+        return best
+
+    def _ann_path(self, doc_id: str, version: int) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in doc_id)
+        return os.path.join(self._ann_dir, f"{safe}.v{version}.hnsw")
+
+    def _drop_ann_files(self, doc_id: str, keep: Optional[str] = None) -> None:
+        prefix = os.path.basename(self._ann_path(doc_id, 0)).rsplit(".v", 1)[0] + ".v"
+        for name in os.listdir(self._ann_dir):
+            path = os.path.join(self._ann_dir, name)
+            if name.startswith(prefix) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        with self._cache_lock:
+            self._ann_cache.pop(doc_id, None)
+
+    def _ann_for(self, doc_id: str, version: int, rows: np.ndarray, epoch: int, build: bool = False):
+        """HNSW index of a large document at `version` (loaded, or built when `build`)."""
+        hnswlib = _load_hnswlib()
+        if hnswlib is None or len(rows) < self.ann_min_rows:
+            return None
+        cached = self._ann_cache.get(doc_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        path = self._ann_path(doc_id, version)
+        index = hnswlib.Index(space="l2", dim=self._dim)
+        if os.path.exists(path):
+            index.load_index(path, max_elements=len(rows))
+        elif build:
+            index.init_index(max_elements=len(rows), ef_construction=max(100, self.ann_ef), M=self.ann_m)
+            m = self._matrix_for(int(rows.max()), epoch)
+            for i in range(0, len(rows), _BLOCK_ROWS):
+                block = rows[i:i + _BLOCK_ROWS]
+                index.add_items(m[block].astype(np.float32), block)
+            index.save_index(path)
+            self._drop_ann_files(doc_id, keep=path)
+            logger.info(f"Built HNSW index for doc_id={doc_id} ({len(rows)} rows)")
+        else:
+            return None
+        index.set_ef(self.ann_ef)
+        with self._cache_lock:
+            self._ann_cache[doc_id] = (version, index)
+        return index
+
+    def optimize_document(self, doc_id: str) -> None:
+        self._consistent(lambda epoch: self._optimize(doc_id, epoch))
+
+    def _optimize(self, doc_id: str, epoch: int) -> None:
+        with self._connect() as conn:
+            if self._get_dim(conn) is None:
+                return
+            rows = self._live_rows(conn, [doc_id]).get(doc_id)
+            version = self._versions(conn, [doc_id]).get(doc_id)
+        if rows is not None and version is not None:
+            self._ann_for(doc_id, version, rows, epoch, build=True)
+
+    def query(self, query_embeddings, doc_ids, top_k) -> Dict[str, Any]:
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        n_q = len(q)
+        empty = {"ids": [[] for _ in range(n_q)], "documents": [[] for _ in range(n_q)],
+                 "metadatas": [[] for _ in range(n_q)], "distances": [[] for _ in range(n_q)]}
+        if n_q == 0 or top_k <= 0:
+            return empty
+        return self._consistent(lambda epoch: self._query(q, doc_ids, top_k, epoch, empty))
+
+    def _query(self, q: np.ndarray, doc_ids, top_k: int, epoch: int, empty: Dict[str, Any]) -> Dict[str, Any]:
+        n_q = len(q)
+        with self._connect() as conn:
+            if self._get_dim(conn) is None:
+                return empty
+            per_doc = self._live_rows(conn, doc_ids)
+            versions = self._versions(conn, doc_ids) if doc_ids is not None else {}
+
+        # Large documents go through their ANN index, the rest is brute-forced together
+        best = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(n_q)]
+        flat: List[np.ndarray] = []
+        for key, rows in per_doc.items():
+            index = self._ann_for(key, versions[key], rows, epoch) if key is not None else None
+            if index is None:
+                flat.append(rows)
+                continue
+            labels, dists = index.knn_query(q, k=min(top_k, len(rows)))
+            for j in range(n_q):
+                best[j] = self._merge(best[j], labels[j].astype(np.int64), dists[j].astype(np.float32), top_k)
+        if flat:
+            rows = np.concatenate(flat) if len(flat) > 1 else flat[0]
+            for j, (r, d) in enumerate(self._brute_force(q, rows, top_k, epoch)):
+                best[j] = self._merge(best[j], r, d, top_k)
+
+        wanted = sorted({int(x) for rows, _ in best for x in rows})
+        with self._connect() as conn:
+            found = {row: (cid, text, meta) for row, cid, text, meta in self._fetch(conn, "row", wanted)}
+
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for rows, dist in best:
+            order = np.argsort(dist, kind="stable")
+            hits = [(found[int(rows[i])], float(dist[i])) for i in order if int(rows[i]) in found]
+            out["ids"].append([h[0][0] for h in hits])
+            out["documents"].append([h[0][1] for h in hits])
+            out["metadatas"].append([json.loads(h[0][2]) for h in hits])
+            out["distances"].append([max(0.0, h[1]) for h in hits])
+        return out
+
+    # ---------- Maintenance ----------
+    def compact(self) -> Dict[str, Any]:
+        """
+        Reclaim the space of retired rows (deletes, re-upserted chunks).
+        - Live rows are copied, in order, into the next epoch's matrix file
+        - Retired rows are dropped and the rest renumbered 0..n-1 in the same
+          transaction that switches the epoch, so a crash leaves either the
+          old or the new state
+        - Every document version is bumped (row caches refresh) and HNSW
+          indexes, whose labels are row numbers, are rebuilt
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            dim = self._get_dim(conn)
+            old_epoch = self._epoch(conn)
+            old_path = self._vectors_path(old_epoch)
+            bytes_before = os.path.getsize(old_path) if os.path.exists(old_path) else 0
+            total = conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            live = np.fromiter(
+                (r for (r,) in conn.execute("SELECT row FROM rows WHERE alive = 1 ORDER BY row")), dtype=np.int64
+            )
+            stats = {"rows_before": total, "rows_after": len(live), "bytes_before": bytes_before}
+            if dim is None or (len(live) == total and bytes_before == total * dim * 2):
+                return {**stats, "bytes_after": bytes_before}
+
+            epoch = old_epoch + 1
+            new_path = self._vectors_path(epoch)
+            with open(new_path, "wb") as f:
+                if len(live):
+                    m = self._matrix_for(int(live.max()), old_epoch)
+                    for i in range(0, len(live), _BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(m[live[i:i + _BLOCK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            conn.execute("DELETE FROM rows WHERE alive = 0")
+            # Ascending order: a row's new number never collides with a row not yet moved
+            conn.executemany("UPDATE rows SET row = ? WHERE row = ?", ((i, int(r)) for i, r in enumerate(live)))
+            conn.execute("UPDATE docs SET version = version + 1")
+            self._bump(conn, [])
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES ('epoch', ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (str(epoch),),
+            )
+            big_docs = [d for (d,) in conn.execute(
+                "SELECT doc_id FROM rows WHERE alive = 1 GROUP BY doc_id HAVING COUNT(*) >= ?", (self.ann_min_rows,)
+            )]
+
+        with self._cache_lock:
+            self._matrix = None
+            self._ann_cache.clear()
+        for name in os.listdir(self.path):
+            if name.startswith("vectors.") and name.endswith(".f16") and os.path.join(self.path, name) != new_path:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass  # still mapped elsewhere (Windows); removed by a later compaction
+        for name in os.listdir(self._ann_dir):
+            try:
+                os.remove(os.path.join(self._ann_dir, name))
+            except OSError:
+                pass
+        for doc_id in big_docs:
+            self.optimize_document(doc_id)
+        with self._connect() as conn:
+            conn.execute("VACUUM")
+
+        logger.info(f"Compacted vector index: {total} -> {len(live)} rows (epoch {epoch})")
+        return {**stats, "bytes_after": os.path.getsize(new_path)}
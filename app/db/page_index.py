@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Keep well under SQLite's bound-parameter limit
+_SQL_BATCH = 500
+
+
+def _batched(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class PageVectorIndex:
+    """
+    Coarse layer of the two-level (page -> chunk) search.
+    - One vector per page: the normalized mean of the embeddings of every
+      chunk covering that page (a page-spanning chunk counts for each page
+      of its span), plus the ids of those chunks
+    - Built per document from the stored chunk embeddings once the
+      document is finalized, so ingestion, replacement and re-indexing all
+      produce it the same way
+    - Lives in a SQLite file next to the index it summarizes (one layer
+      per index: page vectors are only comparable within one embedding
+      model)
+    - Each document's page matrix is cached in memory, keyed by a version
+      that every rebuild bumps (so other processes' writes are picked up)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._cache: Dict[str, Tuple[int, np.ndarray, List[List[str]]]] = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " doc_id TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " pages INTEGER NOT NULL,"
+                " dim INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " doc_id TEXT NOT NULL,"
+                " page INTEGER NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " chunk_ids TEXT NOT NULL,"
+                " PRIMARY KEY (doc_id, page))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    # ---------- Writes ----------
+    def build(
+        self,
+        doc_id: str,
+        chunks: Iterable[Tuple[str, int, int, Sequence[float]]],
+    ) -> int:
+        """
+        Replace `doc_id`'s page layer from (chunk_id, page, page_end, embedding)
+        tuples. Returns the number of pages written.
+        """
+        sums: Dict[int, np.ndarray] = {}
+        members: Dict[int, List[str]] = {}
+        for chunk_id, page, page_end, embedding in chunks:
+            vec = np.asarray(embedding, dtype=np.float32)
+            for p in range(int(page), max(int(page), int(page_end)) + 1):
+                if p in sums:
+                    sums[p] += vec
+                else:
+                    sums[p] = vec.copy()
+                members.setdefault(p, []).append(chunk_id)
+
+        rows = []
+        for p in sorted(sums):
+            v = sums[p]
+            v = v / max(float(np.linalg.norm(v)), 1e-12)
+            rows.append((doc_id, p, v.astype(np.float32).tobytes(), json.dumps(members[p])))
+        dim = len(sums[next(iter(sums))]) if sums else 0
+
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            conn.executemany("INSERT INTO pages(doc_id, page, vector, chunk_ids) VALUES (?, ?, ?, ?)", rows)
+            version = (conn.execute("SELECT version FROM docs WHERE doc_id = ?", (doc_id,)).fetchone() or (0,))[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO docs(doc_id, version, pages, dim) VALUES (?, ?, ?, ?)",
+                (doc_id, version + 1, len(rows), dim),
+            )
+        return len(rows)
+
+    def delete_document(self, doc_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+        with self._cache_lock:
+            self._cache.pop(doc_id, None)
+
+    # ---------- Reads ----------
+    def covers(self, doc_ids: Sequence[str], min_pages: int) -> bool:
+        """
+        Whether every document in `doc_ids` has a layer and together they
+        have at least `min_pages` pages. Stops at the first batch with a
+        document missing.
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if not doc_ids:
+            return False
+        total = 0
+        with self._connect() as conn:
+            for part in _batched(doc_ids, _SQL_BATCH):
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(f"SELECT pages FROM docs WHERE doc_id IN ({marks})", list(part)).fetchall()
+                if len(rows) < len(part):
+                    return False
+                total += sum(r[0] for r in rows)
+        return total >= min_pages
+
+    def doc_ids(self) -> List[str]:
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute("SELECT doc_id FROM docs")]
+
+    def _load(self, doc_id: str) -> Optional[Tuple[np.ndarray, List[List[str]]]]:
+        """(page matrix, chunk ids per page) of `doc_id`, from the cache while its version holds."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT version, dim FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            version, dim = row
+            with self._cache_lock:
+                cached = self._cache.get(doc_id)
+            if cached is not None and cached[0] == version:
+                return cached[1], cached[2]
+            rows = conn.execute(
+                "SELECT vector, chunk_ids FROM pages WHERE doc_id = ? ORDER BY page", (doc_id,)
+            ).fetchall()
+        matrix = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.float32).reshape(len(rows), dim)
+        members = [json.loads(r[1]) for r in rows]
+        with self._cache_lock:
+            self._cache[doc_id] = (version, matrix, members)
+        return matrix, members
+
+    def top_pages(self, query_embedding: Sequence[float], doc_ids: Sequence[str], top_pages: int) -> List[str]:
+        """
+        Ids of the chunks on the `top_pages` pages (across `doc_ids`) most
+        similar to the query, best page first, without duplicates.
+        """
+        matrices: List[np.ndarray] = []
+        members: List[List[str]] = []
+        for doc_id in doc_ids:
+            loaded = self._load(doc_id)
+            if loaded is not None and len(loaded[1]):
+                matrices.append(loaded[0])
+                members.extend(loaded[1])
+        if not matrices:
+            return []
+        q = np.asarray(query_embedding, dtype=np.float32)
+        sims = (matrices[0] if len(matrices) == 1 else np.vstack(matrices)) @ q
+        n = min(top_pages, len(sims))
+        best = np.argpartition(-sims, n - 1)[:n]
+        best = best[np.argsort(-sims[best])]
+        return list(dict.fromkeys(cid for i in best for cid in members[i]))
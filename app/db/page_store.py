@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Iterable, Iterator, List, Tuple
+
+
+class PageTextStore:
+    """
+    Extracted text of every ingested page, keyed by (doc_id, page).
+    - Filled by ingestion from the same page stream that is chunked, so a
+      re-index (new embedding model or chunk sizes) never re-runs PDF
+      extraction
+    - Text is zlib-compressed in a SQLite file next to the index data
+    - Independent of the vector index: one store serves every index built
+      from it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " doc_id TEXT NOT NULL,"
+                " page INTEGER NOT NULL,"
+                " text BLOB NOT NULL,"
+                " PRIMARY KEY (doc_id, page))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    # ---------- Writes ----------
+    def put_pages(self, doc_id: str, pages: Iterable[Tuple[int, str]]) -> None:
+        """Store (page, text) pairs, replacing pages already stored for `doc_id`."""
+        rows = [(doc_id, int(page), zlib.compress(text.encode("utf-8"))) for page, text in pages]
+        if not rows:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO pages(doc_id, page, text) VALUES (?, ?, ?)", rows)
+
+    def truncate(self, doc_id: str, last_page: int) -> None:
+        """Drop pages after `last_page` (a replacement with fewer pages)."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE doc_id = ? AND page > ?", (doc_id, int(last_page)))
+
+    def delete_document(self, doc_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+
+    # ---------- Reads ----------
+    def page_count(self, doc_id: str) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM pages WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+
+    def iter_pages(self, doc_id: str) -> Iterator[Tuple[int, str]]:
+        """(page, text) pairs of `doc_id` in page order."""
+        with self._connect() as conn:
+            for page, blob in conn.execute(
+                "SELECT page, text FROM pages WHERE doc_id = ? ORDER BY page", (doc_id,)
+            ):
+                yield page, zlib.decompress(blob).decode("utf-8")
+
+    def doc_ids(self) -> List[str]:
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute("SELECT DISTINCT doc_id FROM pages")]
@@ -1,12 +1,15 @@
+import hashlib
+import heapq
 import os
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
 
-import chromadb
-from chromadb.config import Settings
+import numpy as np
 
-from app.services.embedding import LocalEmbedder
 from app.core.config import settings
+from app.core.metrics import metrics, span
+from app.core.registry import registry
+from app.db.catalog import catalog
 
 
 _ACTIVE_FILE = os.path.join(getattr(settings, "persist_dir", "./persistence"), "active_doc_id.txt")
@@ -31,18 +34,19 @@ def _write_active_doc_id(doc_id: str) -> None:
 
 class VectorStore:
     """
-    ChromaDB wrapper.
+    Document store over a pluggable vector backend (app.db.backends).
+    - VECTOR_BACKEND=chroma: Chroma persistent collection (default)
+    - VECTOR_BACKEND=mmap: memory-mapped float16 matrix (app.db.mmap_index)
     - Uses persistent storage at settings.persist_dir
     - Stores embeddings explicitly (no embedding function bound to collection)
     - Persists 'active_doc_id' to a file so it's stable across requests
+    - Backend and embedder come from the shared registry, so constructing a
+      VectorStore per request is cheap
     """
 
     def __init__(self):
-        persist_path = getattr(settings, "persist_dir", "./persistence")
-        os.makedirs(persist_path, exist_ok=True)
-        self.client = chromadb.PersistentClient(path=persist_path, settings=Settings(allow_reset=False))
-        self.collection = self.client.get_or_create_collection(name="documents")
-        self._embedder = LocalEmbedder(model_name=settings.embedding_model)
+        self.backend = registry.get_vector_backend()
+        self._embedder = registry.get_embedder()
 
     # ---------- Active doc helpers ----------
     def set_active_doc(self, doc_id: str):
@@ -52,51 +56,355 @@ class VectorStore:
         return _read_active_doc_id()
 
     # ---------- Core ops ----------
-    def add_document(self, doc_name: str, chunks: List[Dict[str, Any]]) -> str:
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        """doc_id of a previously ingested file with the same sha256, if any."""
+        return catalog.find_by_hash(content_hash)
+
+    @staticmethod
+    def chunk_id_for(doc_id: str, page: int, index: int) -> str:
+        """Deterministic chunk id, so re-adding a page (resume, replace) overwrites instead of duplicating."""
+        return f"{doc_id}:{page}:{index}"
+
+    @staticmethod
+    def chunk_fingerprint(text: str, span: int) -> str:
+        """
+        What a stored chunk must match to be kept when its document is
+        replaced: its text and how many pages it spans, not where it sits,
+        so chunks shifted by an inserted or removed page still match.
+        """
+        return hashlib.sha256(f"{span}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+    def stored_chunks(self, doc_id: str) -> Dict[str, Tuple[str, int, int]]:
+        """chunk_id -> (chunk_fingerprint, page, page_end) for every stored chunk of `doc_id`."""
+        ids = self.backend.chunk_ids(doc_id)
+        out: Dict[str, Tuple[str, int, int]] = {}
+        for i in range(0, len(ids), settings.ingest_batch_size):
+            res = self.backend.get(ids[i:i + settings.ingest_batch_size])
+            for cid, text, meta in zip(res.get("ids") or [], res.get("documents") or [], res.get("metadatas") or []):
+                meta = meta or {}
+                page = int(meta.get("page") or 0)
+                page_end = int(meta.get("page_end") or page)
+                out[cid] = (self.chunk_fingerprint(text or "", page_end - page), page, page_end)
+        return out
+
+    def _chunk_meta(self, doc_id: str, doc_name: str, cid: str, c: Dict[str, Any]) -> Dict[str, Any]:
+        # app.services imports this module; keep the reverse edge lazy
+        from app.services.rerank import term_string
+
+        page = int(c.get("page") or 0)
+        return {
+            "doc_id": doc_id,
+            "doc_name": doc_name,
+            "page": page,
+            "page_end": int(c.get("page_end") or page),
+            "chunk_id": cid,
+            # Precomputed term set for query-time keyword scoring
+            "terms": term_string(c["text"]),
+        }
+
+    def _chunk_id(self, doc_id: str, c: Dict[str, Any]) -> str:
+        return c.get("chunk_id") or self.chunk_id_for(doc_id, int(c.get("page") or 0), int(c.get("index") or 0))
+
+    def add_chunks(self, doc_id: str, doc_name: str, chunks: List[Dict[str, Any]]) -> int:
+        """
+        Embed and upsert one bounded batch of a document's chunks.
+        Each chunk dict must contain: { "text": str, "page": int, "index": int }
+        where `page` is where the chunk starts and `index` its position among
+        the chunks starting on that page; an optional `page_end` records the
+        last page a page-spanning chunk covers, and an optional `chunk_id`
+        overrides the positional id.
+        Chunk embeddings are served from the embedding cache when the same
+        text was embedded before (e.g. an earlier revision of the PDF).
+        Returns the number of chunks written.
+        """
+        if not chunks:
+            return 0
+        # app.services imports this module; keep the reverse edge lazy
+        from app.services.embedding_cache import embed_with_cache
+
+        texts = [c["text"] for c in chunks]
+        with span("ingest_embed"):
+            embeddings = embed_with_cache(self._embedder, texts, registry.get_embedding_cache())
+
+        ids = [self._chunk_id(doc_id, c) for c in chunks]
+        metas = [self._chunk_meta(doc_id, doc_name, cid, c) for cid, c in zip(ids, chunks)]
+
+        with span("ingest_upsert"):
+            self.backend.upsert(ids, texts, metas, embeddings)
+        with span("ingest_lexical"):
+            registry.get_lexical_index().add(doc_id, list(zip(ids, texts)))
+        return len(ids)
+
+    def move_chunks(self, doc_id: str, doc_name: str, chunks: List[Dict[str, Any]]) -> int:
+        """
+        Rewrite the page metadata of stored chunks (each dict carries the
+        stored `chunk_id` and its new `page`/`page_end`), keeping their
+        stored embeddings: nothing is embedded. Returns the number moved.
+        """
+        if not chunks:
+            return 0
+        ids = [c["chunk_id"] for c in chunks]
+        res = self.backend.get(ids, include_embeddings=True)
+        embeddings = res.get("embeddings")
+        if embeddings is None:
+            embeddings = []
+        stored = dict(zip(res.get("ids") or [], embeddings))
+        missing = [cid for cid in ids if cid not in stored]
+        if missing:
+            raise KeyError(f"Chunks to move are not stored: {missing[:3]}")
+        texts = [c["text"] for c in chunks]
+        metas = [self._chunk_meta(doc_id, doc_name, cid, c) for cid, c in zip(ids, chunks)]
+        with span("ingest_upsert"):
+            self.backend.upsert(ids, texts, metas, [stored[cid] for cid in ids])
+        return len(ids)
+
+    def delete_document_chunks(self, doc_id: str) -> None:
+        """Remove every chunk of `doc_id` (cleanup after a failed ingest)."""
+        self.backend.delete_document(doc_id)
+        registry.get_lexical_index().delete_document(doc_id)
+        page_index = registry.get_page_index()
+        if page_index is not None:
+            page_index.delete_document(doc_id)
+        self._invalidate_answers(doc_id)
+
+    def delete_chunks(self, ids: List[str]) -> int:
+        """Remove chunks by id from the vector backend and the BM25 index."""
+        if ids:
+            self.backend.delete(ids)
+            registry.get_lexical_index().delete_chunks(ids)
+        return len(ids)
+
+    def delete_chunks_after_page(self, doc_id: str, page: int) -> int:
+        """Remove chunks of `doc_id` that start after `page` (they are re-chunked on resume)."""
+        return self.delete_chunks(self.backend.chunk_ids(doc_id, after_page=page))
+
+    def delete_document(self, doc_id: str) -> bool:
+        """
+        Remove a document: its chunks, stored page text, catalog entry and cached answers;
+        it stops being the active doc. Returns False if it was unknown.
+        """
+        known = catalog.get(doc_id) is not None or self.count_chunks(doc_id) > 0
+        if not known:
+            return False
+        self.delete_document_chunks(doc_id)
+        page_store = registry.get_page_store()
+        if page_store is not None:
+            page_store.delete_document(doc_id)
+        catalog.remove(doc_id)
+        if self.get_active_doc() == doc_id:
+            _write_active_doc_id("")
+        return True
+
+    def compact(self) -> Dict[str, Any]:
+        """Reclaim index space after deletes/replacements (vector backend + BM25 file)."""
+        return {
+            "vector": self.backend.compact(),
+            "lexical": registry.get_lexical_index().compact(),
+        }
+
+    def count_chunks(self, doc_id: str) -> int:
+        return len(self.backend.chunk_ids(doc_id))
+
+    @staticmethod
+    def _invalidate_answers(doc_id: str) -> None:
+        cache = registry.get_answer_cache()
+        if cache is not None:
+            cache.invalidate(doc_id)
+
+    def _iter_chunk_embeddings(self, doc_id: str) -> Iterator[Tuple[str, int, int, Any]]:
+        """(chunk_id, page, page_end, embedding) of every stored chunk of `doc_id`, read in batches."""
+        ids = self.backend.chunk_ids(doc_id)
+        for i in range(0, len(ids), settings.ingest_batch_size):
+            res = self.backend.get(ids[i:i + settings.ingest_batch_size], include_embeddings=True)
+            embeddings = res.get("embeddings")
+            if embeddings is None:
+                embeddings = []
+            for cid, meta, emb in zip(res.get("ids") or [], res.get("metadatas") or [], embeddings):
+                meta = meta or {}
+                page = int(meta.get("page") or 0)
+                yield cid, page, int(meta.get("page_end") or page), emb
+
+    def build_page_layer(self, doc_id: str) -> int:
+        """(Re)build `doc_id`'s page vectors from its stored chunks; returns the page count (0 when disabled)."""
+        page_index = registry.get_page_index()
+        if page_index is None:
+            return 0
+        with span("ingest_page_layer"):
+            return page_index.build(doc_id, self._iter_chunk_embeddings(doc_id))
+
+    def optimize_document(self, doc_id: str) -> None:
+        """Per-document work once all chunks are written: the backend hook and the page layer."""
+        self.backend.optimize_document(doc_id)
+        self.build_page_layer(doc_id)
+
+    def finalize_document(
+        self,
+        doc_id: str,
+        doc_name: str,
+        chunks: int,
+        content_hash: Optional[str] = None,
+        page_hashes: Optional[List[str]] = None,
+        file_path: Optional[str] = None,
+    ) -> None:
+        """
+        Record a fully written document in the catalog and make it active.
+        `page_hashes` (per-page text hashes) let a later replacement report
+        which pages changed; `file_path` is the PDF it was ingested from,
+        which the reindex tool falls back to when no page text is stored.
+        """
+        self.optimize_document(doc_id)
+        record: Dict[str, Any] = {
+            "doc_name": doc_name,
+            "content_hash": content_hash,
+            "chunks": chunks,
+        }
+        if page_hashes is not None:
+            record["page_hashes"] = page_hashes
+        if file_path:
+            record["file_path"] = os.path.abspath(file_path)
+        catalog.put(doc_id, record)
+        # Answers cached against an earlier revision of this doc are stale
+        self._invalidate_answers(doc_id)
+
+        # Mark this as active doc
+        self.set_active_doc(doc_id)
+
+    def add_document(
+        self,
+        doc_name: str,
+        chunks: List[Dict[str, Any]],
+        content_hash: Optional[str] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> str:
         """
         Add a document's chunks (with pages) to the vector store.
         Each chunk dict must contain: { "text": str, "page": int }
+        `on_progress(chunks_done)` is called after each batch.
         Returns generated doc_id.
         """
         doc_id = str(uuid.uuid4())
 
-        texts = [c["text"] for c in chunks]
-        embeddings = self._embedder.embed_batch(texts)
-
-        ids: List[str] = []
-        metas: List[Dict[str, Any]] = []
-        docs: List[str] = []
-
-        for c, emb in zip(chunks, embeddings):
-            cid = str(uuid.uuid4())
-            ids.append(cid)
-            metas.append({
-                "doc_id": doc_id,
-                "doc_name": doc_name,
-                "page": int(c.get("page") or 0),
-                "chunk_id": cid
-            })
-            docs.append(c["text"])
-
-        # Add to collection
-        self.collection.add(
-            ids=ids,
-            documents=docs,
-            metadatas=metas,
-            embeddings=embeddings
-        )
+        per_page: Dict[int, int] = {}
+        indexed: List[Dict[str, Any]] = []
+        for c in chunks:
+            page = int(c.get("page") or 0)
+            indexed.append({"text": c["text"], "page": page, "index": per_page.get(page, 0)})
+            per_page[page] = per_page.get(page, 0) + 1
 
-        # Mark this as active doc
-        self.set_active_doc(doc_id)
+        done = 0
+        for i in range(0, len(indexed), settings.ingest_batch_size):
+            done += self.add_chunks(doc_id, doc_name, indexed[i:i + settings.ingest_batch_size])
+            if on_progress:
+                on_progress(done)
+
+        self.finalize_document(doc_id, doc_name, chunks=done, content_hash=content_hash)
         return doc_id
 
-    def query(self, query_embedding: List[float], where: Dict[str, Any] | None = None, top_k: int = 5):
+    def query(self, query_embedding: List[float], doc_ids: Optional[List[str]] = None, top_k: int = 5):
         """
-        Query by embedding with optional metadata filter.
+        Query by embedding within `doc_ids` (None = whole collection).
         Returns Chroma's dict result (documents, metadatas, distances).
         """
-        return self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where=where or {}
+        return self.query_many([query_embedding], doc_ids=doc_ids, top_k=top_k)
+
+    def query_many(self, query_embeddings: List[List[float]], doc_ids: Optional[List[str]] = None, top_k: int = 5):
+        """
+        Multi-vector query: one backend call for several embeddings that
+        share the same scope. Result lists are indexed per query embedding.
+        """
+        return self.backend.query(query_embeddings, doc_ids, top_k)
+
+    def search(self, query_embedding: List[float], doc_ids: Optional[List[str]], top_k: int = 5):
+        """
+        Scoped vector search, returning (docs, metas, distances) best first.
+        - doc_ids=None: one unfiltered search over the whole collection
+        - small doc lists: one `$in`-filtered search
+        - larger lists: split into shards of settings.search_shard_size doc
+          ids, searched in parallel, and the per-shard top-k lists merged
+          by distance into one global top-k
+        """
+        if doc_ids is not None and len(doc_ids) <= settings.search_shard_size:
+            shards: List[Optional[List[str]]] = [doc_ids]
+        elif doc_ids is None:
+            shards = [None]
+        else:
+            size = settings.search_shard_size
+            shards = [doc_ids[i:i + size] for i in range(0, len(doc_ids), size)]
+
+        def run(shard: Optional[List[str]]):
+            res = self.query(query_embedding, doc_ids=shard, top_k=top_k)
+            return list(zip(
+                (res.get("documents") or [[]])[0],
+                (res.get("metadatas") or [[]])[0],
+                (res.get("distances") or [[]])[0],
+            ))
+
+        if len(shards) == 1:
+            hits = run(shards[0])
+        else:
+            pool = registry.get_search_executor()
+            hits = [h for part in pool.map(run, shards) for h in part]
+            hits = heapq.nsmallest(top_k, hits, key=lambda h: h[2])
+
+        if not hits:
+            return [], [], []
+        docs, metas, distances = (list(x) for x in zip(*hits))
+        return docs, metas, distances
+
+    def uses_pages(self, doc_ids: Optional[List[str]]) -> bool:
+        """
+        Whether a search over `doc_ids` goes through the page layer: every
+        document has one and together they have at least
+        settings.hierarchical_min_pages pages. Corpus-wide searches stay flat.
+        """
+        page_index = registry.get_page_index()
+        if page_index is None or not doc_ids:
+            return False
+        scope = list(dict.fromkeys(doc_ids))
+        # The catalog knows most documents' page counts: a scope that is too small skips the layer lookup
+        known = catalog.page_counts(scope)
+        if len(known) == len(scope) and sum(known.values()) < settings.hierarchical_min_pages:
+            return False
+        return page_index.covers(scope, settings.hierarchical_min_pages)
+
+    def page_search(
+        self,
+        query_embedding: List[float],
+        doc_ids: List[str],
+        top_k: int = 5,
+        top_pages: Optional[int] = None,
+    ):
+        """
+        Two-level search, returning (docs, metas, distances) best first:
+        the `top_pages` (default settings.hierarchical_top_pages) pages whose
+        page vectors are closest to the query, then exact distances to the
+        chunks on those pages only. The chunk work grows with the pages
+        picked, not with the document size.
+        """
+        ids = registry.get_page_index().top_pages(
+            query_embedding, doc_ids, top_pages or settings.hierarchical_top_pages
         )
+        metrics.inc("rag_page_search_total")
+        metrics.inc("rag_page_search_chunks_total", len(ids))
+        if not ids:
+            return [], [], []
+        res = self.backend.get(ids, include_embeddings=True)
+        embeddings = res.get("embeddings")
+        if embeddings is None or not len(embeddings):
+            return [], [], []
+        diff = np.asarray(embeddings, dtype=np.float32) - np.asarray(query_embedding, dtype=np.float32)
+        distances = np.einsum("ij,ij->i", diff, diff)
+        order = np.argsort(distances, kind="stable")[:top_k]
+        docs, metas = res.get("documents") or [], res.get("metadatas") or []
+        return [docs[i] for i in order], [metas[i] for i in order], [float(distances[i]) for i in order]
+
+    def get_chunks(self, ids: List[str], include_embeddings: bool = False):
+        """
+        Fetch chunks by id. Returns Chroma's dict result
+        (ids, documents, metadatas[, embeddings]).
+        """
+        return self.backend.get(ids, include_embeddings=include_embeddings)
+
+    def lexical_search(self, doc_ids: Optional[List[str]], query: str, top_n: int) -> List[tuple]:
+        """BM25 (chunk_id, score) pairs for `query` within `doc_ids` (None = whole corpus)."""
+        return registry.get_lexical_index().search(doc_ids, query, top_n=top_n)
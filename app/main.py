@@ -1,11 +1,40 @@
-from fastapi import FastAPI
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core.concurrency import Overloaded
+from app.core.config import settings
 from app.core.logging import setup_logging
+from app.core.metrics import end_request, metrics, profile_to, server_timing, start_request
+from app.core.registry import registry
 from app.api.documents import router as documents_router
 from app.api.query import router as query_router
+from app.services.jobs import job_manager
 
 setup_logging()
-app = FastAPI(title="Project B — RAG PDF Backend", version="1.0.0")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fill the shared registry off the event loop so `/` and `/health`
+    # answer immediately; early requests simply wait on the registry locks.
+    if settings.preload_models:
+        threading.Thread(
+            target=registry.warm_up,
+            kwargs={"encode": settings.warmup_encode},
+            name="registry-warmup",
+            daemon=True,
+        ).start()
+    job_manager.start()
+    yield
+    job_manager.shutdown()
+    await registry.aclose()
+
+
+app = FastAPI(title="Project B — RAG PDF Backend", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,9 +44,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Per-request stage breakdown in a `Server-Timing` header, plus request
+    latency/count metrics by route. With PROFILE_REQUESTS enabled, requests
+    carrying `X-Profile: 1` are captured with cProfile into PROFILE_DIR.
+    For streaming responses the timings cover the work done before the
+    first byte (retrieval), not the streamed generation.
+    """
+    if not settings.metrics_enabled:
+        return await call_next(request)
+
+    spans, token = start_request()
+    t0 = time.perf_counter()
+    profile = settings.profile_requests and request.headers.get("x-profile") == "1"
+    try:
+        with profile_to(settings.profile_dir, request.url.path) if profile else nullcontext() as profile_path:
+            response = await call_next(request)
+    finally:
+        end_request(token)
+    elapsed = time.perf_counter() - t0
+
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    metrics.observe("rag_http_request_seconds", elapsed, method=request.method, route=path)
+    metrics.inc("rag_http_requests_total", method=request.method, route=path, status=response.status_code)
+    response.headers["Server-Timing"] = server_timing(spans, elapsed)
+    if profile_path:
+        response.headers["X-Profile-File"] = profile_path
+    return response
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Admission control refused the request: 429 (queue full) or 503 (waited too long)."""
+    metrics.inc("rag_admission_rejected_total", endpoint=exc.endpoint, status=exc.status_code)
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(int(exc.retry_after_s))},
+    )
+
 app.include_router(documents_router, prefix="/api", tags=["documents"])
 app.include_router(query_router, prefix="/api", tags=["query"])
 
 @app.get("/")
 def root():
-    return {"message": "RAG PDF API is running"}
\ No newline at end of file
+    return {"message": "RAG PDF API is running"}
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "models_ready": registry.is_ready()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Stage and request latency histograms in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
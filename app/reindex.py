@@ -0,0 +1,76 @@
+"""
+Offline index maintenance.
+
+    python -m app.reindex rebuild [--workers N] [--restart] [--allow-missing]
+        Rebuild every document into a new index with the current
+        EMBEDDING_MODEL / chunking settings from the stored page text, then
+        switch the active index to it. Re-running after a crash resumes.
+    python -m app.reindex import DIR [--recursive] [--workers N]
+        Bulk-ingest a directory of PDFs into the active index.
+    python -m app.reindex pages [--force]
+        Build the page vector layer (two-level search) for documents of the
+        active index that were ingested without one.
+    python -m app.reindex status
+    python -m app.reindex drop NAME
+        Delete an index that is no longer active.
+"""
+import argparse
+import json
+import sys
+
+from app.core.logging import setup_logging
+from app.services.reindex import (
+    ReindexError,
+    build_page_layers,
+    drop_index,
+    import_directory,
+    index_status,
+    rebuild_index,
+)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild", help="rebuild all documents into a new index and switch to it")
+    p.add_argument("--workers", type=int, help="extract/chunk processes (default REINDEX_WORKERS)")
+    p.add_argument("--restart", action="store_true", help="discard an unfinished rebuild instead of resuming it")
+    p.add_argument("--allow-missing", action="store_true", help="switch even if some documents could not be rebuilt")
+
+    p = sub.add_parser("import", help="ingest a directory of PDFs into the active index")
+    p.add_argument("path")
+    p.add_argument("--recursive", action="store_true")
+    p.add_argument("--workers", type=int, help="extract/chunk processes (default REINDEX_WORKERS)")
+
+    p = sub.add_parser("pages", help="build missing page vector layers in the active index")
+    p.add_argument("--force", action="store_true", help="rebuild the layer of every document")
+
+    sub.add_parser("status", help="show the active index and any unfinished rebuild")
+
+    p = sub.add_parser("drop", help="delete an index that is not active")
+    p.add_argument("name")
+
+    args = ap.parse_args()
+    setup_logging()
+    try:
+        if args.command == "rebuild":
+            result = rebuild_index(workers=args.workers, restart=args.restart, allow_missing=args.allow_missing)
+        elif args.command == "import":
+            result = import_directory(args.path, recursive=args.recursive, workers=args.workers)
+        elif args.command == "pages":
+            result = build_page_layers(force=args.force)
+        elif args.command == "status":
+            result = index_status()
+        else:
+            drop_index(args.name)
+            result = {"dropped": args.name}
+    except ReindexError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
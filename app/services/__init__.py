@@ -1,14 +1,20 @@
-from .chunking import  chunk_text
+from .chunking import  chunk_text, CharChunker, TokenChunker
 from .embedding import LocalEmbedder
-from .pdf import extract_text_from_pdf
+from .pdf import extract_text_from_pdf, extract_pages, iter_pages
 from .retrieval import retrieve, answer_with_context
 from .llm_providers import get_llm
+from .ingestion import ingest_pdf
 
 __all__ = [
     "chunk_text",
+    "CharChunker",
+    "TokenChunker",
     "LocalEmbedder",
     "extract_text_from_pdf",
+    "extract_pages",
+    "iter_pages",
     "retrieve",
     "answer_with_context",
     "get_llm",
+    "ingest_pdf",
 ]
@@ -0,0 +1,153 @@
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Scope of an entry: sorted doc ids, or ALL_SCOPE for whole-corpus queries
+Scope = Tuple[str, ...]
+ALL_SCOPE: Scope = ("*",)
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a query."""
+    q = " ".join((query or "").lower().split())
+    return re.sub(r"[\s?!.]+$", "", q)
+
+
+def scope_key(doc_ids: Optional[Sequence[str]]) -> Scope:
+    return ALL_SCOPE if doc_ids is None else tuple(sorted(set(doc_ids)))
+
+
+class _Entry:
+    __slots__ = ("payload", "embedding", "created")
+
+    def __init__(self, payload: Dict[str, Any], embedding: Optional[np.ndarray]):
+        self.payload = payload
+        self.embedding = embedding
+        self.created = time.monotonic()
+
+
+class AnswerCache:
+    """
+    Answer cache in front of retrieval + LLM answering, per document scope.
+    - Exact layer: (scope, normalized query) -> response payload (answer,
+      sources, citations), checked before the query is even embedded
+    - Semantic layer: cosine similarity between the query embedding and the
+      embeddings of earlier queries on the same scope; the best match at or
+      above `min_similarity` is served
+    - LRU bounded by `max_entries`, entries expire after `ttl_s`
+    - invalidate(doc_id) drops every entry whose scope includes the document
+      (and every whole-corpus entry); called when a document is (re)indexed
+      or deleted
+    The cache is in-process: with several server workers each has its own,
+    and the TTL bounds how stale a worker that missed an invalidation can be.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 3600.0, min_similarity: float = 0.95):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.min_similarity = float(min_similarity)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Scope, str], _Entry]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    # ---------- Internals ----------
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl_s > 0 and time.monotonic() - entry.created > self.ttl_s
+
+    def _hit(self, key: Tuple[Scope, str], entry: _Entry) -> Dict[str, Any]:
+        self._entries.move_to_end(key)
+        return copy.deepcopy(entry.payload)
+
+    # ---------- Lookups ----------
+    def get_exact(self, doc_ids: Optional[Sequence[str]], query: str) -> Optional[Dict[str, Any]]:
+        key = (scope_key(doc_ids), normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                del self._entries[key]
+                return None
+            self.exact_hits += 1
+            return self._hit(key, entry)
+
+    def get_similar(
+        self,
+        doc_ids: Optional[Sequence[str]],
+        query_embedding: Sequence[float],
+    ) -> Optional[Dict[str, Any]]:
+        """Best cached answer on the same scope whose query is similar enough; counts a miss otherwise."""
+        scope = scope_key(doc_ids)
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q_norm = float(np.linalg.norm(q)) or 1.0
+        with self._lock:
+            keys: List[Tuple[Scope, str]] = []
+            vectors: List[np.ndarray] = []
+            for key, entry in list(self._entries.items()):
+                if key[0] != scope or entry.embedding is None:
+                    continue
+                if self._expired(entry):
+                    del self._entries[key]
+                    continue
+                keys.append(key)
+                vectors.append(entry.embedding)
+
+            if vectors:
+                m = np.stack(vectors)
+                sims = (m @ q) / (np.linalg.norm(m, axis=1) * q_norm + 1e-12)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.min_similarity:
+                    self.semantic_hits += 1
+                    return self._hit(keys[best], self._entries[keys[best]])
+            self.misses += 1
+            return None
+
+    # ---------- Mutations ----------
+    def put(
+        self,
+        doc_ids: Optional[Sequence[str]],
+        query: str,
+        query_embedding: Optional[Sequence[float]],
+        payload: Dict[str, Any],
+    ) -> None:
+        key = (scope_key(doc_ids), normalize_query(query))
+        emb = None if query_embedding is None else np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            self._entries[key] = _Entry(copy.deepcopy(payload), emb)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, doc_id: Optional[str] = None) -> int:
+        """Drop entries that depend on `doc_id` (None = everything). Returns how many."""
+        with self._lock:
+            if doc_id is None:
+                n = len(self._entries)
+                self._entries.clear()
+                return n
+            stale = [k for k in self._entries if k[0] == ALL_SCOPE or doc_id in k[0]]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "min_similarity": self.min_similarity,
+            "ttl_s": self.ttl_s,
+        }
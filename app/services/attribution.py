@@ -0,0 +1,74 @@
+import re
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.chunking import split_sentences
+
+_WORD_RE = re.compile(r"\w")
+
+
+def answer_sentences(answer: str) -> List[str]:
+    """Sentences of an answer; list items and lines are split too."""
+    out: List[str] = []
+    for line in (answer or "").splitlines():
+        for sentence in split_sentences(line):
+            if len(_WORD_RE.findall(sentence)) >= 2:
+                out.append(sentence)
+    return out
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.clip(np.linalg.norm(m, axis=1, keepdims=True), 1e-12, None)
+
+
+def attribute_answer(
+    answer: str,
+    sources: List[dict],
+    embed_batch: Callable[[List[str]], List[List[float]]],
+    source_embeddings: Optional[np.ndarray] = None,
+    min_similarity: float = 0.5,
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Per-sentence attribution of an answer to the retrieved chunks.
+    - Answer sentences are embedded in one embed_batch call (chunk texts are
+      added to the same call only when their stored embeddings are missing)
+    - One sentence x chunk cosine matrix; each sentence cites its most
+      similar chunk when the similarity reaches `min_similarity`
+    Returns (supporting sources ordered by their best similarity, citations)
+    where each citation is {sentence, text, chunk_id, doc_id, page, score}.
+    """
+    sentences = answer_sentences(answer)
+    if not sentences or not sources:
+        return [], []
+
+    if source_embeddings is None:
+        vectors = embed_batch(sentences + [s["text"] for s in sources])
+        sent = np.asarray(vectors[:len(sentences)], dtype=np.float32)
+        chunks = np.asarray(vectors[len(sentences):], dtype=np.float32)
+    else:
+        sent = np.asarray(embed_batch(sentences), dtype=np.float32)
+        chunks = np.asarray(source_embeddings, dtype=np.float32)
+
+    sims = _normalize(sent) @ _normalize(chunks).T  # (sentences, chunks)
+    best = sims.argmax(axis=1)
+    best_sim = sims[np.arange(len(sentences)), best]
+
+    citations: List[dict] = []
+    support: dict = {}
+    for i, (j, score) in enumerate(zip(best.tolist(), best_sim.tolist())):
+        if score < min_similarity:
+            continue
+        src = sources[j]
+        citations.append({
+            "sentence": i,
+            "text": sentences[i],
+            "chunk_id": src.get("chunk_id"),
+            "doc_id": src.get("doc_id"),
+            "page": src.get("page"),
+            "score": float(score),
+        })
+        support[j] = max(support.get(j, 0.0), float(score))
+
+    supporting = [sources[j] for j in sorted(support, key=lambda j: support[j], reverse=True)]
+    return supporting, citations
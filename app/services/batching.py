@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batcher in front of LocalEmbedder.
+    - Concurrent callers `await embed(text)`; requests are queued
+    - A single worker task collects whatever arrives within `window_ms`
+      (or until `max_batch` items) and runs one `embed_batch` on `executor`
+    - Each caller gets its own row back through a Future
+    While one batch is encoding, new requests keep queueing, so batch size
+    grows with load and per-call forward-pass overhead is amortised.
+    """
+
+    def __init__(
+        self,
+        get_embedder: Callable[[], Any],
+        window_ms: float = 5.0,
+        max_batch: int = 32,
+        executor: Optional[Executor] = None,
+    ):
+        self._get_embedder = get_embedder
+        self._executor = executor
+        self.window_s = max(0.0, float(window_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Metrics (read via stats())
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._recent_sizes: Deque[int] = deque(maxlen=1024)
+        self._recent_waits_ms: Deque[float] = deque(maxlen=1024)
+        self._recent_encode_ms: Deque[float] = deque(maxlen=1024)
+
+    # ---------- Public API ----------
+    async def embed(self, text: str) -> List[float]:
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, fut, time.perf_counter()))
+        return await fut
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = list(self._recent_sizes)
+        waits = list(self._recent_waits_ms)
+        encodes = list(self._recent_encode_ms)
+        return {
+            "batches": self._batches,
+            "items": self._items,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "window_ms": self.window_s * 1000.0,
+            "max_batch": self.max_batch,
+            "batch_size_avg": (sum(sizes) / len(sizes)) if sizes else 0.0,
+            "batch_size_max": self._max_batch_seen,
+            "queue_wait_ms_p50": _percentile(waits, 50),
+            "queue_wait_ms_p95": _percentile(waits, 95),
+            "queue_wait_ms_p99": _percentile(waits, 99),
+            "encode_ms_p50": _percentile(encodes, 50),
+            "encode_ms_p95": _percentile(encodes, 95),
+        }
+
+    # ---------- Worker ----------
+    def _ensure_worker(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        # Anything already waiting rides along for free
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self._get_embedder().embed_batch(texts)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (client disconnect, timeout) don't need encoding
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self._recent_waits_ms.append((started - enqueued) * 1000.0)
+
+            texts = [text for text, _, _ in batch]
+            try:
+                # Resolved on the executor too: on a cold process this loads the model
+                vectors = await loop.run_in_executor(self._executor, self._encode, texts)
+            except Exception as e:
+                logger.error("Batched embedding failed", exc_info=True)
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self._recent_encode_ms.append((time.perf_counter() - started) * 1000.0)
+            self._batches += 1
+            self._items += len(batch)
+            self._recent_sizes.append(len(batch))
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+            for (_, fut, _), vec in zip(batch, vectors):
+                if not fut.done():
+                    fut.set_result(vec)
@@ -1,5 +1,6 @@
 import re
-from typing import List
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
 def clean_text(text: str) -> str:
     """Normalize whitespace and trivial artifacts."""
@@ -48,3 +49,139 @@ def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
         start = max(0, end - overlap)
 
     return chunks
+
+
+# -------------------------------
+# Streaming chunkers (page stream -> chunks with page provenance)
+# -------------------------------
+
+_SENTENCE_END = re.compile(r"(?<=[.?!])\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Cleaned text split after ., ? or ! (single regex pass)."""
+    return [s for s in _SENTENCE_END.split(clean_text(text)) if s]
+
+
+class CharChunker:
+    """
+    chunk_text applied page by page, behind the streaming chunker interface.
+    Chunks never span pages, so nothing is ever pending between pages.
+    """
+
+    def __init__(self, chunk_size: int, overlap: int):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    @property
+    def pending_from_page(self) -> Optional[int]:
+        return None
+
+    def feed(self, page: int, text: str) -> List[Dict[str, Any]]:
+        return [
+            {"text": ch, "page": page, "page_end": page, "index": idx}
+            for idx, ch in enumerate(chunk_text(text, self.chunk_size, self.overlap))
+        ]
+
+    def flush(self) -> List[Dict[str, Any]]:
+        return []
+
+
+class TokenChunker:
+    """
+    Token-budgeted chunker over a stream of pages.
+    - Sizes chunks in the embedding model's own tokens, so a chunk fits the
+      model's max sequence length instead of being silently truncated
+    - Packs whole sentences; a sentence longer than the budget is split on
+      word boundaries. Overlap is whole trailing sentences, up to
+      `overlap_tokens`
+    - Chunks may span pages: each carries `page` (where it starts, used in
+      its chunk id together with `index`) and `page_end`
+    Every page is split and tokenized once (one batched count_tokens call)
+    and every sentence is re-emitted only within the bounded overlap, so the
+    work is linear in document length. Token counts of sentences are summed,
+    which matches tokenizing the joined text for word-piece tokenizers
+    (they pre-split on whitespace).
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[List[str]], List[int]],
+        max_tokens: int,
+        overlap_tokens: int = 0,
+    ):
+        self.count_tokens = count_tokens
+        self.max_tokens = max(1, int(max_tokens))
+        # Keep overlap well below the budget so every chunk makes progress
+        self.overlap_tokens = max(0, min(int(overlap_tokens), self.max_tokens // 2))
+        self._window: Deque[Tuple[str, int, int]] = deque()  # (text, tokens, page)
+        self._size = 0
+        self._per_page: Dict[int, int] = {}
+
+    @property
+    def pending_from_page(self) -> Optional[int]:
+        """Page where the not-yet-emitted text starts (None if nothing is pending)."""
+        return self._window[0][2] if self._window else None
+
+    def _units(self, text: str) -> List[Tuple[str, int]]:
+        sentences = split_sentences(text)
+        if not sentences:
+            return []
+        units: List[Tuple[str, int]] = []
+        for sentence, n in zip(sentences, self.count_tokens(sentences)):
+            if n <= self.max_tokens:
+                units.append((sentence, n))
+                continue
+            # Oversized sentence: greedy word groups within the budget
+            words = sentence.split()
+            group: List[str] = []
+            size = 0
+            for word, w in zip(words, self.count_tokens(words)):
+                if group and size + w > self.max_tokens:
+                    units.append((" ".join(group), size))
+                    group, size = [], 0
+                group.append(word)
+                size += w
+            if group:
+                units.append((" ".join(group), size))
+        return units
+
+    def _emit(self) -> Dict[str, Any]:
+        first = self._window[0][2]
+        idx = self._per_page.get(first, 0)
+        self._per_page[first] = idx + 1
+        return {
+            "text": " ".join(t for t, _, _ in self._window),
+            "page": first,
+            "page_end": self._window[-1][2],
+            "index": idx,
+        }
+
+    def feed(self, page: int, text: str) -> List[Dict[str, Any]]:
+        """Add one page; returns the chunks completed by it."""
+        out: List[Dict[str, Any]] = []
+        for unit, n in self._units(text):
+            if self._window and self._size + n > self.max_tokens:
+                out.append(self._emit())
+                # Carry trailing sentences as overlap, leaving room for `unit`
+                carried: Deque[Tuple[str, int, int]] = deque()
+                kept = 0
+                while self._window:
+                    t, k, p = self._window[-1]
+                    if kept + k > self.overlap_tokens or kept + k + n > self.max_tokens:
+                        break
+                    carried.appendleft(self._window.pop())
+                    kept += k
+                self._window, self._size = carried, kept
+            self._window.append((unit, n, page))
+            self._size += n
+        return out
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Emit whatever is pending (end of document)."""
+        if not self._window:
+            return []
+        chunk = self._emit()
+        self._window.clear()
+        self._size = 0
+        return [chunk]
@@ -0,0 +1,123 @@
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.chunking import split_sentences
+from app.services.rerank import tokenize
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# texts -> token count per text
+CountTokens = Callable[[List[str]], List[int]]
+
+
+def approx_count_tokens(texts: List[str]) -> List[int]:
+    """Words + punctuation marks; used when no tokenizer is available."""
+    return [len(_TOKEN_RE.findall(t or "")) for t in texts]
+
+
+def mmr_order(
+    relevance: Sequence[float],
+    embeddings: Optional[np.ndarray],
+    lambda_: float = 0.7,
+    limit: Optional[int] = None,
+) -> List[int]:
+    """
+    Maximal marginal relevance: repeatedly pick the candidate maximising
+    lambda * relevance - (1 - lambda) * max cosine similarity to the picks.
+    Without embeddings this is plain relevance order.
+    """
+    n = len(relevance)
+    limit = n if limit is None else min(limit, n)
+    rel = np.asarray(relevance, dtype=np.float32)
+    if embeddings is None or n == 0:
+        return [int(i) for i in np.argsort(-rel, kind="stable")[:limit]]
+
+    emb = np.asarray(embeddings, dtype=np.float32)
+    emb = emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+    sims = emb @ emb.T
+    picked: List[int] = []
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(limit):
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        mmr = lambda_ * rel - (1.0 - lambda_) * redundancy
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        picked.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, sims[best])
+    return picked
+
+
+def trim_to_sentences(query: str, text: str, max_tokens: int, count_tokens: CountTokens) -> str:
+    """
+    Keep the sentences of `text` that share the most terms with `query`,
+    within `max_tokens`, in their original order.
+    """
+    sentences = split_sentences(text)
+    if not sentences or max_tokens <= 0:
+        return ""
+    q_terms = set(tokenize(query))
+    counts = count_tokens(sentences)
+    overlap = [len(q_terms & set(tokenize(s))) for s in sentences]
+    ranked = sorted(range(len(sentences)), key=lambda i: (-overlap[i], i))
+
+    keep: List[int] = []
+    used = 0
+    for i in ranked:
+        if used + counts[i] <= max_tokens:
+            keep.append(i)
+            used += counts[i]
+    if not keep:
+        # Best sentence alone is over budget: keep its leading words
+        words = sentences[ranked[0]].split()
+        return " ".join(words[:max(1, max_tokens * len(words) // max(1, counts[ranked[0]]))])
+    return " ".join(sentences[i] for i in sorted(keep))
+
+
+def pack_context(
+    query: str,
+    sources: List[dict],
+    embeddings: Optional[np.ndarray],
+    max_tokens: int,
+    max_chunks: int,
+    count_tokens: CountTokens = approx_count_tokens,
+    lambda_: float = 0.7,
+) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Choose and trim sources for the prompt under a token budget.
+    - Order by MMR over the sources' scores and chunk embeddings, so
+      near-duplicate (overlapping) chunks are pushed back
+    - The top pick may use the whole budget; later picks get the larger of
+      an even share and half of what is left. A chunk over its allowance is
+      cut down to its best-matching sentences
+    Returns (packed sources with possibly trimmed text, token stats where
+    `naive_tokens` is what pasting the same number of full top chunks costs).
+    """
+    if not sources:
+        return [], {"naive_tokens": 0, "packed_tokens": 0}
+
+    order = mmr_order([s.get("score", 0.0) for s in sources], embeddings, lambda_, limit=max_chunks)
+    full_counts = count_tokens([s["text"] for s in sources])
+    naive = sum(full_counts[:max_chunks])
+    share = max(1, max_tokens // max(1, len(order)))
+
+    packed: List[dict] = []
+    remaining = max_tokens
+    for i in order:
+        src = sources[i]
+        text, n = src["text"], full_counts[i]
+        allowance = max(share, remaining // 2) if packed else remaining
+        if n > min(allowance, remaining):
+            text = trim_to_sentences(query, text, min(allowance, remaining), count_tokens)
+            n = count_tokens([text])[0] if text else 0
+        if not text or n > remaining:
+            continue
+        packed.append({**src, "text": text})
+        remaining -= n
+        if remaining <= 0:
+            break
+
+    return packed, {"naive_tokens": naive, "packed_tokens": max_tokens - remaining}
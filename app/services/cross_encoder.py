@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Pairs scored by the first call, before any cost estimate exists
+_PROBE_PAIRS = 4
+# Weight of the newest observation in the per-pair cost average
+_EWMA_ALPHA = 0.2
+
+
+def _load_cross_encoder():
+    """Import sentence-transformers' CrossEncoder only when a reranker is built."""
+    try:
+        from sentence_transformers import CrossEncoder
+    except Exception:
+        return None
+    return CrossEncoder
+
+
+class CrossEncoderReranker:
+    """
+    Small local cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2)
+    re-scoring the top retrieval candidates under a time budget.
+    - The cost of one (query, chunk) pair is tracked as a moving average of
+      observed calls, so a request scores only as many candidates as fit
+      in its budget (one predict call)
+    - Until a cost is known (no warm_up), a few candidates are scored first
+      to measure it, then as many more as the remaining budget allows
+    `model` may be any object with CrossEncoder's predict(pairs) method.
+    """
+
+    def __init__(self, model_name: str = "", model: Any = None, threads: int = 0):
+        if model is None:
+            CrossEncoder = _load_cross_encoder()
+            if CrossEncoder is None:
+                raise RuntimeError(
+                    "sentence-transformers is not installed. Please install it: "
+                    "pip install sentence-transformers"
+                )
+            if threads > 0:
+                import torch
+                torch.set_num_threads(threads)
+            model = CrossEncoder(model_name)
+        self.model_name = model_name or getattr(model, "model_name", "custom")
+        self.model = model
+        self._lock = threading.Lock()
+        self._pair_cost_s: Optional[float] = None
+
+    @property
+    def pair_cost_s(self) -> Optional[float]:
+        """Estimated seconds per scored pair (None until the first call)."""
+        return self._pair_cost_s
+
+    def _predict(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        t0 = time.perf_counter()
+        scores = np.asarray(self.model.predict([(query, t) for t in texts], show_progress_bar=False), dtype=np.float64)
+        cost = (time.perf_counter() - t0) / max(1, len(texts))
+        with self._lock:
+            prev = self._pair_cost_s
+            self._pair_cost_s = cost if prev is None else (1 - _EWMA_ALPHA) * prev + _EWMA_ALPHA * cost
+        return scores
+
+    def warm_up(self) -> None:
+        """One tiny predict: loads lazy state and seeds the cost estimate."""
+        self._predict("warm up", ["warm up"] * _PROBE_PAIRS)
+
+    def affordable(self, budget_s: float, max_candidates: int) -> int:
+        """How many pairs fit in `budget_s` at the current cost estimate."""
+        if self._pair_cost_s is None:
+            return min(max_candidates, _PROBE_PAIRS)
+        return max(0, min(max_candidates, int(budget_s / max(self._pair_cost_s, 1e-9))))
+
+    def rerank(
+        self,
+        query: str,
+        sources: List[dict],
+        budget_s: float,
+        max_candidates: int = 30,
+    ) -> Tuple[List[dict], int]:
+        """
+        Score the first sources that fit in `budget_s` (at most
+        `max_candidates`) and move them, best first, ahead of the rest.
+        Returns (re-ordered sources, number scored).
+        """
+        t0 = time.perf_counter()
+        limit = min(len(sources), max_candidates)
+        texts = [s["text"] for s in sources[:limit]]
+        scores: List[float] = []
+
+        n = min(limit, self.affordable(budget_s, limit))
+        while n > 0:
+            scores.extend(self._predict(query, texts[len(scores):len(scores) + n]).tolist())
+            remaining = budget_s - (time.perf_counter() - t0)
+            n = min(limit - len(scores), self.affordable(remaining, limit))
+
+        if not scores:
+            return sources, 0
+        scored = [dict(s, rerank_score=float(sc)) for s, sc in zip(sources, scores)]
+        scored.sort(key=lambda s: s["rerank_score"], reverse=True)
+        return scored + sources[len(scores):], len(scores)
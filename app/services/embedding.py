@@ -1,25 +1,89 @@
-from typing import List
-import os
+import atexit
+import shutil
+import tempfile
+from typing import Any, Dict, List
+
+# Tokenizers loaded by TokenCounter in this process, by source directory
+_TOKENIZERS: Dict[str, Any] = {}
+
+
+def _load_sentence_transformer():
+    """Import sentence-transformers (and torch) only when a model is built."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except Exception:
+        return None  # Allow import even if not installed
+    return SentenceTransformer
+
+
+class TokenCounter:
+    """
+    Picklable count_tokens for worker processes: only the tokenizer saved
+    in `source` (a directory or model name) is loaded, once per process,
+    never the model weights.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def __call__(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        tokenizer = _TOKENIZERS.get(self.source)
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+            tokenizer = _TOKENIZERS[self.source] = AutoTokenizer.from_pretrained(self.source)
+        ids = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+        return [len(x) for x in ids]
 
-try:
-    from sentence_transformers import SentenceTransformer
-except Exception as e:
-    SentenceTransformer = None  # Allow import even if not installed
 
 class LocalEmbedder:
     """
     Thin wrapper around SentenceTransformer with safe fallbacks.
     Configure model name via settings.embedding_model.
+    EMBEDDING_BACKEND=onnx / onnx-int8 swaps in OnnxEmbedder (same interface).
+    Prefer app.core.registry.registry.get_embedder() over building one directly:
+    loading the weights is the expensive part.
     """
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", threads: int = 0):
+        SentenceTransformer = _load_sentence_transformer()
         if SentenceTransformer is None:
             raise RuntimeError(
                 "sentence-transformers is not installed. Please install it: "
                 "pip install sentence-transformers"
             )
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
         self.model_name = model_name or "sentence-transformers/all-MiniLM-L6-v2"
         self.model = SentenceTransformer(self.model_name)
+        self._tokenizer_dir = None
+
+    @property
+    def max_seq_length(self) -> int:
+        """Word-pieces the model reads per text (special tokens included); the rest is truncated."""
+        return int(self.model.max_seq_length or 256)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Word-piece count of each text, without special tokens (token-aware chunking)."""
+        if not texts:
+            return []
+        ids = self.model.tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    def token_counter(self) -> TokenCounter:
+        """count_tokens for worker processes (the tokenizer is saved to a temp dir once)."""
+        if self._tokenizer_dir is None:
+            path = tempfile.mkdtemp(prefix="tokenizer-")
+            atexit.register(shutil.rmtree, path, True)
+            self.model.tokenizer.save_pretrained(path)
+            self._tokenizer_dir = path
+        return TokenCounter(self._tokenizer_dir)
+
+    def warm_up(self) -> None:
+        """Run one tiny encode so the first real request doesn't pay for lazy init."""
+        self.model.encode(["warm up"], normalize_embeddings=True)
 
     def embed_one(self, text: str) -> List[float]:
         emb = self.model.encode([text], normalize_embeddings=True)
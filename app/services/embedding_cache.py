@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Keep well under SQLite's bound-parameter limit
+_SQL_BATCH = 500
+
+
+def text_key(text: str) -> str:
+    """Content address of a chunk: sha256 of its exact text."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _batched(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache.
+    - Keyed by (embedding_model, sha256(chunk text)) so a model change never
+      serves stale vectors
+    - Vectors stored as packed float32 blobs in a local SQLite file
+    - Size-bounded: least-recently-used rows are evicted past `max_entries`
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max(0, int(max_entries))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    # ---------- Core ops ----------
+    def get_many(self, model: str, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        if not unique:
+            return found
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for part in _batched(unique, _SQL_BATCH):
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    hit_marks = ",".join("?" * len(rows))
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND key IN ({hit_marks})",
+                        [now, model, *[key for key, _ in rows]],
+                    )
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        if not items or self.max_entries == 0:
+            return
+        now = time.time()
+        rows = [(model, key, array("f", vec).tobytes(), now) for key, vec in items.items()]
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                " SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            logger.info(f"Embedding cache evicted {excess} entries")
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {"entries": count, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+def embed_with_cache(embedder, texts: List[str], cache: "EmbeddingCache | None") -> List[List[float]]:
+    """
+    Embed `texts` in order, only sending cache misses to the model.
+    Falls back to a plain embed_batch when no cache is configured.
+    """
+    if cache is None or not texts:
+        return embedder.embed_batch(texts)
+
+    model = embedder.model_name
+    keys = [text_key(t) for t in texts]
+    cached = cache.get_many(model, keys)
+
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        fresh = embedder.embed_batch(list(missing.values()))
+        computed = dict(zip(missing.keys(), fresh))
+        cache.put_many(model, computed)
+        cached.update(computed)
+
+    logger.info(f"Embedded {len(texts)} chunks: {len(texts) - len(missing)} cached, {len(missing)} computed")
+    return [cached[k] for k in keys]
@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import record
+from app.core.registry import registry
+from app.db.catalog import catalog
+from app.db.vectorstore import VectorStore
+from app.services.chunking import CharChunker, TokenChunker
+from app.services.pdf import count_pages, iter_pages
+
+logger = logging.getLogger(__name__)
+
+# progress(stage, **counters) -> None
+ProgressFn = Callable[..., None]
+
+
+class IngestionError(Exception):
+    """Raised when a PDF yields nothing that can be indexed."""
+    pass
+
+
+def _noop_progress(stage: str, **counters: Any) -> None:
+    return None
+
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _chunk_max_tokens(embedder) -> int:
+    # Leave room for the [CLS]/[SEP] special tokens the model adds
+    return settings.chunk_max_tokens or int(getattr(embedder, "max_seq_length", 256)) - 2
+
+
+def build_chunker(embedder=None):
+    """
+    Streaming chunker for settings.chunking.
+    "tokens" needs an embedder exposing count_tokens (and max_seq_length);
+    otherwise the character splitter is used.
+    """
+    embedder = embedder or registry.get_embedder()
+    if settings.chunking == "tokens" and hasattr(embedder, "count_tokens"):
+        return TokenChunker(embedder.count_tokens, _chunk_max_tokens(embedder), settings.chunk_overlap_tokens)
+    return CharChunker(settings.chunk_size, settings.chunk_overlap)
+
+
+def chunker_spec(embedder=None) -> Dict[str, Any]:
+    """
+    Picklable recipe for the chunker build_chunker() returns, for worker
+    processes (see chunker_from_spec). Token chunking carries the
+    embedder's token_counter() (tokenizer only), so workers never need a
+    copy of the embedder.
+    """
+    embedder = embedder or registry.get_embedder()
+    if settings.chunking == "tokens" and hasattr(embedder, "count_tokens"):
+        counter = embedder.token_counter() if hasattr(embedder, "token_counter") else embedder.count_tokens
+        return {
+            "kind": "tokens",
+            "count_tokens": counter,
+            "max_tokens": _chunk_max_tokens(embedder),
+            "overlap": settings.chunk_overlap_tokens,
+        }
+    return {"kind": "chars", "size": settings.chunk_size, "overlap": settings.chunk_overlap}
+
+
+def chunker_from_spec(spec: Dict[str, Any]):
+    if spec["kind"] == "tokens":
+        return TokenChunker(spec["count_tokens"], spec["max_tokens"], spec["overlap"])
+    return CharChunker(spec["size"], spec["overlap"])
+
+
+def ingest_pdf(
+    file_path: str,
+    filename: str,
+    content_hash: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+    doc_id: Optional[str] = None,
+    resume_after_page: int = 0,
+    resume_chunks: int = 0,
+    replace: bool = False,
+) -> Dict[str, Any]:
+    """
+    Streaming ingestion pipeline for a PDF already saved on disk:
+    pages -> chunker -> embed -> vector store, in bounded batches.
+
+    Only one batch of chunks (settings.ingest_batch_size plus what one page
+    adds) and its embeddings are held at a time, so peak memory does not grow
+    with document size. With token chunking a chunk may span pages, so after
+    each batch the checkpoint is the last page before any text still pending
+    in the chunker, reported through
+    `progress("embedding", pages_done=..., chunks_done=...)`. Pass it back as
+    `resume_after_page` (with the same `doc_id`) to continue after a crash:
+    chunks starting after it are dropped and re-chunked, and chunk ids are
+    deterministic, so nothing is duplicated.
+
+    With `replace=True` the PDF is a new revision of the existing `doc_id`
+    (which keeps its name): the whole file is re-chunked, but a chunk whose
+    fingerprint (text + number of pages spanned) matches a stored one keeps
+    that chunk's id and embedding, wherever it now sits (only its page
+    metadata is rewritten when a page was inserted or removed before it),
+    so only chunks touching changed pages are re-embedded; chunks that no
+    longer exist are deleted at the end. Page hashes are compared with the
+    stored ones to report `pages_changed`.
+
+    Page text is also written to the page text store (when enabled) as it
+    is read, so the reindex CLI can rebuild the index without the PDF.
+
+    On failure the partially written document is removed again (a failed
+    replacement leaves the document as far as it got; re-running converges).
+
+    Returns:
+        {"doc_id": str, "chunks": int, "pages": int[, "chunks_reused",
+        "chunks_deleted", "pages_changed"]}
+    """
+    progress = progress or _noop_progress
+    doc_id = doc_id or str(uuid.uuid4())
+    t0 = time.perf_counter()
+    vs = VectorStore()
+    chunker = build_chunker()
+    page_store = registry.get_page_store()
+
+    pages_total = count_pages(file_path)
+    progress("extracting", doc_id=doc_id, pages_total=pages_total)
+
+    chunks_done = resume_chunks
+    pages_done = resume_after_page
+    buffer: List[Dict[str, Any]] = []
+    page_texts: List[Tuple[int, str]] = []
+    saw_text = resume_chunks > 0
+    # Page text hashes; only complete when every page was read in this run
+    page_hashes: Optional[List[str]] = [] if not resume_after_page else None
+
+    previous: Dict[str, Any] = {}
+    existing: Dict[str, Tuple[str, int, int]] = {}
+    by_fingerprint: Dict[str, List[str]] = {}
+    seen: set = set()
+    reused = 0
+    if replace:
+        previous = catalog.get(doc_id) or {}
+        filename = previous.get("doc_name") or filename
+        existing = vs.stored_chunks(doc_id)
+        for cid, (fp, _, _) in existing.items():
+            by_fingerprint.setdefault(fp, []).append(cid)
+
+    def match_stored(c: Dict[str, Any]) -> Tuple[str, bool]:
+        """(chunk id, kept) for a chunk of the new revision: a stored chunk with the same content, or a free id."""
+        page = int(c["page"])
+        position = vs.chunk_id_for(doc_id, page, int(c["index"]))
+        fp = vs.chunk_fingerprint(c["text"], int(c.get("page_end") or page) - page)
+        candidates = by_fingerprint.get(fp)
+        if candidates:
+            cid = position if position in candidates else candidates[0]
+            candidates.remove(cid)
+            return cid, True
+        # The positional id may still hold a stored chunk that is kept further on
+        cid, n = position, 0
+        while cid in existing:
+            n += 1
+            cid = f"{position}:{fp[:8]}" + (f":{n}" if n > 1 else "")
+        return cid, False
+
+    def store_pages() -> None:
+        nonlocal page_texts
+        if page_store is not None and page_texts:
+            page_store.put_pages(doc_id, page_texts)
+        page_texts = []
+
+    def flush(checkpoint: int) -> None:
+        nonlocal chunks_done, pages_done, buffer, reused
+        store_pages()
+        changed = buffer
+        if replace:
+            changed, moved = [], []
+            for c in buffer:
+                cid, kept = match_stored(c)
+                seen.add(cid)
+                page = int(c["page"])
+                if not kept:
+                    changed.append({**c, "chunk_id": cid})
+                elif existing[cid][1:] != (page, int(c.get("page_end") or page)):
+                    moved.append({**c, "chunk_id": cid})
+            reused += len(buffer) - len(changed)
+            vs.move_chunks(doc_id, filename, moved)
+        vs.add_chunks(doc_id, filename, changed)
+        chunks_done += len(buffer)
+        pages_done = checkpoint
+        buffer = []
+        progress("embedding", pages_done=pages_done, chunks_done=chunks_done)
+
+    try:
+        if resume_after_page:
+            vs.delete_chunks_after_page(doc_id, resume_after_page)
+            chunks_done = vs.count_chunks(doc_id)
+
+        last_page = resume_after_page
+        waited = time.perf_counter()
+        for page_num, page_text in iter_pages(file_path, ordered=True, start_page=resume_after_page + 1):
+            # Time spent waiting on the extractor for this page
+            record("ingest_extract_page", time.perf_counter() - waited)
+            if page_text.strip():
+                saw_text = True
+            if page_hashes is not None:
+                page_hashes.append(page_hash(page_text))
+            if page_store is not None:
+                page_texts.append((page_num, page_text))
+            buffer.extend(chunker.feed(page_num, page_text))
+            last_page = page_num
+            if len(buffer) >= settings.ingest_batch_size:
+                pending = chunker.pending_from_page
+                flush(page_num if pending is None else pending - 1)
+            waited = time.perf_counter()
+        buffer.extend(chunker.flush())
+        if buffer:
+            flush(last_page)
+        store_pages()
+
+        if not saw_text:
+            logger.warning(f"No text extracted from PDF: {file_path}")
+            raise IngestionError("No text could be extracted from PDF")
+        if chunks_done == 0:
+            raise IngestionError("No chunks were created from PDF")
+
+    except Exception:
+        if replace:
+            logger.warning(f"Replacement of doc_id={doc_id} failed; document left partially updated")
+            raise
+        logger.warning(f"Ingestion of {filename} failed; removing partial doc_id={doc_id}")
+        try:
+            vs.delete_document_chunks(doc_id)
+            if page_store is not None:
+                page_store.delete_document(doc_id)
+        except Exception:
+            logger.error(f"Cleanup of partial doc_id={doc_id} failed", exc_info=True)
+        raise
+
+    result: Dict[str, Any] = {"doc_id": doc_id, "chunks": chunks_done, "pages": pages_total}
+    if replace:
+        if page_store is not None:
+            page_store.truncate(doc_id, pages_total)
+        result["chunks_reused"] = reused
+        result["chunks_deleted"] = vs.delete_chunks([cid for cid in existing if cid not in seen])
+        old_hashes = previous.get("page_hashes")
+        if page_hashes is not None and old_hashes is not None:
+            result["pages_changed"] = sum(
+                1 for i in range(max(len(page_hashes), len(old_hashes)))
+                if i >= len(page_hashes) or i >= len(old_hashes) or page_hashes[i] != old_hashes[i]
+            )
+        logger.info(
+            f"Replaced doc_id={doc_id}: {chunks_done - reused} chunks re-embedded, {reused} kept, "
+            f"{result['chunks_deleted']} deleted"
+        )
+
+    record("ingest_document", time.perf_counter() - t0)
+    logger.info(f"Created {chunks_done} chunks from PDF: {filename}")
+    vs.finalize_document(
+        doc_id, filename, chunks=chunks_done,
+        content_hash=content_hash, page_hashes=page_hashes, file_path=file_path,
+    )
+    progress("indexing", pages_done=pages_total, chunks_total=chunks_done, chunks_done=chunks_done)
+    logger.info(f"Document indexed with doc_id={doc_id}")
+
+    return result
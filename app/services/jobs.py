@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.core.concurrency import BoundedExecutor
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.indexes import ingest_slot
+from app.services.ingestion import ingest_pdf
+
+logger = logging.getLogger(__name__)
+
+_JOBS_FILE = os.path.join(getattr(settings, "persist_dir", "./persistence"), "jobs.json")
+
+# Job lifecycle
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+_PENDING = (QUEUED, RUNNING)
+
+# Fields kept server-side only
+_PRIVATE_FIELDS = ("file_path",)
+
+
+class JobQueueFull(Exception):
+    """Raised when INGEST_MAX_PENDING jobs are already waiting."""
+    pass
+
+
+class JobConflict(Exception):
+    """Raised when the target document already has a pending job."""
+    pass
+
+
+class JobStore:
+    """
+    JSON-file persistence for ingestion jobs so queued work survives a restart.
+    Same temp-file + os.replace pattern as the document catalog.
+    - Status and stage changes are written at once; progress-only updates
+      (page/chunk counters) at most every `save_interval_s`, so a crash
+      loses at most that much checkpoint progress (resume redoes it)
+    - Finished jobs are kept for `retention_s` and at most `max_finished`
+      of them (newest first), so the file stays small
+    """
+
+    def __init__(
+        self,
+        path: str = _JOBS_FILE,
+        save_interval_s: float = 2.0,
+        retention_s: float = 7 * 86400,
+        max_finished: int = 1000,
+    ):
+        self.path = path
+        self.save_interval_s = max(0.0, float(save_interval_s))
+        self.retention_s = float(retention_s)
+        self.max_finished = max(0, int(max_finished))
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._jobs: Dict[str, Dict[str, Any]] = self._load()
+        if self._prune():
+            self._save()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return json.load(f) or {}
+            return {}
+        except Exception:
+            logger.warning(f"Could not read job store {self.path}; starting empty", exc_info=True)
+            return {}
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._jobs, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _prune(self) -> int:
+        """Drop finished jobs past the retention age or beyond max_finished. Returns how many."""
+        cutoff = time.time() - self.retention_s
+        finished = sorted(
+            (j for j in self._jobs.values() if j.get("status") not in _PENDING),
+            key=lambda j: j.get("updated_at", 0),
+            reverse=True,
+        )
+        expired = [
+            j["job_id"] for i, j in enumerate(finished)
+            if i >= self.max_finished or j.get("updated_at", 0) < cutoff
+        ]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+        return len(expired)
+
+    def create(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            job = {
+                "job_id": str(uuid.uuid4()),
+                "status": QUEUED,
+                "stage": QUEUED,
+                "pages_total": 0,
+                "pages_done": 0,
+                "chunks_total": 0,
+                "chunks_done": 0,
+                "doc_id": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+                **record,
+            }
+            self._jobs[job["job_id"]] = job
+            self._prune()
+            self._save()
+            return dict(job)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            # Progress counters alone don't warrant rewriting the file every batch
+            milestone = any(job.get(k) != fields[k] for k in ("status", "stage", "doc_id", "error") if k in fields)
+            job.update(fields)
+            job["updated_at"] = time.time()
+            self._dirty = True
+            if milestone or time.monotonic() - self._saved_at >= self.save_interval_s:
+                self._save()
+
+    def flush(self) -> None:
+        """Write progress updates still held back by the save interval."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values() if j.get("status") in _PENDING]
+        return sorted(jobs, key=lambda j: j.get("created_at", 0))
+
+    def find_pending_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        for job in self.pending():
+            if content_hash and job.get("content_hash") == content_hash:
+                return job
+        return None
+
+    def find_pending_by_doc(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        for job in self.pending():
+            if job.get("doc_id") == doc_id:
+                return job
+        return None
+
+
+class JobManager:
+    """
+    Bounded background worker pool for PDF ingestion.
+    - At most INGEST_WORKERS pipelines run at once, so uploads can't
+      monopolise the CPU that queries need
+    - At most INGEST_MAX_PENDING jobs may be queued/running
+    - Pending jobs are re-submitted on startup
+    """
+
+    def __init__(self, store: JobStore, max_workers: int, max_pending: int):
+        self.store = store
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor: Optional[BoundedExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> BoundedExecutor:
+        with self._lock:
+            if self._executor is None:
+                pool = self._executor = BoundedExecutor("ingest", self.max_workers)
+                metrics.gauge("rag_executor_queued", lambda: pool.queued, pool="ingest")
+                metrics.gauge("rag_executor_running", lambda: pool.running, pool="ingest")
+            return self._executor
+
+    # ---------- Lifecycle ----------
+    def start(self) -> None:
+        """Re-queue jobs that were pending when the process last stopped."""
+        for job in self.store.pending():
+            if not job.get("file_path") or not os.path.exists(job["file_path"]):
+                self.store.update(job["job_id"], status=FAILED, error="Uploaded file is missing after restart")
+                continue
+            logger.info(f"Resuming ingestion job {job['job_id']} ({job.get('filename')})")
+            self.store.update(job["job_id"], status=QUEUED, stage=QUEUED)
+            self._pool().submit(self._run, job["job_id"])
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        self.store.flush()
+
+    # ---------- Public API ----------
+    def submit(
+        self,
+        file_path: str,
+        filename: str,
+        content_hash: Optional[str] = None,
+        replace_doc_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Queue an ingestion; with `replace_doc_id` the file is a new revision of that document."""
+        if replace_doc_id:
+            if self.store.find_pending_by_doc(replace_doc_id):
+                raise JobConflict(f"Document {replace_doc_id} already has a pending ingestion job")
+        elif content_hash:
+            existing = self.store.find_pending_by_hash(content_hash)
+            if existing:
+                return existing
+        if len(self.store.pending()) >= self.max_pending:
+            raise JobQueueFull(f"{self.max_pending} ingestion jobs are already pending")
+
+        record = {"filename": filename, "file_path": file_path, "content_hash": content_hash}
+        if replace_doc_id:
+            record.update(doc_id=replace_doc_id, replace=True)
+        job = self.store.create(record)
+        self._pool().submit(self._run, job["job_id"])
+        logger.info(f"Queued ingestion job {job['job_id']} for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        for field in _PRIVATE_FIELDS:
+            job.pop(field, None)
+        return job
+
+    # ---------- Worker ----------
+    def _run(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        self.store.update(job_id, status=RUNNING, error=None)
+        # A replacement simply re-runs: its chunk diff skips what was already written
+        replace = bool(job.get("replace"))
+        resume_after_page = int(job.get("pages_done") or 0) if job.get("doc_id") and not replace else 0
+        if resume_after_page:
+            logger.info(f"Job {job_id}: resuming doc_id={job['doc_id']} after page {resume_after_page}")
+
+        def progress(stage: str, **counters: Any) -> None:
+            self.store.update(job_id, stage=stage, **counters)
+
+        try:
+            # A reindex switch in progress holds new ingestion off until it is done
+            with ingest_slot(on_wait=lambda: self.store.update(job_id, stage="waiting_for_reindex")):
+                result = ingest_pdf(
+                    job["file_path"],
+                    job["filename"],
+                    content_hash=job.get("content_hash"),
+                    progress=progress,
+                    doc_id=job.get("doc_id"),
+                    resume_after_page=resume_after_page,
+                    resume_chunks=int(job.get("chunks_done") or 0) if resume_after_page else 0,
+                    replace=replace,
+                )
+            summary = {k: result[k] for k in ("chunks_reused", "chunks_deleted", "pages_changed") if k in result}
+            self.store.update(job_id, status=SUCCEEDED, stage="done", doc_id=result["doc_id"], **summary)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed", exc_info=True)
+            self.store.update(job_id, status=FAILED, error=str(e))
+
+
+job_manager = JobManager(
+    store=JobStore(
+        save_interval_s=settings.job_save_interval_s,
+        retention_s=settings.job_retention_s,
+        max_finished=settings.job_max_finished,
+    ),
+    max_workers=settings.ingest_workers,
+    max_pending=settings.ingest_max_pending,
+)
@@ -1,19 +1,94 @@
+import asyncio
+import json
+import logging
 import os
-from typing import Protocol
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Protocol
 
-# Optional dependency; only used if GEMINI is configured
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
+from app.core.metrics import profiled
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(RuntimeError):
+    """Provider call failed (after retries, if any)."""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LLMTimeoutError(LLMError):
+    """Provider call exceeded its deadline."""
+
+    def __init__(self, message: str):
+        super().__init__(message, retryable=True)
+
+
+def _load_genai():
+    """Optional dependency; only imported once a Gemini client is actually built."""
+    try:
+        import google.generativeai as genai
+    except Exception:
+        return None
+    return genai
+
+
+def _google_transient_errors() -> tuple:
+    """google.api_core exception types worth retrying (429 / 5xx), or () without the SDK."""
+    try:
+        from google.api_core import exceptions as gexc
+    except Exception:
+        return ()
+    return (
+        gexc.TooManyRequests,
+        gexc.ResourceExhausted,
+        gexc.InternalServerError,
+        gexc.BadGateway,
+        gexc.ServiceUnavailable,
+        gexc.GatewayTimeout,
+    )
+
+
+def _google_deadline_error() -> tuple:
+    try:
+        from google.api_core import exceptions as gexc
+    except Exception:
+        return ()
+    return (gexc.DeadlineExceeded,)
 
 
 class LLM(Protocol):
     def generate(self, prompt: str) -> str: ...
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield answer text incrementally, as the provider produces it."""
+        ...
+
+
+class AsyncLLM(Protocol):
+    async def agenerate(self, prompt: str) -> str: ...
+
+    def astream(self, prompt: str) -> AsyncIterator[str]: ...
+
 
 class GeminiLLM:
-    def __init__(self, api_key: str, model: str = "gemini-2.0-flash"):
+    """
+    Google Gemini through the google-generativeai SDK (blocking calls).
+    - Every request carries the SDK's own `timeout_s` deadline, so a call
+      that runs over is actually aborted (the calling thread is freed)
+    - Transient SDK errors (429 / 5xx) are raised as retryable LLMError and
+      deadline overruns as LLMTimeoutError, for ResilientLLM to retry
+    """
+
+    # The SDK enforces the per-call deadline itself (see ResilientLLM)
+    enforces_timeout = True
+
+    def __init__(self, api_key: str, model: str = "gemini-2.0-flash", timeout_s: float = 30.0):
+        genai = _load_genai()
         if genai is None:
             raise RuntimeError(
                 "google-generativeai is not installed. Install with: pip install google-generativeai"
@@ -22,32 +97,385 @@ class GeminiLLM:
             raise RuntimeError("GEMINI_API_KEY is not set.")
         genai.configure(api_key=api_key)
         self.model_name = model
+        self.timeout_s = timeout_s
         self.client = genai.GenerativeModel(self.model_name)
+        self._transient = _google_transient_errors()
+        self._deadline = _google_deadline_error()
+
+    def _translate(self, exc: Exception) -> Exception:
+        """SDK exception -> LLMError carrying the retry decision (others pass through)."""
+        if self._deadline and isinstance(exc, self._deadline):
+            return LLMTimeoutError(f"Gemini call exceeded {self.timeout_s}s: {exc}")
+        if self._transient and isinstance(exc, self._transient):
+            return LLMError(f"Gemini returned a transient error: {exc}", retryable=True)
+        return exc
 
     def generate(self, prompt: str) -> str:
-        resp = self.client.generate_content(prompt)
+        try:
+            resp = self.client.generate_content(prompt, request_options={"timeout": self.timeout_s})
+        except Exception as e:
+            err = self._translate(e)
+            if err is e:
+                raise
+            raise err from e
         try:
             return (resp.text or "").strip()
         except Exception:
             # Defensive fallback
             return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        try:
+            for chunk in self.client.generate_content(
+                prompt, stream=True, request_options={"timeout": self.timeout_s}
+            ):
+                try:
+                    text = chunk.text
+                except Exception:
+                    # Chunks without text parts (e.g. safety metadata only)
+                    continue
+                if text:
+                    yield text
+        except Exception as e:
+            err = self._translate(e)
+            if err is e:
+                raise
+            raise err from e
+
+
+class FakeLLM:
+    """
+    Offline, deterministic LLM for tests and benchmarks (LLM_PROVIDER=fake).
+    Answers with the opening words of the first context source, streamed
+    word by word with an optional per-token delay, so time-to-first-byte and
+    streaming behaviour can be measured without network access.
+    """
+
+    def __init__(self, token_delay_s: float = 0.0, max_words: int = 40):
+        self.model_name = "fake"
+        self.token_delay_s = max(0.0, token_delay_s)
+        self.max_words = max_words
+
+    def _answer(self, prompt: str) -> str:
+        m = re.search(r"\[Source 1\](?: \(page \d+\))? (.*?)(?:\n\n\[Source |\Z)", prompt, re.S)
+        if not m:
+            return "Not found in document."
+        words = m.group(1).split()[: self.max_words]
+        return " ".join(words) or "Not found in document."
 
-def get_llm() -> LLM:
+    def generate(self, prompt: str) -> str:
+        return "".join(self.stream(prompt)).strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for i, word in enumerate(self._answer(prompt).split()):
+            if self.token_delay_s:
+                time.sleep(self.token_delay_s)
+            yield word if i == 0 else " " + word
+
+
+class OpenAICompatibleLLM:
+    """
+    Chat-completions client for any OpenAI-compatible server (OpenAI, vLLM,
+    llama.cpp server, Ollama, ...), speaking plain HTTP through httpx.
+    Pass shared (pooled) httpx clients; sync and async methods are both
+    available so the same provider serves answer_with_context and the
+    async endpoints.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        max_tokens: int = 512,
+        client=None,
+        async_client=None,
+    ):
+        import httpx
+
+        self.model_name = model
+        self.base_url = base_url.rstrip("/")
+        self.max_tokens = max_tokens
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = client or httpx.Client()
+        self._async_client = async_client or httpx.AsyncClient()
+
+    # ---------- Request/response helpers ----------
+    @property
+    def _url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def _payload(self, prompt: str, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+        }
+
+    @staticmethod
+    def _check(status_code: int, body: str) -> None:
+        if status_code >= 400:
+            retryable = status_code == 429 or status_code >= 500
+            raise LLMError(f"LLM server returned HTTP {status_code}: {body[:200]}", retryable=retryable)
+
+    @staticmethod
+    def _message_text(data: Dict[str, Any]) -> str:
+        choices = data.get("choices") or [{}]
+        return ((choices[0].get("message") or {}).get("content") or "").strip()
+
+    @staticmethod
+    def _delta_text(line: str) -> Optional[str]:
+        """Text from one SSE line of a streamed completion ("" for keep-alives, None at [DONE])."""
+        if not line.startswith("data:"):
+            return ""
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return None
+        try:
+            choices = json.loads(payload).get("choices") or [{}]
+        except ValueError:
+            return ""
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+    # ---------- Sync ----------
+    def generate(self, prompt: str) -> str:
+        resp = self._client.post(self._url, json=self._payload(prompt, False), headers=self._headers)
+        self._check(resp.status_code, resp.text)
+        return self._message_text(resp.json())
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        with self._client.stream("POST", self._url, json=self._payload(prompt, True), headers=self._headers) as resp:
+            if resp.status_code >= 400:
+                self._check(resp.status_code, resp.read().decode("utf-8", "replace"))
+            for line in resp.iter_lines():
+                text = self._delta_text(line)
+                if text is None:
+                    break
+                if text:
+                    yield text
+
+    # ---------- Async ----------
+    async def agenerate(self, prompt: str) -> str:
+        resp = await self._async_client.post(self._url, json=self._payload(prompt, False), headers=self._headers)
+        self._check(resp.status_code, resp.text)
+        return self._message_text(resp.json())
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        async with self._async_client.stream(
+            "POST", self._url, json=self._payload(prompt, True), headers=self._headers
+        ) as resp:
+            if resp.status_code >= 400:
+                self._check(resp.status_code, (await resp.aread()).decode("utf-8", "replace"))
+            async for line in resp.aiter_lines():
+                text = self._delta_text(line)
+                if text is None:
+                    break
+                if text:
+                    yield text
+
+
+class SyncLLMAdapter:
+    """Async facade over a blocking provider (Gemini SDK, FakeLLM): calls run in worker threads."""
+
+    _DONE = object()
+
+    def __init__(self, llm: LLM):
+        self.llm = llm
+        self.model_name = getattr(llm, "model_name", "unknown")
+        self.enforces_timeout = getattr(llm, "enforces_timeout", False)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await asyncio.to_thread(profiled, self.llm.generate, prompt)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Pull the provider's sync stream one piece per worker-thread call.
+        If the consumer stops early (disconnect, deadline, retry), the
+        stream is closed on a worker thread so the provider's HTTP
+        response is released; a next() still blocked in its thread (its
+        awaiter gave up) finishes first.
+        """
+        it = iter(self.llm.stream(prompt))
+        lock = threading.Lock()
+        finished = False
+
+        def step():
+            with lock:
+                return next(it, self._DONE)
+
+        def close():
+            with lock:
+                try:
+                    getattr(it, "close", lambda: None)()
+                except Exception:
+                    logger.warning("Closing the provider stream failed", exc_info=True)
+
+        try:
+            while True:
+                piece = await asyncio.to_thread(profiled, step)
+                if piece is self._DONE:
+                    finished = True
+                    return
+                yield piece
+        finally:
+            if not finished:
+                # Not awaited: a stalled next() may hold the lock for a while
+                threading.Thread(target=close, name="llm-stream-close", daemon=True).start()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, LLMError):
+        return exc.retryable
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    try:
+        import httpx
+        return isinstance(exc, httpx.TransportError)
+    except Exception:
+        return False
+
+
+class ResilientLLM:
+    """
+    Wraps an AsyncLLM with the policies every provider call needs:
+    - deadline `timeout_s`: per call, and for streams per chunk (each
+      wait for the next piece). Providers with `enforces_timeout` (Gemini)
+      get no outer wait_for, since cancelling the awaiter would leave their
+      blocking call running in its thread. For them the only deadline is
+      the SDK's request timeout, which bounds the whole call, a stream
+      included, not each chunk
+    - retries with exponential backoff and full jitter on transient
+      failures (timeouts, transport errors, HTTP 429/5xx)
+    - a semaphore capping in-flight calls to the provider
+    Streams are only retried before the first token has been emitted.
+    """
+
+    def __init__(
+        self,
+        inner: AsyncLLM,
+        timeout_s: float = 30.0,
+        max_retries: int = 2,
+        backoff_base_s: float = 0.25,
+        backoff_max_s: float = 4.0,
+        max_concurrency: int = 8,
+    ):
+        self.inner = inner
+        self.model_name = getattr(inner, "model_name", "unknown")
+        self.timeout_s = timeout_s
+        self.max_retries = max(0, max_retries)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._outer_deadline = not getattr(inner, "enforces_timeout", False)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0.0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+
+    def _deadline(self, aw):
+        return asyncio.wait_for(aw, timeout=self.timeout_s) if self._outer_deadline else aw
+
+    async def agenerate(self, prompt: str) -> str:
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    return await self._deadline(self.inner.agenerate(prompt))
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise LLMTimeoutError(f"LLM call exceeded {self.timeout_s}s") from e
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"LLM call failed ({e!r}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                async with self._semaphore:
+                    it = self.inner.astream(prompt).__aiter__()
+                    try:
+                        while True:
+                            try:
+                                piece = await self._deadline(it.__anext__())
+                            except StopAsyncIteration:
+                                return
+                            emitted = True
+                            yield piece
+                    finally:
+                        # Release the abandoned attempt (e.g. its streaming HTTP response)
+                        aclose = getattr(it, "aclose", None)
+                        if aclose is not None:
+                            await aclose()
+            except Exception as e:
+                if emitted or attempt >= self.max_retries or not _is_retryable(e):
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise LLMTimeoutError(f"LLM stream stalled for {self.timeout_s}s") from e
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"LLM stream failed ({e!r}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+
+def get_llm(client=None, async_client=None) -> LLM:
     """
     Factory that returns the configured LLM backend.
+    Builds a new client on every call; request handlers should go through
+    app.core.registry.registry.get_llm() which caches the result.
     Currently supports Gemini via env vars:
       - LLM_PROVIDER=gemini
       - GEMINI_API_KEY=...
       - GEMINI_MODEL=gemini-2.0-flash
+    any OpenAI-compatible server:
+      - LLM_PROVIDER=openai
+      - OPENAI_BASE_URL=http://localhost:8001/v1
+      - OPENAI_API_KEY=... (optional for local servers)
+      - OPENAI_MODEL=...
+    and an offline fake:
+      - LLM_PROVIDER=fake
+      - FAKE_LLM_TOKEN_DELAY_MS=20
+    `client` / `async_client` are pooled httpx clients for HTTP providers.
     """
     provider = (os.getenv("LLM_PROVIDER") or "gemini").lower()
 
     if provider == "gemini":
         api_key = os.getenv("GEMINI_API_KEY", "")
         model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-        return GeminiLLM(api_key=api_key, model=model)
+        timeout_s = float(os.getenv("LLM_TIMEOUT_S", 30))
+        return GeminiLLM(api_key=api_key, model=model, timeout_s=timeout_s)
+
+    if provider == "openai":
+        return OpenAICompatibleLLM(
+            base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+            api_key=os.getenv("OPENAI_API_KEY") or None,
+            max_tokens=int(os.getenv("MAX_TOKENS_ANSWER", 512)),
+            client=client,
+            async_client=async_client,
+        )
+
+    if provider == "fake":
+        return FakeLLM(token_delay_s=float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", 0)) / 1000.0)
 
     # Add other providers here as needed.
 
     raise RuntimeError(f"Unsupported LLM_PROVIDER: {provider}")
+
+
+def get_async_llm(llm: LLM, timeout_s: float, max_retries: int, backoff_base_s: float,
+                  backoff_max_s: float, max_concurrency: int) -> ResilientLLM:
+    """Async, policy-wrapped view of `llm` (native async for HTTP providers, threads otherwise)."""
+    inner = llm if hasattr(llm, "agenerate") else SyncLLMAdapter(llm)
+    return ResilientLLM(
+        inner,
+        timeout_s=timeout_s,
+        max_retries=max_retries,
+        backoff_base_s=backoff_base_s,
+        backoff_max_s=backoff_max_s,
+        max_concurrency=max_concurrency,
+    )
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.embedding import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+_PROBE_TEXTS = [
+    "How do I reset the device to factory settings?",
+    "Error code E42 indicates a pressure sensor fault in the main pump assembly.",
+    "The warranty covers manufacturing defects for a period of twenty-four months.",
+    "Section 4.2.1 describes torque specifications for the mounting bolts.",
+]
+
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = False) -> Dict[str, Any]:
+    """
+    Export a SentenceTransformer's transformer to ONNX (optionally dynamic
+    int8), next to its tokenizer and pooling config, and record how closely
+    it reproduces the torch embeddings on a few probe sentences.
+    Needs torch + sentence-transformers; the exported model then runs on
+    onnxruntime alone.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    pooling = st[1] if len(st) > 1 else None
+    mode = "cls" if getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+
+    sample = tokenizer(["export sample"], return_tensors="pt", padding=True)
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{n: {0: "batch", 1: "seq"} for n in input_names},
+                          "last_hidden_state": {0: "batch", 1: "seq"}},
+            opset_version=14,
+        )
+    model_path = fp32_path
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        model_path = os.path.join(out_dir, "model.int8.onnx")
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    meta = {
+        "model_name": model_name,
+        "model_file": os.path.basename(model_path),
+        "pooling": mode,
+        "max_seq_length": int(st.max_seq_length or 256),
+        "input_names": input_names,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    # Interchangeability check against the torch embeddings
+    reference = st.encode(_PROBE_TEXTS, normalize_embeddings=True)
+    onnx_emb = np.asarray(OnnxEmbedder(out_dir, threads=0).embed_batch(_PROBE_TEXTS))
+    meta["probe_min_cosine"] = float(_cosine_rows(reference, onnx_emb).min())
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    logger.info(f"Exported {model_name} to {model_path} (min probe cosine vs torch: {meta['probe_min_cosine']:.5f})")
+    return meta
+
+
+class OnnxEmbedder:
+    """
+    onnxruntime implementation of the LocalEmbedder interface.
+    - Runs an exported transformer (fp32 or dynamic int8) on CPU
+    - Applies the same pooling and L2 normalization as the torch model
+    - Thread count is configurable (0 = onnxruntime default)
+    """
+
+    def __init__(self, model_dir: str, threads: int = 0, batch_size: int = 32):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.model_name = self.meta["model_name"]
+        self.model_dir = model_dir
+        self.max_seq_length = int(self.meta.get("max_seq_length") or 256)
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        opts = ort.SessionOptions()
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, self.meta["model_file"]),
+            sess_options=opts,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    @classmethod
+    def load_or_export(
+        cls,
+        model_name: str,
+        cache_dir: str,
+        quantize: bool = False,
+        threads: int = 0,
+        min_cosine: float = 0.98,
+    ) -> "OnnxEmbedder":
+        """Load the cached export for `model_name`, exporting (and verifying) it on first use."""
+        model_dir = os.path.join(cache_dir, _slug(model_name) + ("-int8" if quantize else ""))
+        meta_path = os.path.join(model_dir, "meta.json")
+        meta: Optional[Dict[str, Any]] = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if not meta or "probe_min_cosine" not in meta:
+            meta = export_onnx(model_name, model_dir, quantize=quantize)
+        if meta["probe_min_cosine"] < min_cosine:
+            raise RuntimeError(
+                f"ONNX export of {model_name} deviates from torch (min cosine "
+                f"{meta['probe_min_cosine']:.4f} < {min_cosine}); refusing to mix embeddings"
+            )
+        return cls(model_dir, threads=threads)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feeds = {n: enc[n].astype(np.int64) for n in self._input_names if n in enc}
+        if "token_type_ids" in self._input_names and "token_type_ids" not in feeds:
+            feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.meta.get("pooling") == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = enc["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        ids = self.tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    def token_counter(self) -> TokenCounter:
+        """count_tokens for worker processes (the tokenizer is already saved in model_dir)."""
+        return TokenCounter(self.model_dir)
+
+    def warm_up(self) -> None:
+        self._encode(["warm up"])
+
+    def embed_one(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        out: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            out.extend(e.tolist() for e in self._encode(texts[i:i + self.batch_size]))
+        return out
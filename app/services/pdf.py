@@ -1,39 +1,139 @@
+import os
 import fitz  # PyMuPDF
-from typing import Dict, Tuple
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.concurrency import process_pool
+from app.core.config import settings
 
 class PDFExtractionError(Exception):
     """Raised when a PDF cannot be read or parsed."""
     pass
 
 
-def extract_text_from_pdf(file_path: str) -> Tuple[str, Dict[int, str]]:
+# Each worker gets several ranges so a slow (scanned/dense) stretch of pages
+# doesn't leave the other processes idle.
+_RANGES_PER_WORKER = 4
+# Ranges in flight per worker; bounds how much extracted text can pile up
+# when the consumer (chunking/embedding) is slower than extraction.
+_INFLIGHT_PER_WORKER = 2
+
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    n = settings.pdf_workers if workers is None else workers
+    if n <= 0:
+        n = os.cpu_count() or 1
+    return max(1, n)
+
+
+def _page_ranges(first: int, page_count: int, workers: int) -> List[Tuple[int, int]]:
+    """Split [first, page_count) into contiguous (start, end) ranges."""
+    total = page_count - first
+    parts = max(1, min(total, workers * _RANGES_PER_WORKER))
+    step = -(-total // parts)  # ceil division
+    return [(s, min(s + step, page_count)) for s in range(first, page_count, step)]
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Worker: open a private fitz document and extract pages [start, end)."""
+    doc = fitz.open(file_path)
+    try:
+        return [(i + 1, doc[i].get_text("text") or "") for i in range(start, end)]
+    finally:
+        doc.close()
+
+
+def count_pages(file_path: str) -> int:
+    doc = fitz.open(file_path)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def iter_pages(
+    file_path: str,
+    workers: Optional[int] = None,
+    ordered: bool = False,
+    start_page: int = 1,
+) -> Iterator[Tuple[int, str]]:
     """
-    Extract full text and a mapping of page -> text from a PDF.
+    Yield (page_number, text) pairs, 1-based.
+
+    Small PDFs (< settings.pdf_parallel_min_pages) are read sequentially.
+    Larger ones are split into page ranges across a process pool (forkserver
+    workers, never forks of the threaded caller), each worker opening its
+    own fitz document. Only a few ranges are in flight at once,
+    so memory stays bounded however large the PDF is.
 
     Args:
         file_path: path to PDF
-
-    Returns:
-        (full_text, page_map)
-        - full_text: all pages concatenated
-        - page_map: dict of page_number (1-based) -> text
+        workers: process count (None -> settings.pdf_workers, <= 0 -> all cores)
+        ordered: yield strictly in page order instead of as ranges finish
+        start_page: first page to yield (resume support)
     """
     try:
-        doc = fitz.open(file_path)
-        if doc.page_count == 0:
+        page_count = count_pages(file_path)
+        if page_count == 0:
             raise PDFExtractionError("Empty PDF file")
 
-        full_text_parts = []
-        page_map: Dict[int, str] = {}
+        first = max(0, start_page - 1)
+        if first >= page_count:
+            return
 
-        for i in range(doc.page_count):
-            page = doc[i]
-            text = page.get_text("text") or ""
-            page_map[i + 1] = text
-            full_text_parts.append(text)
+        n_workers = _resolve_workers(workers)
+        if n_workers == 1 or page_count - first < settings.pdf_parallel_min_pages:
+            doc = fitz.open(file_path)
+            try:
+                for i in range(first, page_count):
+                    yield i + 1, doc[i].get_text("text") or ""
+            finally:
+                doc.close()
+            return
 
-        doc.close()
-        return "\n".join(full_text_parts), page_map
+        ranges = deque(_page_ranges(first, page_count, n_workers))
+        max_inflight = n_workers * _INFLIGHT_PER_WORKER
+        with process_pool(min(n_workers, len(ranges))) as pool:
+            inflight = deque()
+            while ranges or inflight:
+                while ranges and len(inflight) < max_inflight:
+                    s, e = ranges.popleft()
+                    inflight.append(pool.submit(_extract_page_range, file_path, s, e))
+                if ordered:
+                    fut = inflight.popleft()
+                else:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    fut = next(iter(done))
+                    inflight.remove(fut)
+                yield from fut.result()
 
+    except PDFExtractionError:
+        raise
     except Exception as e:
         raise PDFExtractionError(f"Failed to extract text from PDF: {e}")
+
+
+def extract_pages(file_path: str, workers: Optional[int] = None) -> Dict[int, str]:
+    """
+    Extract a mapping of page_number (1-based) -> text, in page order.
+    Use this when the concatenated full text isn't needed.
+    """
+    return dict(iter_pages(file_path, workers=workers, ordered=True))
+
+
+def extract_text_from_pdf(file_path: str, workers: Optional[int] = None) -> Tuple[str, Dict[int, str]]:
+    """
+    Extract full text and a mapping of page -> text from a PDF.
+
+    Args:
+        file_path: path to PDF
+        workers: see iter_pages
+
+    Returns:
+        (full_text, page_map)
+        - full_text: all pages concatenated
+        - page_map: dict of page_number (1-based) -> text
+    """
+    page_map = extract_pages(file_path, workers=workers)
+    return "\n".join(page_map.values()), page_map
@@ -0,0 +1,559 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.concurrency import process_pool
+from app.core.config import settings
+from app.core.registry import registry
+from app.db.catalog import catalog
+from app.db.indexes import (
+    DEFAULT_INDEX,
+    index_paths,
+    ingest_fence,
+    ingest_slot,
+    read_active_index,
+    switch_active_index,
+)
+from app.db.page_store import PageTextStore
+from app.db.vectorstore import VectorStore
+from app.services.ingestion import IngestionError, chunker_from_spec, chunker_spec, page_hash
+from app.services.pdf import iter_pages
+
+logger = logging.getLogger(__name__)
+
+# Documents prepared ahead of the embedding stage, per worker process;
+# bounds how much chunked text waits when embedding is the bottleneck
+_PREPARED_PER_WORKER = 2
+# Extra passes over documents uploaded, replaced or deleted while a rebuild ran
+_CATCH_UP_ROUNDS = 3
+
+
+class ReindexError(Exception):
+    """Raised when a rebuild cannot start, resume or switch."""
+    pass
+
+
+def index_config() -> Dict[str, Any]:
+    """Settings an index is built with; an unfinished rebuild only resumes under the same ones."""
+    return {
+        "embedding_model": settings.embedding_model,
+        "vector_backend": settings.vector_backend,
+        "chunking": settings.chunking,
+        "chunk_max_tokens": settings.chunk_max_tokens,
+        "chunk_overlap_tokens": settings.chunk_overlap_tokens,
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+    }
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.upload_chunk_bytes), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    n = settings.reindex_workers if workers is None else workers
+    if n <= 0:
+        n = os.cpu_count() or 1
+    return max(1, n)
+
+
+def _page_store() -> PageTextStore:
+    store = registry.get_page_store()
+    if store is None:
+        raise ReindexError("PAGE_TEXT_STORE is disabled; the reindex tool needs the page text store")
+    return store
+
+
+# -------------------------------
+# Extract/chunk stage (worker processes)
+# -------------------------------
+
+def prepare_document(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker: one document's pages -> chunks, with the chunker described by
+    the task's "chunker" (ingestion.chunker_spec) and one of
+    - {"doc_id", "page_store"}: page text from the page text store
+    - {"path"[, "doc_id", "content_hash"]}: PDF extraction (single process:
+      the pool already runs one document per process). Without a doc_id the
+      file is an import: it is skipped if its sha256 is already in the
+      catalog, and otherwise gets a doc_id derived from that hash, so an
+      interrupted import re-run overwrites its own leftovers
+    Returns {"doc_id", "chunks", "page_hashes", "pages_total"[, "pages",
+    "content_hash"]} or {"duplicate_of": doc_id}; "pages" carries the
+    extracted (page, text) pairs for the main process to store.
+    """
+    out: Dict[str, Any] = {}
+    if task.get("path"):
+        content_hash = task.get("content_hash") or _sha256_file(task["path"])
+        doc_id = task.get("doc_id")
+        if doc_id is None:
+            existing = catalog.find_by_hash(content_hash)
+            if existing:
+                return {"duplicate_of": existing}
+            doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"sha256:{content_hash}"))
+        out.update({"content_hash": content_hash, "pages": []})
+        pages: Iterable[Tuple[int, str]] = iter_pages(task["path"], workers=1, ordered=True)
+    else:
+        doc_id = task["doc_id"]
+        pages = PageTextStore(task["page_store"]).iter_pages(doc_id)
+
+    chunker = chunker_from_spec(task["chunker"])
+    chunks: List[Dict[str, Any]] = []
+    hashes: List[str] = []
+    for page, text in pages:
+        hashes.append(page_hash(text))
+        if "pages" in out:
+            out["pages"].append((page, text))
+        chunks.extend(chunker.feed(page, text))
+    chunks.extend(chunker.flush())
+    out.update({"doc_id": doc_id, "chunks": chunks, "page_hashes": hashes, "pages_total": len(hashes)})
+    return out
+
+
+def _pipeline(
+    tasks: List[Dict[str, Any]], workers: int
+) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[BaseException]]]:
+    """
+    Run prepare_document over `tasks` in a process pool and yield
+    (task, prepared, error) in task order, so the caller's embedding stage
+    overlaps with extraction/chunking of the next documents. At most
+    workers * _PREPARED_PER_WORKER documents are in flight.
+    """
+    if not tasks:
+        return
+    pending = deque(tasks)
+    inflight: deque = deque()
+    with process_pool(min(workers, len(tasks))) as pool:
+        # Workers are started from a clean forkserver and inherit nothing;
+        # each task carries what they need to chunk like this process does
+        spec = chunker_spec()
+        while pending or inflight:
+            while pending and len(inflight) < workers * _PREPARED_PER_WORKER:
+                task = pending.popleft()
+                inflight.append((task, pool.submit(prepare_document, {**task, "chunker": spec})))
+            task, fut = inflight.popleft()
+            try:
+                yield task, fut.result(), None
+            except Exception as e:
+                yield task, None, e
+
+
+# -------------------------------
+# Embed/write stage (main process)
+# -------------------------------
+
+def _write_chunks(vs: VectorStore, doc_id: str, doc_name: str, chunks: List[Dict[str, Any]]) -> int:
+    """Replace `doc_id`'s chunks in the current index with `chunks`, embedded in ingest-sized batches."""
+    vs.delete_document_chunks(doc_id)
+    done = 0
+    for i in range(0, len(chunks), settings.ingest_batch_size):
+        done += vs.add_chunks(doc_id, doc_name, chunks[i:i + settings.ingest_batch_size])
+    return done
+
+
+# -------------------------------
+# Rebuild checkpoint
+# -------------------------------
+
+class RebuildCheckpoint:
+    """
+    Progress of one rebuild under persist_dir/reindex/<target>/:
+    - state.json: target index, source index, config, status
+      ("building" until the switch, then "switched")
+    - done.jsonl: one line per finished (or removed) document, appended and
+      fsynced, so a crash loses at most the document being written
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.dir = os.path.join(self.root(), target)
+        self._state_path = os.path.join(self.dir, "state.json")
+        self._done_path = os.path.join(self.dir, "done.jsonl")
+
+    @staticmethod
+    def root() -> str:
+        return os.path.join(getattr(settings, "persist_dir", "./persistence"), "reindex")
+
+    @classmethod
+    def create(cls, target: str, source: str, config: Dict[str, Any]) -> "RebuildCheckpoint":
+        cp = cls(target)
+        os.makedirs(cp.dir, exist_ok=True)
+        cp.save_state({
+            "target": target,
+            "source": source,
+            "config": config,
+            "status": "building",
+            "started_at": time.time(),
+        })
+        return cp
+
+    @classmethod
+    def find_unfinished(cls) -> Optional["RebuildCheckpoint"]:
+        if not os.path.isdir(cls.root()):
+            return None
+        for name in sorted(os.listdir(cls.root())):
+            cp = cls(name)
+            if cp.state().get("status") == "building":
+                return cp
+        return None
+
+    def state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                return json.load(f) or {}
+        except Exception:
+            return {}
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        tmp = f"{self._state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self._state_path)
+
+    def done(self) -> Dict[str, Dict[str, Any]]:
+        """doc_id -> {"chunks", "updated_at", "page_hashes"?} of documents written to the target."""
+        out: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self._done_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of a crashed run
+                    if rec.get("removed"):
+                        out.pop(rec["doc_id"], None)
+                    else:
+                        out[rec["doc_id"]] = rec
+        except FileNotFoundError:
+            pass
+        return out
+
+    def _append(self, rec: Dict[str, Any]) -> None:
+        with open(self._done_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mark_done(self, doc_id: str, chunks: int, updated_at: float, page_hashes: Optional[List[str]] = None) -> None:
+        rec: Dict[str, Any] = {"doc_id": doc_id, "chunks": chunks, "updated_at": updated_at}
+        if page_hashes is not None:
+            rec["page_hashes"] = page_hashes
+        self._append(rec)
+
+    def mark_removed(self, doc_id: str) -> None:
+        self._append({"doc_id": doc_id, "removed": True})
+
+    def discard(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# -------------------------------
+# Rebuild
+# -------------------------------
+
+def _upload_candidates(rec: Dict[str, Any]) -> List[str]:
+    """
+    PDFs a catalog record may have been ingested from: the recorded
+    `file_path`, then (records written before it was kept) uploads saved
+    as `{uuid}_{doc_name}`.
+    """
+    paths = [rec["file_path"]] if rec.get("file_path") else []
+    name = rec.get("doc_name")
+    if name:
+        upload_dir = getattr(settings, "UPLOAD_DIR", "./uploads")
+        paths.extend(sorted(glob.glob(os.path.join(glob.escape(upload_dir), f"*_{glob.escape(name)}"))))
+    return paths
+
+
+def _rebuild_task(doc_id: str, rec: Dict[str, Any], store: PageTextStore) -> Optional[Dict[str, Any]]:
+    """
+    Where a document's text comes from: the page text store, or (for
+    documents ingested before the store existed) the PDF it was uploaded
+    as, if that file still has the catalog's sha256. None if neither is
+    available.
+    """
+    if store.page_count(doc_id) > 0:
+        return {"doc_id": doc_id, "page_store": store.path}
+    if not rec.get("content_hash"):
+        return None
+    for path in _upload_candidates(rec):
+        if os.path.isfile(path) and _sha256_file(path) == rec["content_hash"]:
+            return {"doc_id": doc_id, "path": path, "content_hash": rec["content_hash"]}
+    return None
+
+
+def rebuild_index(
+    workers: Optional[int] = None,
+    restart: bool = False,
+    allow_missing: bool = False,
+) -> Dict[str, Any]:
+    """
+    Rebuild every catalog document into a new index with the current
+    settings (EMBEDDING_MODEL, chunking) and switch the active index to it.
+    - Text comes from the page text store; PDFs are not re-extracted
+    - Worker processes chunk documents ahead of the embedding stage, which
+      runs in this process (one model copy using all cores)
+    - Progress is checkpointed per document; running it again after a
+      crash resumes the unfinished rebuild (restart=True discards it)
+    - Documents uploaded, replaced or deleted while it ran are caught up
+      before the switch; the last catch-up and the switch run behind the
+      ingestion fence (app.db.indexes.ingest_fence), so servers neither
+      start nor finish writing a document in between
+    - The switch is one atomic pointer replace; ingestion resumes against
+      the new index. The previous index is kept until dropped
+    """
+    t0 = time.perf_counter()
+    config = index_config()
+    source = read_active_index()["name"]
+    store = _page_store()
+
+    cp = RebuildCheckpoint.find_unfinished()
+    if cp is not None and restart:
+        logger.info(f"Discarding unfinished rebuild {cp.target}")
+        drop_index(cp.target)
+        cp = None
+    if cp is not None and cp.state().get("config") != config:
+        raise ReindexError(
+            f"Unfinished rebuild {cp.target} was started with different settings; "
+            f"pass --restart to discard it"
+        )
+    if cp is None:
+        cp = RebuildCheckpoint.create(f"{DEFAULT_INDEX}-{time.strftime('%Y%m%d-%H%M%S')}", source, config)
+        logger.info(f"Rebuilding into new index {cp.target}")
+    else:
+        logger.info(f"Resuming rebuild {cp.target}")
+
+    registry.use_index(cp.target)
+    vs = VectorStore()
+    n_workers = _resolve_workers(workers)
+    done = cp.done()
+    missing: Dict[str, str] = {}
+    failed: Dict[str, str] = {}
+
+    def catch_up() -> int:
+        """One pass over the catalog: drop removed documents, (re)build new or changed ones."""
+        docs = catalog.all()
+        for doc_id in [d for d in done if d not in docs]:
+            vs.delete_document_chunks(doc_id)
+            cp.mark_removed(doc_id)
+            done.pop(doc_id)
+
+        tasks: List[Dict[str, Any]] = []
+        for doc_id, rec in docs.items():
+            if doc_id in missing or doc_id in failed:
+                continue
+            if doc_id in done and done[doc_id]["updated_at"] >= rec.get("updated_at", 0):
+                continue
+            task = _rebuild_task(doc_id, rec, store)
+            if task is None:
+                logger.warning(f"No stored text or matching upload for doc_id={doc_id}; skipping")
+                missing[doc_id] = rec.get("doc_name") or ""
+                continue
+            task["updated_at"] = rec.get("updated_at", 0)
+            tasks.append(task)
+        if not tasks:
+            return 0
+
+        for i, (task, prepared, error) in enumerate(_pipeline(tasks, n_workers), 1):
+            doc_id = task["doc_id"]
+            name = docs[doc_id].get("doc_name") or doc_id
+            t_doc = time.perf_counter()
+            try:
+                if error is not None:
+                    raise error
+                if "pages" in prepared:
+                    store.put_pages(doc_id, prepared["pages"])
+                n = _write_chunks(vs, doc_id, name, prepared["chunks"])
+                vs.optimize_document(doc_id)
+            except Exception as e:
+                logger.error(f"Rebuilding doc_id={doc_id} failed: {e}")
+                failed[doc_id] = str(e)
+                continue
+            hashes = prepared["page_hashes"] if "pages" in prepared else None
+            cp.mark_done(doc_id, n, task["updated_at"], page_hashes=hashes)
+            done[doc_id] = {"chunks": n, "updated_at": task["updated_at"], "page_hashes": hashes}
+            logger.info(f"[{i}/{len(tasks)}] {name}: {n} chunks in {time.perf_counter() - t_doc:.1f}s")
+        return len(tasks)
+
+    for _ in range(_CATCH_UP_ROUNDS):
+        if not catch_up():
+            break
+
+    # Final round and switch with ingestion fenced off, so no document can
+    # land in the old index after it was caught up
+    try:
+        with ingest_fence(settings.reindex_fence_timeout_s):
+            catch_up()
+            summary: Dict[str, Any] = {
+                "index": cp.target,
+                "previous": source,
+                "documents": len(done),
+                "chunks": sum(r["chunks"] for r in done.values()),
+                "missing": missing,
+                "failed": failed,
+            }
+            if (missing or failed) and not allow_missing:
+                raise ReindexError(
+                    f"{len(missing)} documents have no stored text and {len(failed)} failed; "
+                    f"run again to retry, or pass --allow-missing to switch without them"
+                )
+
+            switch_active_index(cp.target, {**config, "previous": source})
+            catalog.put_many({
+                doc_id: {"chunks": r["chunks"], **({"page_hashes": r["page_hashes"]} if r.get("page_hashes") else {})}
+                for doc_id, r in done.items()
+            })
+            cp.save_state({**cp.state(), "status": "switched", "switched_at": time.time()})
+    except TimeoutError as e:
+        raise ReindexError(f"{e}; run again to finish the rebuild")
+    summary["elapsed_s"] = time.perf_counter() - t0
+    logger.info(f"Active index is now {cp.target} ({summary['documents']} documents, {summary['chunks']} chunks)")
+    return summary
+
+
+# -------------------------------
+# Bulk import
+# -------------------------------
+
+def import_directory(path: str, recursive: bool = False, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ingest every PDF under `path` into the active index through the same
+    pipeline as rebuild_index (extraction + chunking in worker processes,
+    embedding here). Files already in the catalog (same sha256) are
+    skipped, so an interrupted import is resumed by running it again.
+    """
+    t0 = time.perf_counter()
+    pattern = os.path.join(path, "**", "*.pdf") if recursive else os.path.join(path, "*.pdf")
+    files = sorted(glob.glob(pattern, recursive=recursive))
+    store = _page_store()
+    vs = VectorStore()
+
+    imported: Dict[str, str] = {}
+    duplicates: Dict[str, str] = {}
+    failed: Dict[str, str] = {}
+    tasks = [{"path": f} for f in files]
+    for i, (task, prepared, error) in enumerate(_pipeline(tasks, _resolve_workers(workers)), 1):
+        filename = os.path.basename(task["path"])
+        if error is None and "duplicate_of" not in prepared:
+            # The same file may appear twice in one import
+            existing = catalog.find_by_hash(prepared["content_hash"])
+            if existing:
+                prepared = {"duplicate_of": existing}
+        if error is None and "duplicate_of" in prepared:
+            duplicates[task["path"]] = prepared["duplicate_of"]
+            continue
+
+        doc_id = prepared["doc_id"] if prepared else None
+        try:
+            if error is not None:
+                raise error
+            with ingest_slot():
+                store.put_pages(doc_id, prepared["pages"])
+                vs = VectorStore()  # the active index may have been switched while waiting
+                n = _write_chunks(vs, doc_id, filename, prepared["chunks"])
+                if n == 0:
+                    raise IngestionError("No chunks were created from PDF")
+                vs.finalize_document(
+                    doc_id, filename, chunks=n,
+                    content_hash=prepared["content_hash"], page_hashes=prepared["page_hashes"],
+                    file_path=task["path"],
+                )
+        except Exception as e:
+            logger.error(f"Importing {task['path']} failed: {e}")
+            failed[task["path"]] = str(e)
+            if doc_id:
+                vs.delete_document_chunks(doc_id)
+                store.delete_document(doc_id)
+            continue
+        imported[task["path"]] = doc_id
+        logger.info(f"[{i}/{len(tasks)}] {filename}: {n} chunks, doc_id={doc_id}")
+
+    return {
+        "index": registry.index_name(),
+        "files": len(files),
+        "imported": imported,
+        "duplicates": duplicates,
+        "failed": failed,
+        "elapsed_s": time.perf_counter() - t0,
+    }
+
+
+# -------------------------------
+# Housekeeping
+# -------------------------------
+
+def drop_index(name: str) -> None:
+    """Delete index `name` (its vectors, BM25 file, page layer and rebuild checkpoint). The active index can't be dropped."""
+    if name == read_active_index()["name"]:
+        raise ReindexError(f"{name} is the active index")
+    paths = index_paths(name)
+    if (settings.vector_backend or "chroma").lower() == "chroma":
+        try:
+            registry.get_chroma_client().delete_collection(paths["collection"])
+        except Exception:
+            pass  # never created
+    shutil.rmtree(paths["mmap_dir"], ignore_errors=True)
+    for path in (paths["bm25"], paths["pages"]):
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+    if name != DEFAULT_INDEX:
+        shutil.rmtree(os.path.dirname(paths["bm25"]), ignore_errors=True)
+    RebuildCheckpoint(name).discard()
+
+
+def build_page_layers(force: bool = False) -> Dict[str, Any]:
+    """
+    Build the page vector layer of the active index for documents that
+    lack one (every document with `force`), from their stored chunk
+    embeddings; nothing is re-embedded.
+    """
+    page_index = registry.get_page_index()
+    if page_index is None:
+        raise ReindexError("HIERARCHICAL_SEARCH is disabled; there is no page layer to build")
+    t0 = time.perf_counter()
+    vs = VectorStore()
+    have = set() if force else set(page_index.doc_ids())
+    built: Dict[str, int] = {}
+    for doc_id in catalog.doc_ids():
+        if doc_id not in have:
+            built[doc_id] = vs.build_page_layer(doc_id)
+            logger.info(f"Page layer of doc_id={doc_id}: {built[doc_id]} pages")
+    return {
+        "index": registry.index_name(),
+        "documents": len(built),
+        "pages": sum(built.values()),
+        "elapsed_s": time.perf_counter() - t0,
+    }
+
+
+def index_status() -> Dict[str, Any]:
+    """Active index, known indexes and any unfinished rebuild."""
+    base = os.path.join(getattr(settings, "persist_dir", "./persistence"), "indexes")
+    names = {DEFAULT_INDEX} | set(os.listdir(base) if os.path.isdir(base) else [])
+    cp = RebuildCheckpoint.find_unfinished()
+    store = registry.get_page_store()
+    page_index = registry.get_page_index()
+    docs = catalog.doc_ids()
+    return {
+        "active": read_active_index(),
+        "indexes": sorted(names),
+        "unfinished_rebuild": None if cp is None else {**cp.state(), "documents_done": len(cp.done())},
+        "documents": len(docs),
+        "documents_with_stored_text": None if store is None else len(set(store.doc_ids()) & set(docs)),
+        "documents_with_page_layer": None if page_index is None else len(set(page_index.doc_ids()) & set(docs)),
+        "config": index_config(),
+    }
@@ -0,0 +1,144 @@
+import re
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+# Weights of the blended re-ranking score (must match retrieve()'s intent)
+W_SIMILARITY = 0.65
+W_KEYWORD = 0.2
+W_FUZZY = 0.15
+HEADING_BOOST = 0.5
+
+
+# -------------------------------
+# Ingest-time term sets
+# -------------------------------
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall((text or "").lower())
+
+
+def term_string(text: str) -> str:
+    """
+    Unique lower-cased terms of a chunk, space-joined.
+    Stored in chunk metadata at ingest so queries don't re-tokenize ~900-char chunks.
+    """
+    return " ".join(sorted(set(tokenize(text))))
+
+
+# -------------------------------
+# Vectorized scorers
+# -------------------------------
+
+def similarity_from_distances(distances: Sequence[float]) -> np.ndarray:
+    """Vectorized normalize_similarity_from_distance()."""
+    d = np.asarray(distances, dtype=np.float64)
+    return np.where((d >= 0.0) & (d <= 1.0), 1.0 - d, 1.0 / (1.0 + d))
+
+
+def keyword_scores(query: str, term_lists: Sequence[Sequence[str]]) -> np.ndarray:
+    """
+    Fraction of unique query terms present in each candidate.
+    Candidates' term sets come precomputed from ingest, so this is one
+    C-level set intersection per candidate gathered into a NumPy array.
+    """
+    n = len(term_lists)
+    q_terms = set(tokenize(query))
+    if n == 0 or not q_terms:
+        return np.zeros(n)
+    hits = np.fromiter((len(q_terms.intersection(terms)) for terms in term_lists), dtype=np.float64, count=n)
+    return hits / max(1, len(q_terms))
+
+
+# Highest code point handled by the fuzzy lookup table (the BMP sentinel slot
+# stays -1, so anything above it never matches through the table).
+_BMP = 0xFFFF
+
+
+def _char_codes(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def fuzzy_scores(query: str, lowered_texts: Sequence[str]) -> np.ndarray:
+    """
+    Character-multiset similarity, i.e. difflib.SequenceMatcher.quick_ratio():
+    2 * |chars(query) ∩ chars(text)| / (len(query) + len(text)).
+    Same intent as the full ratio() (an upper bound on it) at O(n) cost,
+    computed for all candidates with one bincount.
+    """
+    n = len(lowered_texts)
+    q = query.lower()
+    if n == 0 or not q:
+        return np.zeros(n)
+
+    q_chars, q_counts = np.unique(_char_codes(q), return_counts=True)
+    lengths = np.fromiter((len(t) for t in lowered_texts), dtype=np.int64, count=n)
+    codes = _char_codes("".join(lowered_texts))
+    owner = np.repeat(np.arange(n), lengths)
+
+    if q_chars[-1] < _BMP:
+        # Lookup table: code point -> index into q_chars (or -1)
+        lut = np.full(_BMP + 1, -1, dtype=np.int64)
+        lut[q_chars] = np.arange(q_chars.size)
+        idx = lut[np.minimum(codes, _BMP)]
+        match = idx >= 0
+    else:
+        idx = np.minimum(np.searchsorted(q_chars, codes), q_chars.size - 1)
+        match = q_chars[idx] == codes
+
+    m = q_chars.size
+    counts = np.bincount(owner[match] * m + idx[match], minlength=n * m).reshape(n, m)
+    inter = np.minimum(counts, q_counts).sum(axis=1)
+    return (2.0 * inter) / (len(q) + lengths)
+
+
+def heading_boosts(query: str, lowered_texts: Sequence[str]) -> np.ndarray:
+    """
+    HEADING_BOOST for candidates with a line that starts with the query.
+    One regex pass over all candidates joined by newlines; match offsets are
+    mapped back to candidates with searchsorted.
+    """
+    n = len(lowered_texts)
+    q = query.strip().lower()
+    out = np.zeros(n)
+    if n == 0 or not q:
+        return out
+
+    pattern = re.compile(r"(?m)^[^\S\n]*" + re.escape(q))
+    joined = "\n".join(lowered_texts)
+    lengths = np.fromiter((len(t) + 1 for t in lowered_texts), dtype=np.int64, count=n)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    positions = [mt.start() for mt in pattern.finditer(joined)]
+    if positions:
+        owners = np.searchsorted(starts, np.asarray(positions), side="right") - 1
+        out[np.unique(owners)] = HEADING_BOOST
+    return out
+
+
+def score_candidates(
+    query: str,
+    texts: Sequence[str],
+    distances: Sequence[float],
+    metas: Optional[Sequence[Optional[Dict]]] = None,
+) -> np.ndarray:
+    """
+    Blended re-ranking score for every candidate at once:
+    0.65 * similarity + 0.2 * keyword + 0.15 * fuzzy + heading boost.
+    Uses the `terms` stored in chunk metadata when present.
+    """
+    metas = metas or [None] * len(texts)
+    term_lists = []
+    for text, meta in zip(texts, metas):
+        stored = (meta or {}).get("terms")
+        term_lists.append(stored.split() if isinstance(stored, str) else sorted(set(tokenize(text))))
+    lowered = [t.lower() for t in texts]
+
+    return (
+        W_SIMILARITY * similarity_from_distances(distances)
+        + W_KEYWORD * keyword_scores(query, term_lists)
+        + W_FUZZY * fuzzy_scores(query, lowered)
+        + heading_boosts(query, lowered)
+    )
@@ -1,10 +1,18 @@
-from typing import List, Tuple, Dict, Any, Optional
+from typing import AsyncIterator, Iterator, List, Tuple, Dict, Any, Optional, Union
+import logging
 import re
-import difflib
+import time
+import numpy as np
+from app.db.lexical import reciprocal_rank_fusion
 from app.db.vectorstore import VectorStore
-from app.services.embedding import LocalEmbedder
 from app.core.config import settings
-from app.services.llm_providers import get_llm
+from app.core.metrics import metrics, record, span
+from app.core.registry import registry
+from app.services.attribution import attribute_answer
+from app.services.context import approx_count_tokens, pack_context
+from app.services.rerank import score_candidates
+
+logger = logging.getLogger(__name__)
 
 
 # -------------------------------
@@ -88,49 +96,181 @@ def deduplicate_sources(sources: List[dict]) -> List[dict]:
 # Retrieval
 # -------------------------------
 
-def retrieve(query: str, top_k: Optional[int] = None, target_doc_id: Optional[str] = None) -> List[dict]:
+def _fetch_candidates(vs: VectorStore, ids: List[str], query_embedding: List[float]) -> List[Tuple[str, dict, float]]:
     """
-    Generic retrieval. Works for any document (no dataset-specific assumptions).
-    Returns a ranked list of sources with fields:
-      text, doc_id, page, chunk_id, score
+    Load chunks by id and compute their distance to the query the same way
+    the collection does (squared L2 on normalized embeddings).
     """
-    embedder = LocalEmbedder(model_name=settings.embedding_model)
-    query_embedding = embedder.embed_one(query)
-    vs = VectorStore()
-
-    # Scope to active document (or provided doc)
+    res = vs.get_chunks(ids, include_embeddings=True)
+    q = np.asarray(query_embedding, dtype=np.float32)
+    out: List[Tuple[str, dict, float]] = []
+    embeddings = res.get("embeddings")
+    if embeddings is None:
+        embeddings = []
+    for text, meta, emb in zip(res.get("documents") or [], res.get("metadatas") or [], embeddings):
+        if text:
+            diff = np.asarray(emb, dtype=np.float32) - q
+            out.append((text, meta, float(np.dot(diff, diff))))
+    return out
+
+
+# Target that searches every indexed document
+ALL_DOCS = "all"
+
+
+def resolve_scope(
+    vs: VectorStore,
+    target_doc_id: Optional[str] = None,
+    target_doc_ids: Union[List[str], str, None] = None,
+) -> Optional[List[str]]:
+    """
+    Documents a query should search.
+    Returns None for the whole corpus ("all"), otherwise a list of doc ids
+    (empty when nothing is targeted and no document is active).
+    """
+    if target_doc_ids == ALL_DOCS or target_doc_id == ALL_DOCS:
+        return None
+    if target_doc_ids:
+        return list(dict.fromkeys(target_doc_ids))
     doc_id = target_doc_id or vs.get_active_doc()
-    if not doc_id:
-        return []
+    return [doc_id] if doc_id else []
 
-    k_config = top_k or settings.top_k
-    fetch_k = max(k_config * 10, 50)
-    res = vs.query(query_embedding, where={"doc_id": doc_id}, top_k=fetch_k)
 
-    docs, metas, distances = extract_results(res)
-    sources: List[dict] = []
+def _fetch_k(k_config: int) -> int:
+    if settings.hybrid_search:
+        return max(k_config * 2, settings.vector_fetch_k)
+    return max(k_config * 10, 50)
 
-    for doc_text, metadata, dist in zip(docs, metas, distances):
-        if not doc_text:
-            continue
 
-        similarity = normalize_similarity_from_distance(dist)
-        kw_score = keyword_score(query, doc_text)
-        fuzzy_score = difflib.SequenceMatcher(None, query.lower(), doc_text.lower()).ratio()
-        boost = heading_boost(query, doc_text)
+def candidate_depths(k_config: int) -> List[int]:
+    """
+    Vector candidate depths tried for one query, shallowest first.
+    Fixed `_fetch_k` without settings.adaptive_depth; otherwise doubling
+    from max(2k, ADAPTIVE_FETCH_MIN) up to ADAPTIVE_FETCH_MAX.
+    """
+    if not settings.adaptive_depth:
+        return [_fetch_k(k_config)]
+    depth = max(k_config * 2, settings.adaptive_fetch_min)
+    cap = max(depth, settings.adaptive_fetch_max)
+    depths = [depth]
+    while depth < cap:
+        depth = min(depth * 2, cap)
+        depths.append(depth)
+    return depths
+
+
+def needs_wider(distances: List[float], k_config: int, depth: int) -> bool:
+    """
+    True when the candidate scores are flat at the fetch boundary: the last
+    candidate's cosine similarity is within ADAPTIVE_GAP of the k-th, so
+    candidates just past the boundary could still make the top k after
+    re-ranking. A clear drop-off (or a scope with fewer chunks than
+    `depth`) stops. Distances are squared L2 on normalized embeddings, so
+    cosine = 1 - d / 2.
+    """
+    if len(distances) < depth or len(distances) <= k_config:
+        return False
+    return (float(distances[-1]) - float(distances[k_config - 1])) / 2.0 < settings.adaptive_gap
+
 
-        # Combine scores (all generic)
-        final_score = (0.65 * similarity) + (0.2 * kw_score) + (0.15 * fuzzy_score) + boost
+def candidate_search(
+    vs: VectorStore,
+    query_embedding: List[float],
+    scope: Optional[List[str]],
+    k_config: int,
+) -> Tuple[List[str], List[dict], List[float], int]:
+    """
+    Vector candidates at an adaptive depth (see candidate_depths / needs_wider);
+    returns (docs, metas, distances, depth).
+    Scopes covered by the page layer (VectorStore.uses_pages) are searched
+    once through it at the deepest depth, and the depths are then walked
+    over that in-memory ranking.
+    """
+    depths = candidate_depths(k_config)
+    ranked = None
+    if vs.uses_pages(scope):
+        with span("page_search"):
+            ranked = vs.page_search(query_embedding, scope, top_k=depths[-1])
+    for depth in depths:
+        if ranked is None:
+            docs, metas, distances = vs.search(query_embedding, scope, top_k=depth)
+        else:
+            docs, metas, distances = (x[:depth] for x in ranked)
+        if depth == depths[-1] or not needs_wider(distances, k_config, depth):
+            break
+    metrics.inc("rag_candidate_depth_total", depth=depth)
+    return docs, metas, distances, depth
+
+
+def _rank_candidates(
+    vs: VectorStore,
+    query: str,
+    query_embedding: List[float],
+    scope: Optional[List[str]],
+    docs: List[str],
+    metas: List[dict],
+    distances: List[float],
+    k_config: int,
+    rerank_budget_ms: Optional[float] = None,
+) -> List[dict]:
+    """
+    Re-rank one query's vector candidates: add BM25 hits, blend scores,
+    fuse rankings, dedupe, apply the score thresholds and (when a
+    cross-encoder is configured) re-score the top within the budget.
+    """
+    candidates = [(t, m, d) for t, m, d in zip(docs, metas, distances) if t]
+
+    # Lexical leg: BM25 hits the vector search missed are pulled in by id
+    lexical_ids: List[str] = []
+    if settings.hybrid_search:
+        with span("lexical_search"):
+            lexical_ids = [cid for cid, _ in vs.lexical_search(scope, query, top_n=settings.bm25_top_n)]
+            seen = {(m or {}).get("chunk_id") for _, m, _ in candidates}
+            missing = [cid for cid in lexical_ids if cid not in seen]
+            if missing:
+                candidates.extend(_fetch_candidates(vs, missing, query_embedding))
+
+    if not candidates:
+        return []
+    with span("rerank"):
+        sources = _score_and_filter(query, candidates, lexical_ids)
+    if len(sources) == 1:
+        return sources
+    return cross_encode(query, sources, rerank_budget_ms)[:k_config]
+
+
+def _score_and_filter(
+    query: str,
+    candidates: List[Tuple[str, dict, float]],
+    lexical_ids: List[str],
+) -> List[dict]:
+    """
+    Blend scores, fuse with the BM25 ranking, dedupe and threshold.
+    Returns every surviving source best first, or only the top one when it
+    is a confident, short match.
+    """
+    texts, cand_metas, cand_dists = (list(x) for x in zip(*candidates))
+
+    # Combine scores (all generic), vectorized over every candidate
+    final_scores = score_candidates(query, texts, cand_dists, cand_metas)
 
+    sources: List[dict] = []
+    for doc_text, metadata, final_score in zip(texts, cand_metas, final_scores):
         sources.append({
             "text": doc_text,
             "doc_id": (metadata or {}).get("doc_id"),
+            "doc_name": (metadata or {}).get("doc_name"),
             "page": (metadata or {}).get("page"),
+            "page_end": (metadata or {}).get("page_end", (metadata or {}).get("page")),
             "chunk_id": (metadata or {}).get("chunk_id"),
             "score": float(final_score),
         })
 
     sources.sort(key=lambda x: x["score"], reverse=True)
+    if lexical_ids:
+        # Reciprocal rank fusion of the re-ranked vector list and the BM25 list
+        fused = reciprocal_rank_fusion([[s["chunk_id"] for s in sources], lexical_ids], k=settings.rrf_k)
+        sources.sort(key=lambda x: fused.get(x["chunk_id"], 0.0), reverse=True)
     sources = deduplicate_sources(sources)
 
     # Drop weak matches
@@ -142,13 +282,152 @@ def retrieve(query: str, top_k: Optional[int] = None, target_doc_id: Optional[st
         if top["score"] >= 0.85 and len(top["text"]) <= 600:
             return [top]
 
-    return sources[:k_config]
+    return sources
+
+
+def cross_encode(query: str, sources: List[dict], budget_ms: Optional[float] = None) -> List[dict]:
+    """
+    Re-order the top of `sources` with the cross-encoder (RERANKER_MODEL),
+    scoring only as many as fit in `budget_ms` (default RERANK_BUDGET_MS,
+    0 = skip). Scored sources get a `rerank_score` and move ahead of the
+    unscored rest, which keeps its order. No-op without a reranker.
+    """
+    reranker = registry.get_reranker()
+    budget_ms = settings.rerank_budget_ms if budget_ms is None else budget_ms
+    if reranker is None or budget_ms <= 0 or len(sources) < 2:
+        return sources
+    with span("cross_encoder"):
+        ranked, scored = reranker.rerank(
+            query, sources, budget_s=budget_ms / 1000.0, max_candidates=settings.rerank_max_candidates
+        )
+    metrics.inc("rag_cross_encoder_pairs_total", scored)
+    return ranked
+
+
+def retrieve(
+    query: str,
+    top_k: Optional[int] = None,
+    target_doc_id: Optional[str] = None,
+    query_embedding: Optional[List[float]] = None,
+    target_doc_ids: Union[List[str], str, None] = None,
+    rerank_budget_ms: Optional[float] = None,
+) -> List[dict]:
+    """
+    Generic retrieval. Works for any document (no dataset-specific assumptions).
+    Searches the active document unless `target_doc_id`, a list of
+    `target_doc_ids`, or "all" (whole corpus) is given.
+    Pass `query_embedding` when it was already computed (e.g. by the batcher).
+    The vector candidate depth adapts to the query (candidate_search), large
+    documents are searched through their page layer first, and
+    `rerank_budget_ms` overrides RERANK_BUDGET_MS for the cross-encoder.
+    Returns a ranked list of sources with fields:
+      text, doc_id, doc_name, page, chunk_id, score
+    """
+    if query_embedding is None:
+        embedder = registry.get_embedder()
+        with span("embed"):
+            query_embedding = embedder.embed_one(query)
+    vs = VectorStore()
+
+    scope = resolve_scope(vs, target_doc_id, target_doc_ids)
+    if scope is not None and not scope:
+        return []
+
+    k_config = top_k or settings.top_k
+    with span("vector_search"):
+        docs, metas, distances, _ = candidate_search(vs, query_embedding, scope, k_config)
+    return _rank_candidates(vs, query, query_embedding, scope, docs, metas, distances, k_config, rerank_budget_ms)
+
+
+def retrieve_batch(
+    queries: List[str],
+    targets: Optional[List[Union[List[str], str, None]]] = None,
+    top_k: Optional[int] = None,
+    rerank_budget_ms: Optional[float] = None,
+) -> List[Any]:
+    """
+    Retrieve for many queries at once.
+    - All queries are embedded with a single embed_batch call
+    - Queries are grouped by target scope (doc_id, list of doc_ids or "all");
+      each group is one multi-vector collection query (a single call when
+      every query targets the same scope)
+    - Queries whose candidates are flat at the fetch boundary are searched
+      again one depth deeper, together (see candidate_search)
+    - Scopes covered by the page layer are searched per query through it
+    - Re-ranking then runs per query
+    Returns one entry per query, in order: the sources list, or the
+    Exception raised while handling that query.
+    """
+    if not queries:
+        return []
+    targets = targets or [None] * len(queries)
+    vs = VectorStore()
+    k_config = top_k or settings.top_k
+    depths = candidate_depths(k_config)
+
+    embedder = registry.get_embedder()
+    with span("embed"):
+        embeddings = embedder.embed_batch(queries)
+
+    results: List[Any] = [[] for _ in queries]
+    groups: Dict[Any, Tuple[Optional[List[str]], List[int]]] = {}
+    for i, target in enumerate(targets):
+        if isinstance(target, str) and target != ALL_DOCS:
+            scope = resolve_scope(vs, target_doc_id=target)
+        else:
+            scope = resolve_scope(vs, target_doc_ids=target)
+        if scope is not None and not scope:
+            continue
+        key = None if scope is None else tuple(sorted(scope))
+        groups.setdefault(key, (scope, []))[1].append(i)
+
+    for scope, idxs in groups.values():
+        candidates: Dict[int, Tuple[List[str], List[dict], List[float]]] = {}
+        pending = idxs
+        try:
+            if vs.uses_pages(scope):
+                # Page-layer searches are per query (each picks its own pages)
+                for i in idxs:
+                    candidates[i] = candidate_search(vs, embeddings[i], scope, k_config)[:3]
+                pending = []
+            for depth in depths if pending else []:
+                with span("vector_search"):
+                    res = vs.query_many([embeddings[i] for i in pending], doc_ids=scope, top_k=depth)
+                wider = []
+                for row, i in enumerate(pending):
+                    found = tuple((res.get(key) or [])[row] for key in ("documents", "metadatas", "distances"))
+                    candidates[i] = found
+                    if depth != depths[-1] and needs_wider(found[2], k_config, depth):
+                        wider.append(i)
+                    else:
+                        metrics.inc("rag_candidate_depth_total", depth=depth)
+                pending = wider
+                if not pending:
+                    break
+        except Exception as e:
+            for i in idxs:
+                results[i] = e
+            continue
+
+        for i in idxs:
+            try:
+                docs, metas, distances = candidates[i]
+                results[i] = _rank_candidates(
+                    vs, queries[i], embeddings[i], scope, docs, metas, distances, k_config, rerank_budget_ms
+                )
+            except Exception as e:
+                results[i] = e
+
+    return results
 
 
 # -------------------------------
 # Answering
 # -------------------------------
 
+NOT_FOUND = "Not found in document."
+
+
 def _build_context(sources: List[dict], max_ctx_chunks: int) -> str:
     parts = []
     for idx, src in enumerate(sources[:max_ctx_chunks], start=1):
@@ -158,54 +437,98 @@ def _build_context(sources: List[dict], max_ctx_chunks: int) -> str:
     return "\n\n".join(parts)
 
 
-def _filter_sources_by_answer(answer: str, ranked_sources: List[dict]) -> List[dict]:
+def _source_embeddings(sources: List[dict]) -> Optional[np.ndarray]:
+    """Stored chunk embeddings of `sources`, in order (None if any is unavailable)."""
+    ids = [s.get("chunk_id") for s in sources]
+    if not ids or not all(ids):
+        return None
+    try:
+        res = VectorStore().get_chunks(ids, include_embeddings=True)
+    except Exception:
+        logger.warning("Could not load chunk embeddings for context packing", exc_info=True)
+        return None
+    embeddings = res.get("embeddings")
+    if embeddings is None:
+        return None
+    by_id = dict(zip(res.get("ids") or [], embeddings))
+    if any(cid not in by_id for cid in ids):
+        return None
+    return np.asarray([by_id[cid] for cid in ids], dtype=np.float32)
+
+
+def select_context(query: str, sources: List[dict], source_embeddings: Optional[np.ndarray] = None) -> List[dict]:
     """
-    Keep only chunks that actually support the generated answer.
-    Generic: uses overlap/fuzzy matching, no dataset-specific rules.
+    Sources that go into the prompt.
+    With settings.context_packing: MMR-diversified and trimmed to the
+    CONTEXT_MAX_TOKENS budget (see app.services.context.pack_context);
+    otherwise the top max(3, top_k) chunks in full.
+    """
+    max_chunks = max(3, settings.top_k)
+    if not settings.context_packing or not sources:
+        return sources[:max_chunks]
+
+    count_tokens = getattr(registry.get_embedder(), "count_tokens", None) or approx_count_tokens
+    with span("context_pack"):
+        packed, stats = pack_context(
+            query,
+            sources,
+            source_embeddings if source_embeddings is not None else _source_embeddings(sources),
+            max_tokens=settings.context_max_tokens,
+            max_chunks=max_chunks,
+            count_tokens=count_tokens,
+            lambda_=settings.mmr_lambda,
+        )
+    naive, used = stats["naive_tokens"], stats["packed_tokens"]
+    metrics.inc("rag_context_tokens_total", naive, kind="naive")
+    metrics.inc("rag_context_tokens_total", used, kind="packed")
+    logger.info(
+        f"Context packed: {len(packed)}/{len(sources)} sources, {used} tokens "
+        f"(full chunks: {naive}, saved {naive - used})"
+    )
+    return packed
+
+
+def attribute_sources(
+    answer: str,
+    sources: List[dict],
+    source_embeddings: Optional[np.ndarray] = None,
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Sources supporting the answer, plus per-sentence citations
+    (see app.services.attribution.attribute_answer).
+    Falls back to the top source when no sentence is attributed.
     """
-    if not answer:
-        return ranked_sources[:1] if ranked_sources else []
-
-    ans_norm = " ".join(answer.lower().split())
     supporting: List[dict] = []
-
-    for s in ranked_sources:
-        text_norm = " ".join((s.get("text") or "").lower().split())
-        if text_norm and (text_norm in ans_norm or ans_norm in text_norm):
-            supporting.append(s)
-            continue
-        if difflib.SequenceMatcher(None, ans_norm, text_norm).ratio() >= 0.72:
-            supporting.append(s)
-
-    if supporting:
-        supporting.sort(key=lambda x: x["score"], reverse=True)
-        return supporting[:2]
-
-    return ranked_sources[:1] if ranked_sources else []
+    citations: List[dict] = []
+    if answer and answer != NOT_FOUND:
+        with span("attribution"):
+            supporting, citations = attribute_answer(
+                answer,
+                sources,
+                registry.get_embedder().embed_batch,
+                source_embeddings=source_embeddings,
+                min_similarity=settings.attribution_min_similarity,
+            )
+    if not supporting:
+        return (sources[:1] if sources else []), citations
+    return supporting, citations
 
 
 def refine_answer(raw_answer: str) -> str:
     ans = (raw_answer or "").strip()
     if not ans:
-        return "Not found in document."
+        return NOT_FOUND
     lowered = ans.lower()
     if lowered.startswith("not found") or "no relevant information" in lowered:
-        return "Not found in document."
+        return NOT_FOUND
     return ans
 
 
-def answer_with_context(query: str, sources: List[dict]):
-    """
-    Generate an answer using only retrieved context.
-    Dataset-agnostic. If no relevant context, return "Not found in document."
-    """
-    if not sources:
-        return "Not found in document.", []
+def build_prompt(query: str, sources: List[dict], source_embeddings: Optional[np.ndarray] = None) -> str:
+    selected = select_context(query, sources, source_embeddings)
+    context = _build_context(selected, max_ctx_chunks=len(selected))
 
-    max_ctx = max(3, settings.top_k)
-    context = _build_context(sources, max_ctx_chunks=max_ctx)
-
-    prompt = f"""
+    return f"""
 You are a retrieval-based assistant.
 Answer the question strictly using ONLY the provided context.
 If the context is partially relevant, answer from it.
@@ -218,9 +541,95 @@ Context:
 {context}
 """.strip()
 
-    llm = get_llm()
-    raw_answer = llm.generate(prompt)
+
+def _prompt_and_embeddings(query: str, sources: List[dict]) -> Tuple[str, Optional[np.ndarray]]:
+    """Prompt plus the sources' stored embeddings, loaded once for packing and attribution."""
+    embeddings = _source_embeddings(sources)
+    return build_prompt(query, sources, embeddings), embeddings
+
+
+def answer_with_context(query: str, sources: List[dict]):
+    """
+    Generate an answer using only retrieved context.
+    Dataset-agnostic. If no relevant context, return "Not found in document."
+    Returns (answer, supporting_sources, citations).
+    """
+    if not sources:
+        return NOT_FOUND, [], []
+
+    prompt, embeddings = _prompt_and_embeddings(query, sources)
+
+    llm = registry.get_llm()
+    with span("llm"):
+        raw_answer = llm.generate(prompt)
     answer = refine_answer(raw_answer)
 
-    supporting_sources = _filter_sources_by_answer(answer, sources)
-    return answer, supporting_sources
+    supporting_sources, citations = attribute_sources(answer, sources, embeddings)
+    return answer, supporting_sources, citations
+
+
+def _final(answer: str, sources: List[dict], embeddings: Optional[np.ndarray]) -> Dict[str, Any]:
+    supporting_sources, citations = attribute_sources(answer, sources, embeddings)
+    return {"answer": answer, "sources": supporting_sources, "citations": citations}
+
+
+def stream_answer_with_context(query: str, sources: List[dict]) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of answer_with_context, as (event, data) pairs:
+      ("sources", [...])                        retrieved sources, sent before generation
+      ("token", "text")                         answer text as the LLM produces it
+      ("final", {answer, sources, citations})   refined answer + supporting sources
+                                                and per-sentence citations
+    """
+    yield "sources", sources
+    if not sources:
+        yield "final", {"answer": NOT_FOUND, "sources": [], "citations": []}
+        return
+
+    prompt, embeddings = _prompt_and_embeddings(query, sources)
+    llm = registry.get_llm()
+
+    parts: List[str] = []
+    t0 = time.perf_counter()
+    for piece in llm.stream(prompt):
+        if not parts:
+            record("llm_first_token", time.perf_counter() - t0)
+        parts.append(piece)
+        yield "token", piece
+    record("llm", time.perf_counter() - t0)
+
+    yield "final", _final(refine_answer("".join(parts)), sources, embeddings)
+
+
+async def answer_with_context_async(query: str, sources: List[dict]):
+    """answer_with_context through the async provider layer (deadlines, retries, concurrency cap)."""
+    if not sources:
+        return NOT_FOUND, [], []
+
+    prompt, embeddings = await registry.get_query_executor().run(_prompt_and_embeddings, query, sources)
+    with span("llm"):
+        raw_answer = await registry.get_async_llm().agenerate(prompt)
+    answer = refine_answer(raw_answer)
+
+    supporting_sources, citations = await registry.get_query_executor().run(attribute_sources, answer, sources, embeddings)
+    return answer, supporting_sources, citations
+
+
+async def astream_answer_with_context(query: str, sources: List[dict]) -> AsyncIterator[Tuple[str, Any]]:
+    """Async counterpart of stream_answer_with_context (same events)."""
+    yield "sources", sources
+    if not sources:
+        yield "final", {"answer": NOT_FOUND, "sources": [], "citations": []}
+        return
+
+    prompt, embeddings = await registry.get_query_executor().run(_prompt_and_embeddings, query, sources)
+    parts: List[str] = []
+    t0 = time.perf_counter()
+    async for piece in registry.get_async_llm().astream(prompt):
+        if not parts:
+            record("llm_first_token", time.perf_counter() - t0)
+        parts.append(piece)
+        yield "token", piece
+    record("llm", time.perf_counter() - t0)
+
+    yield "final", await registry.get_query_executor().run(_final, refine_answer("".join(parts)), sources, embeddings)
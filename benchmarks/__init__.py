@@ -0,0 +1 @@
+# Benchmarks and offline evaluation scripts. Run modules with `python -m benchmarks.<name>`.
@@ -0,0 +1,107 @@
+"""
+Compare embedding backends: torch vs ONNX (fp32) vs ONNX dynamic int8.
+
+    python -m benchmarks.embedding_backends --texts 512 --threads 4
+
+Each backend runs in its own spawned process so peak RSS is measured in
+isolation. Reports load time, batch throughput, single-query latency
+percentiles, peak RSS and the cosine agreement of its embeddings with the
+torch backend (min / mean over the sample texts).
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import resource
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _sample_texts(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    words = ("pump valve sensor pressure error code reset warranty torque bolt manual section "
+             "install remove replace check inspect filter motor voltage current fault alarm").split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(8, 120))) for _ in range(n)]
+
+
+def _build(backend: str, threads: int):
+    if backend == "torch":
+        from app.services.embedding import LocalEmbedder
+        return LocalEmbedder(settings.embedding_model, threads=threads)
+    from app.services.onnx_embedding import OnnxEmbedder
+    return OnnxEmbedder.load_or_export(
+        settings.embedding_model,
+        cache_dir=os.path.join(settings.persist_dir, "onnx"),
+        quantize=backend == "onnx-int8",
+        threads=threads,
+        min_cosine=0.0,  # measured and reported here instead
+    )
+
+
+def _run_backend(backend: str, texts: List[str], queries: int, threads: int, out: "mp.Queue") -> None:
+    t0 = time.perf_counter()
+    emb = _build(backend, threads)
+    emb.warm_up()
+    load_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    vectors = emb.embed_batch(texts)
+    batch_s = time.perf_counter() - t0
+
+    latencies = []
+    for text in texts[:queries]:
+        t0 = time.perf_counter()
+        emb.embed_one(text)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    out.put({
+        "backend": backend,
+        "load_s": load_s,
+        "batch_texts_per_s": len(texts) / batch_s if batch_s else float("inf"),
+        "single_ms_p50": float(np.percentile(latencies, 50)),
+        "single_ms_p95": float(np.percentile(latencies, 95)),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "vectors": vectors,
+    })
+
+
+def run(n_texts: int, queries: int, threads: int, backends=BACKENDS) -> Dict[str, Dict]:
+    texts = _sample_texts(n_texts)
+    ctx = mp.get_context("spawn")
+    results: Dict[str, Dict] = {}
+    for backend in backends:
+        q = ctx.Queue()
+        proc = ctx.Process(target=_run_backend, args=(backend, texts, queries, threads, q))
+        proc.start()
+        results[backend] = q.get()
+        proc.join()
+
+    reference = np.asarray(results["torch"]["vectors"]) if "torch" in results else None
+    for res in results.values():
+        vecs = np.asarray(res.pop("vectors"))
+        if reference is not None:
+            cos = (reference * vecs).sum(axis=1)  # both L2-normalized
+            res["cosine_vs_torch_min"] = float(cos.min())
+            res["cosine_vs_torch_mean"] = float(cos.mean())
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--texts", type=int, default=512)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--threads", type=int, default=settings.embedding_threads)
+    ap.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = ap.parse_args()
+    print(json.dumps(run(args.texts, args.queries, args.threads, args.backends), indent=2))
+
+
+if __name__ == "__main__":
+    main()
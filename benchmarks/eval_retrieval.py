@@ -0,0 +1,197 @@
+"""
+Retrieval evaluation: recall@k and latency of candidate-depth, page-layer
+and reranking settings.
+
+    python -m benchmarks.eval_retrieval --pages 300 --questions 100 --k 5
+    python -m benchmarks.eval_retrieval --pages 3000 --top-pages 8 16 32
+    python -m benchmarks.eval_retrieval --reranker fake --budgets 20 50 150
+    python -m benchmarks.eval_retrieval --labels labels.jsonl --reranker cross-encoder/ms-marco-MiniLM-L-6-v2
+
+Without --labels a synthetic PDF is generated and ingested into a throw-away
+PERSIST_DIR with the fake embedder (--real-embedder for EMBEDDING_MODEL).
+With --labels, queries run against the existing index in PERSIST_DIR; each
+line is {"question", "page"[, "doc_id"]} (doc_id omitted = whole corpus).
+
+Configurations, each over the same pre-computed query embeddings:
+- fixed:              the fixed candidate depth (ADAPTIVE_DEPTH=false)
+- adaptive:           adaptive candidate depth
+- adaptive+pages@N    two-level search through the page layer, N pages
+                      picked per query, per --top-pages (the page-count
+                      threshold is lifted, so any document qualifies)
+- adaptive+rerank@Nms cross-encoder within an N ms budget, per --budgets
+                      (--reranker fake uses a per-pair delay of --fake-pair-ms)
+All but the pages@N configurations search flat. Per configuration:
+recall@1, recall@k, MRR@k, retrieve latency percentiles (search +
+re-ranking, query embedding excluded), the mean vector candidate depth,
+the mean number of chunks a page-layer search scored and the mean number
+of cross-encoder pairs scored per query.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import _percentiles
+
+
+def _synthetic_labels(pages: int, questions: int, seed: int, real_embedder: bool) -> List[Dict[str, Any]]:
+    workdir = tempfile.mkdtemp(prefix="rag-eval-")
+    os.environ["PERSIST_DIR"] = os.path.join(workdir, "persistence")
+    os.environ.setdefault("VECTOR_BACKEND", "mmap")
+    os.environ["EMBED_CACHE_ENABLED"] = "false"
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.chdir(workdir)
+
+    from app.core.registry import registry
+    from app.services.ingestion import ingest_pdf
+    from benchmarks.fakes import FakeEmbedder
+    from benchmarks.synthetic import make_pdf
+
+    if not real_embedder:
+        registry.override("embedder", FakeEmbedder())
+    pdf_path = os.path.join(workdir, f"synthetic_{pages}p.pdf")
+    labels = make_pdf(pdf_path, pages, seed=seed)
+    doc_id = ingest_pdf(pdf_path, os.path.basename(pdf_path))["doc_id"]
+    picked = labels[:: max(1, len(labels) // questions)][:questions]
+    return [{"question": l["question"], "page": l["page"], "doc_id": doc_id} for l in picked]
+
+
+def _load_labels(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _evaluate(labels: List[Dict[str, Any]], embeddings: List[List[float]], k: int) -> Dict[str, Any]:
+    from app.core.metrics import metrics
+    from app.services.retrieval import candidate_depths, retrieve
+
+    metrics.reset()
+    hits_1 = hits_k = 0
+    rr = 0.0
+    latencies = []
+    for label, emb in zip(labels, embeddings):
+        target = label.get("doc_id")
+        t0 = time.perf_counter()
+        sources = retrieve(
+            label["question"],
+            top_k=k,
+            query_embedding=emb,
+            target_doc_id=target,
+            target_doc_ids=None if target else "all",
+        )
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        # A chunk counts as a hit when its page span covers the labeled page
+        covers = [s.get("page") <= label["page"] <= (s.get("page_end") or s.get("page")) for s in sources[:k]]
+        hits_1 += int(covers[:1] == [True])
+        hits_k += int(any(covers))
+        if any(covers):
+            rr += 1.0 / (covers.index(True) + 1)
+
+    n = max(1, len(labels))
+    depths = {d: metrics.value("rag_candidate_depth_total", depth=d) for d in candidate_depths(k)}
+    return {
+        "recall_at_1": hits_1 / n,
+        f"recall_at_{k}": hits_k / n,
+        f"mrr_at_{k}": rr / n,
+        "retrieve_latency_ms": _percentiles(latencies),
+        "mean_candidate_depth": sum(d * c for d, c in depths.items()) / max(1.0, sum(depths.values())),
+        "depth_histogram": {str(d): int(c) for d, c in depths.items() if c},
+        "mean_page_search_chunks": metrics.value("rag_page_search_chunks_total") / n,
+        "mean_cross_encoder_pairs": metrics.value("rag_cross_encoder_pairs_total") / n,
+    }
+
+
+def _reranker(name: str, fake_pair_ms: float):
+    from app.services.cross_encoder import CrossEncoderReranker
+    from benchmarks.fakes import FakeCrossEncoder
+
+    if name == "fake":
+        reranker = CrossEncoderReranker(model=FakeCrossEncoder(fake_pair_ms))
+    else:
+        reranker = CrossEncoderReranker(name)
+    reranker.warm_up()
+    return reranker
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.labels:
+        labels = _load_labels(args.labels)
+    else:
+        labels = _synthetic_labels(args.pages, args.questions, args.seed, args.real_embedder)
+
+    from app.core.config import settings
+    from app.core.registry import registry
+
+    embedder = registry.get_embedder()
+    embeddings = embedder.embed_batch([l["question"] for l in labels])
+
+    # (name, adaptive depth, rerank budget, pages picked)
+    configs: List[tuple] = [("fixed", False, None, None), ("adaptive", True, None, None)]
+    configs += [(f"adaptive+pages@{p}", True, None, p) for p in args.top_pages]
+    reranker = None
+    if args.reranker:
+        reranker = _reranker(args.reranker, args.fake_pair_ms)
+        configs += [(f"adaptive+rerank@{b:g}ms", True, b, None) for b in args.budgets]
+
+    page_index = registry.get_page_index() if args.top_pages else None
+    layered = set(page_index.doc_ids()) if page_index is not None else set()
+    if args.top_pages and not {l["doc_id"] for l in labels if l.get("doc_id")} <= layered:
+        print("[eval] some documents have no page layer (python -m app.reindex pages)", file=sys.stderr)
+
+    results: Dict[str, Any] = {}
+    for name, adaptive, budget, top_pages in configs:
+        print(f"[eval] {name} ...", file=sys.stderr)
+        settings.adaptive_depth = adaptive
+        settings.hierarchical_search = top_pages is not None
+        settings.hierarchical_min_pages = 0
+        settings.hierarchical_top_pages = top_pages or settings.hierarchical_top_pages
+        settings.reranker_model = "eval" if budget is not None else ""
+        settings.rerank_budget_ms = budget or 0
+        if reranker is not None:
+            registry.override("reranker", reranker)
+        results[name] = _evaluate(labels, embeddings, args.k)
+
+    return {
+        "config": {
+            "questions": len(labels),
+            "k": args.k,
+            "embedder": getattr(embedder, "model_name", "unknown"),
+            "reranker": getattr(reranker, "model_name", None),
+            "vector_backend": settings.vector_backend,
+            "hybrid_search": settings.hybrid_search,
+            "adaptive_fetch_min": settings.adaptive_fetch_min,
+            "adaptive_fetch_max": settings.adaptive_fetch_max,
+            "adaptive_gap": settings.adaptive_gap,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--labels", help="JSONL of {question, page[, doc_id]} against PERSIST_DIR's index")
+    ap.add_argument("--pages", type=int, default=300, help="synthetic PDF size (without --labels)")
+    ap.add_argument("--questions", type=int, default=100)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--reranker", help='cross-encoder model name, or "fake"')
+    ap.add_argument("--top-pages", type=int, nargs="*", default=[8, 16, 32], help="pages picked by the page layer")
+    ap.add_argument("--budgets", type=float, nargs="+", default=[20.0, 50.0, 150.0], help="rerank budgets in ms")
+    ap.add_argument("--fake-pair-ms", type=float, default=2.0, help="per-pair delay of the fake reranker")
+    ap.add_argument("--real-embedder", action="store_true", help="use EMBEDDING_MODEL instead of the fake")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write JSON here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    text = json.dumps(run(args), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
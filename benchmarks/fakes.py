@@ -0,0 +1,76 @@
+"""Deterministic stand-ins for the model-backed components, for offline benchmarks."""
+import re
+import time
+import zlib
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from app.services.llm_providers import FakeLLM
+
+_WORD_RE = re.compile(r"\w+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class FakeEmbedder:
+    """
+    Hashing-trick bag-of-words embedder with the LocalEmbedder interface.
+    Deterministic across processes (crc32), L2-normalized, and lexically
+    meaningful, so retrieval quality numbers are not pure noise.
+    """
+
+    def __init__(self, dim: int = 384, model_name: str = "fake-hash-embedder", max_seq_length: int = 256):
+        self.dim = dim
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for tok in _WORD_RE.findall(text.lower()):
+            h = zlib.crc32(tok.encode("utf-8"))
+            vec[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            vec[0] = 1.0
+            norm = 1.0
+        return vec / norm
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Words and punctuation marks, a rough stand-in for word-pieces."""
+        return [len(_TOKEN_RE.findall(t)) for t in texts]
+
+    def token_counter(self):
+        """count_tokens for worker processes (this embedder pickles as-is)."""
+        return self.count_tokens
+
+    def warm_up(self) -> None:
+        return None
+
+    def embed_one(self, text: str) -> List[float]:
+        return self._vector(text).tolist()
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(t).tolist() for t in texts]
+
+
+class FakeCrossEncoder:
+    """
+    CrossEncoder.predict stand-in: the fraction of query words found in the
+    text, with a fixed per-pair delay so latency budgets behave as they
+    would with a real model.
+    """
+
+    def __init__(self, delay_ms_per_pair: float = 2.0):
+        self.model_name = "fake-cross-encoder"
+        self.delay_s = delay_ms_per_pair / 1000.0
+
+    def predict(self, pairs: Sequence[Tuple[str, str]], **kwargs) -> List[float]:
+        time.sleep(self.delay_s * len(pairs))
+        out = []
+        for query, text in pairs:
+            q = set(_WORD_RE.findall(query.lower()))
+            out.append(len(q & set(_WORD_RE.findall(text.lower()))) / max(1, len(q)))
+        return out
+
+
+__all__ = ["FakeCrossEncoder", "FakeEmbedder", "FakeLLM"]
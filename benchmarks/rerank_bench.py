@@ -0,0 +1,125 @@
+"""
+Micro-benchmark: legacy per-candidate re-ranking loop vs the vectorized scorer.
+
+    python -m benchmarks.rerank_bench --candidates 50 --queries 200
+
+Reports time per query for both paths and how closely the rankings agree
+(top-k overlap and Spearman correlation). Keyword and heading components are
+expected to match exactly; fuzzy uses quick_ratio, so small score shifts are
+normal but the ranking should be essentially unchanged.
+"""
+import argparse
+import difflib
+import json
+import random
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from app.services.rerank import (
+    heading_boosts,
+    keyword_scores,
+    score_candidates,
+    term_string,
+    tokenize,
+)
+from app.services.retrieval import heading_boost, keyword_score, normalize_similarity_from_distance
+
+
+def _vocab(rng: random.Random, size: int = 2000) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def _make_case(rng: random.Random, vocab: List[str], n_candidates: int, chunk_chars: int) -> Tuple[str, List[str], List[float]]:
+    query_words = rng.sample(vocab, rng.randint(2, 6))
+    query = " ".join(query_words)
+    texts = []
+    for _ in range(n_candidates):
+        words = []
+        while sum(len(w) + 1 for w in words) < chunk_chars:
+            words.append(rng.choice(query_words) if rng.random() < 0.05 else rng.choice(vocab))
+        text = " ".join(words)
+        if rng.random() < 0.05:
+            text = query + " " + text  # heading-style hit
+        texts.append(text)
+    distances = [rng.uniform(0.2, 1.4) for _ in texts]
+    return query, texts, distances
+
+
+def legacy_scores(query: str, texts: List[str], distances: List[float]) -> np.ndarray:
+    """The original retrieve() loop, kept verbatim for comparison."""
+    out = []
+    for doc_text, dist in zip(texts, distances):
+        similarity = normalize_similarity_from_distance(dist)
+        kw_score = keyword_score(query, doc_text)
+        fuzzy_score = difflib.SequenceMatcher(None, query.lower(), doc_text.lower()).ratio()
+        boost = heading_boost(query, doc_text)
+        out.append((0.65 * similarity) + (0.2 * kw_score) + (0.15 * fuzzy_score) + boost)
+    return np.asarray(out)
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    ra = np.argsort(np.argsort(a))
+    rb = np.argsort(np.argsort(b))
+    if ra.std() == 0 or rb.std() == 0:
+        return 1.0
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def run(n_queries: int, n_candidates: int, chunk_chars: int, top_k: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    vocab = _vocab(rng)
+    cases = [_make_case(rng, vocab, n_candidates, chunk_chars) for _ in range(n_queries)]
+    # Ingest-time work is not part of the query path
+    metas = [[{"terms": term_string(t)} for t in texts] for _, texts, _ in cases]
+
+    t0 = time.perf_counter()
+    legacy = [legacy_scores(q, texts, d) for q, texts, d in cases]
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fast = [score_candidates(q, texts, d, m) for (q, texts, d), m in zip(cases, metas)]
+    t_fast = time.perf_counter() - t0
+
+    overlaps, spearmans, component_diff = [], [], 0.0
+    for (q, texts, _), a, b in zip(cases, legacy, fast):
+        top_a = set(np.argsort(-a)[:top_k])
+        top_b = set(np.argsort(-b)[:top_k])
+        overlaps.append(len(top_a & top_b) / top_k)
+        spearmans.append(_spearman(a, b))
+
+        kw_old = np.array([keyword_score(q, t) for t in texts])
+        kw_new = keyword_scores(q, [sorted(set(tokenize(t))) for t in texts])
+        hb_old = np.array([heading_boost(q, t) for t in texts])
+        hb_new = heading_boosts(q, [t.lower() for t in texts])
+        component_diff = max(component_diff, float(np.abs(kw_old - kw_new).max()), float(np.abs(hb_old - hb_new).max()))
+
+    return {
+        "queries": n_queries,
+        "candidates": n_candidates,
+        "chunk_chars": chunk_chars,
+        "legacy_ms_per_query": 1000.0 * t_legacy / n_queries,
+        "vectorized_ms_per_query": 1000.0 * t_fast / n_queries,
+        "speedup": t_legacy / t_fast if t_fast else float("inf"),
+        f"top{top_k}_overlap_mean": float(np.mean(overlaps)),
+        f"top{top_k}_overlap_min": float(np.min(overlaps)),
+        "spearman_mean": float(np.mean(spearmans)),
+        "keyword_heading_max_abs_diff": component_diff,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--candidates", type=int, default=50)
+    ap.add_argument("--chunk-chars", type=int, default=900)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    print(json.dumps(run(args.queries, args.candidates, args.chunk_chars, args.top_k, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
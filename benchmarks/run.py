@@ -0,0 +1,363 @@
+"""
+Reproducible benchmark suite for the ingestion and query paths.
+
+    python -m benchmarks.run --pages 200 --concurrency 1 4 16 --out bench.json
+
+Everything runs against a throw-away PERSIST_DIR with a deterministic fake
+embedder and fake LLM by default (use --real-embedder to benchmark the
+configured model). Scenarios:
+- extract:  pages/s through iter_pages, single process vs process pool
+- embed:    chunks/s through the configured chunker + embed_batch
+- insert:   chunks/s upserted into the vector backend (scratch doc id)
+- ingest:   end-to-end ingest_pdf, pages/s and chunks/s
+- query:    /api/query latency p50/p95/p99 and req/s per concurrency level
+- mixed:    /api/query latency at the highest concurrency level while a
+            burst of uploads is accepted and ingested, plus upload statuses
+- recall:   recall@1 and recall@k on the labeled synthetic questions
+- context:  prompt context tokens, packed vs full top chunks, and how often
+            the labeled answer survives packing
+Results are emitted as JSON so runs can be diffed. A scenario that cannot
+run (missing dependency, ...) reports {"error": ...} instead of aborting.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "mean": statistics.fmean(ordered)}
+
+
+def _prepare_environment(workdir: str, llm_delay_ms: float, backend: str) -> None:
+    """Must run before anything under `app` is imported (settings read env at import)."""
+    os.environ["PERSIST_DIR"] = os.path.join(workdir, "persistence")
+    os.environ["VECTOR_BACKEND"] = backend
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_TOKEN_DELAY_MS"] = str(llm_delay_ms)
+    os.environ["EMBED_CACHE_ENABLED"] = "false"  # measure real encode cost
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"  # the sweep repeats questions
+    os.environ["PRELOAD_MODELS"] = "false"
+    os.environ["PDF_PARALLEL_MIN_PAGES"] = "0"
+    os.chdir(workdir)  # uploads are written to ./uploads
+
+
+def _scenario(results: Dict[str, Any], name: str, fn: Callable[[], Dict[str, Any]]) -> None:
+    print(f"[bench] {name} ...", file=sys.stderr)
+    try:
+        results[name] = fn()
+    except Exception as e:
+        results[name] = {"error": f"{type(e).__name__}: {e}"}
+
+
+# -------------------------------
+# Scenarios
+# -------------------------------
+
+def bench_extract(pdf_path: str, workers: int) -> Dict[str, Any]:
+    from app.services.pdf import iter_pages
+
+    out = {}
+    for label, n in (("single_process", 1), (f"pool_{workers}", workers)):
+        t0 = time.perf_counter()
+        pages = sum(1 for _ in iter_pages(pdf_path, workers=n, ordered=True))
+        elapsed = time.perf_counter() - t0
+        out[label] = {"pages": pages, "seconds": elapsed, "pages_per_s": pages / elapsed}
+    return out
+
+
+def _chunks(pdf_path: str) -> List[Dict[str, Any]]:
+    from app.services.ingestion import build_chunker
+    from app.services.pdf import iter_pages
+
+    chunker = build_chunker()
+    chunks = []
+    for page, text in iter_pages(pdf_path, ordered=True):
+        chunks.extend(chunker.feed(page, text))
+    chunks.extend(chunker.flush())
+    return chunks
+
+
+def bench_embed(pdf_path: str) -> Dict[str, Any]:
+    from app.core.registry import registry
+
+    chunks = _chunks(pdf_path)
+    texts = [c["text"] for c in chunks]
+    embedder = registry.get_embedder()
+    t0 = time.perf_counter()
+    embedder.embed_batch(texts)
+    elapsed = time.perf_counter() - t0
+    return {"chunks": len(texts), "seconds": elapsed, "chunks_per_s": len(texts) / elapsed}
+
+
+def bench_insert(pdf_path: str, batch_size: int) -> Dict[str, Any]:
+    from app.core.registry import registry
+
+    chunks = _chunks(pdf_path)
+    texts = [c["text"] for c in chunks]
+    embeddings = registry.get_embedder().embed_batch(texts)
+    backend = registry.get_vector_backend()
+    try:
+        t0 = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            backend.upsert(
+                [f"bench-insert:{j}" for j in range(i, min(i + batch_size, len(texts)))],
+                texts[i:i + batch_size],
+                [{"doc_id": "bench-insert", "page": c["page"]} for c in chunks[i:i + batch_size]],
+                embeddings[i:i + batch_size],
+            )
+        elapsed = time.perf_counter() - t0
+    finally:
+        backend.delete_document("bench-insert")
+    return {"chunks": len(texts), "batch_size": batch_size, "seconds": elapsed, "inserts_per_s": len(texts) / elapsed}
+
+
+def bench_ingest(pdf_path: str) -> Dict[str, Any]:
+    from app.services.ingestion import ingest_pdf
+
+    t0 = time.perf_counter()
+    result = ingest_pdf(pdf_path, os.path.basename(pdf_path))
+    elapsed = time.perf_counter() - t0
+    return {
+        **result,
+        "seconds": elapsed,
+        "pages_per_s": result["pages"] / elapsed,
+        "chunks_per_s": result["chunks"] / elapsed,
+    }
+
+
+def _client():
+    import httpx
+    from app.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+
+
+async def _query_level(client, doc_id: str, questions: List[str], level: int, requests: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(level)
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            resp = await client.post("/api/query", json={"query": questions[i % len(questions)], "doc_id": doc_id})
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            if resp.status_code != 200:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "requests": requests,
+        "errors": errors,
+        "req_per_s": requests / elapsed,
+        "latency_ms": _percentiles(latencies),
+    }
+
+
+async def _query_sweep(doc_id: str, questions: List[str], levels: List[int], requests_per_level: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    async with _client() as client:
+        # Warm-up request (first-touch costs are not part of the sweep)
+        await client.post("/api/query", json={"query": questions[0], "doc_id": doc_id})
+        for level in levels:
+            out[f"concurrency_{level}"] = await _query_level(client, doc_id, questions, level, requests_per_level)
+    return out
+
+
+async def _mixed_load(doc_id: str, questions: List[str], pdf_path: str, uploads: int, level: int, requests: int) -> Dict[str, Any]:
+    from app.services.jobs import job_manager
+
+    with open(pdf_path, "rb") as f:
+        pdf = f.read()
+    statuses: Dict[str, int] = {}
+    job_ids: List[str] = []
+
+    async with _client() as client:
+        async def upload(i: int) -> None:
+            # Distinct trailing bytes so dedupe doesn't short-circuit the ingest
+            body = pdf + f"\n% burst {i}\n".encode()
+            resp = await client.post("/api/upload", files={"file": (f"burst_{i}.pdf", body, "application/pdf")})
+            statuses[str(resp.status_code)] = statuses.get(str(resp.status_code), 0) + 1
+            if resp.status_code == 202:
+                job_ids.append(resp.json()["job_id"])
+
+        results = await asyncio.gather(
+            _query_level(client, doc_id, questions, level, requests),
+            *(upload(i) for i in range(uploads)),
+        )
+
+    # Let the burst finish ingesting so later scenarios run on a quiet process
+    t0 = time.perf_counter()
+    while any((job_manager.get(j) or {}).get("status") in ("queued", "running") for j in job_ids):
+        await asyncio.sleep(0.05)
+    return {
+        "uploads": uploads,
+        "upload_status": statuses,
+        "ingest_drain_s": time.perf_counter() - t0,
+        f"concurrency_{level}": results[0],
+    }
+
+
+def _reset_loop_resources() -> None:
+    """Each asyncio.run() is a new event loop: drop resources bound to the previous one."""
+    from app.core.registry import registry
+
+    for name in ("embedding_batcher", "gate_query", "gate_batch", "gate_upload"):
+        registry.reset(name)
+
+
+def bench_query(doc_id: str, labels: List[Dict], levels: List[int], requests_per_level: int) -> Dict[str, Any]:
+    questions = [l["question"] for l in labels]
+    _reset_loop_resources()
+    return asyncio.run(_query_sweep(doc_id, questions, levels, requests_per_level))
+
+
+def bench_mixed(doc_id: str, labels: List[Dict], pdf_path: str, uploads: int, level: int, requests: int) -> Dict[str, Any]:
+    questions = [l["question"] for l in labels]
+    _reset_loop_resources()
+    return asyncio.run(_mixed_load(doc_id, questions, pdf_path, uploads, level, requests))
+
+
+def bench_recall(doc_id: str, labels: List[Dict], k: int) -> Dict[str, Any]:
+    from app.services.retrieval import retrieve
+
+    hits_1 = hits_k = 0
+    latencies = []
+    for label in labels:
+        t0 = time.perf_counter()
+        sources = retrieve(label["question"], top_k=k, target_doc_id=doc_id)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        pages = [s.get("page") for s in sources]
+        hits_1 += int(pages[:1] == [label["page"]])
+        hits_k += int(label["page"] in pages[:k])
+    n = max(1, len(labels))
+    return {
+        "questions": len(labels),
+        "k": k,
+        "recall_at_1": hits_1 / n,
+        f"recall_at_{k}": hits_k / n,
+        "retrieve_latency_ms": _percentiles(latencies),
+    }
+
+
+def bench_context(doc_id: str, labels: List[Dict]) -> Dict[str, Any]:
+    from app.core.config import settings
+    from app.services.retrieval import retrieve, select_context
+
+    naive_tokens = packed_tokens = 0
+    kept_naive = kept_packed = 0
+    for label in labels:
+        sources = retrieve(label["question"], target_doc_id=doc_id)
+        naive = sources[:max(3, settings.top_k)]
+        packed = select_context(label["question"], sources)
+        naive_tokens += sum(len(s["text"].split()) for s in naive)
+        packed_tokens += sum(len(s["text"].split()) for s in packed)
+        kept_naive += int(any(label["answer"] in s["text"] for s in naive))
+        kept_packed += int(any(label["answer"] in s["text"] for s in packed))
+    n = max(1, len(labels))
+    return {
+        "questions": len(labels),
+        "words_full_chunks": naive_tokens / n,
+        "words_packed": packed_tokens / n,
+        "reduction": 1.0 - packed_tokens / max(1, naive_tokens),
+        "answer_in_context_full": kept_naive / n,
+        "answer_in_context_packed": kept_packed / n,
+    }
+
+
+# -------------------------------
+# Entry point
+# -------------------------------
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    _prepare_environment(workdir, args.llm_delay_ms, args.backend)
+
+    from app.core.config import settings
+    from app.core.registry import registry
+    from benchmarks.fakes import FakeEmbedder
+    from benchmarks.synthetic import make_pdf
+
+    if not args.real_embedder:
+        registry.override("embedder", FakeEmbedder())
+
+    pdf_path = os.path.join(workdir, f"synthetic_{args.pages}p.pdf")
+    labels = make_pdf(pdf_path, args.pages, seed=args.seed)
+    eval_labels = labels[:: max(1, len(labels) // args.questions)][: args.questions]
+
+    scenarios: Dict[str, Any] = {}
+    _scenario(scenarios, "extract", lambda: bench_extract(pdf_path, args.workers))
+    _scenario(scenarios, "embed", lambda: bench_embed(pdf_path))
+    _scenario(scenarios, "insert", lambda: bench_insert(pdf_path, settings.ingest_batch_size))
+    _scenario(scenarios, "ingest", lambda: bench_ingest(pdf_path))
+
+    doc_id = (scenarios.get("ingest") or {}).get("doc_id")
+    if doc_id:
+        _scenario(scenarios, "query", lambda: bench_query(doc_id, eval_labels, args.concurrency, args.requests))
+        _scenario(scenarios, "mixed", lambda: bench_mixed(
+            doc_id, eval_labels, pdf_path, args.uploads, max(args.concurrency), args.requests
+        ))
+        _scenario(scenarios, "recall", lambda: bench_recall(doc_id, eval_labels, args.k))
+        _scenario(scenarios, "context", lambda: bench_context(doc_id, eval_labels))
+
+    return {
+        "config": {
+            "pages": args.pages,
+            "seed": args.seed,
+            "workers": args.workers,
+            "embedder": getattr(registry.get_embedder(), "model_name", "unknown"),
+            "vector_backend": settings.vector_backend,
+            "chunking": settings.chunking,
+            "chunk_size": settings.chunk_size,
+            "chunk_overlap": settings.chunk_overlap,
+            "ingest_batch_size": settings.ingest_batch_size,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--questions", type=int, default=50, help="labeled questions used by query/recall")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="process pool size for extract")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    ap.add_argument("--uploads", type=int, default=8, help="uploads in the mixed-load burst")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--llm-delay-ms", type=float, default=0.0, help="fake LLM per-token delay")
+    ap.add_argument("--backend", default=os.getenv("VECTOR_BACKEND", "chroma"), choices=["chroma", "mmap"])
+    ap.add_argument("--real-embedder", action="store_true", help="use EMBEDDING_MODEL instead of the fake")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write JSON here (default: stdout)")
+    args = ap.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
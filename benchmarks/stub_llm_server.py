@@ -0,0 +1,133 @@
+"""
+Minimal OpenAI-compatible chat-completions server for offline testing.
+
+    python -m benchmarks.stub_llm_server --port 8001 --latency-ms 50 --fail-first 2
+
+Then point the app at it:
+
+    LLM_PROVIDER=openai OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_MODEL=stub
+
+Supports streaming (`"stream": true`, SSE chunks) and non-streaming calls,
+fixed latency, per-token delay and failure injection (the first N requests
+return HTTP 503, or --fail-status) for exercising timeouts and retries. The
+server counts requests and the most it handled at once (tests use both).
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StubLLMServer"
+
+    def log_message(self, format, *args):  # keep benchmark output clean
+        return
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        srv = self.server
+
+        with srv.lock:
+            srv.requests += 1
+            srv.inflight += 1
+            srv.max_inflight = max(srv.max_inflight, srv.inflight)
+            fail = srv.requests <= srv.fail_first
+        try:
+            self._respond(srv, body, fail)
+        finally:
+            with srv.lock:
+                srv.inflight -= 1
+
+    def _respond(self, srv: "StubLLMServer", body: dict, fail: bool) -> None:
+        if srv.latency_s:
+            time.sleep(srv.latency_s)
+        if fail:
+            self.send_response(srv.fail_status)
+            self.end_headers()
+            self.wfile.write(b'{"error": "injected failure"}')
+            return
+
+        words = srv.answer.split()
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, word in enumerate(words):
+                if srv.token_delay_s:
+                    time.sleep(srv.token_delay_s)
+                delta = {"choices": [{"delta": {"content": word if i == 0 else " " + word}}]}
+                self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": srv.answer}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, answer: str = "This is a stub answer.", latency_ms: float = 0.0,
+                 token_delay_ms: float = 0.0, fail_first: int = 0, fail_status: int = 503):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.answer = answer
+        self.latency_s = latency_ms / 1000.0
+        self.token_delay_s = token_delay_ms / 1000.0
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.requests = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their deadline hang up mid-response; that's expected here
+        import sys
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_stub_server(**kwargs) -> Tuple[StubLLMServer, threading.Thread]:
+    """Run a StubLLMServer on a background thread; call server.shutdown() when done."""
+    server = StubLLMServer(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True)
+    thread.start()
+    return server, thread
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--answer", default="This is a stub answer.")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--token-delay-ms", type=float, default=0.0)
+    ap.add_argument("--fail-first", type=int, default=0)
+    ap.add_argument("--fail-status", type=int, default=503)
+    args = ap.parse_args()
+    server = StubLLMServer(
+        args.port, args.answer, args.latency_ms, args.token_delay_ms, args.fail_first, args.fail_status
+    )
+    print(f"Stub LLM server listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Synthetic PDF generator with labeled question -> page pairs for recall measurements."""
+import random
+from typing import Dict, List, Tuple
+
+import fitz  # PyMuPDF
+
+_FILLER = (
+    "The assembly should be inspected at regular intervals according to the maintenance "
+    "schedule. Operators must wear protective equipment and follow the lockout procedure "
+    "before opening any panel. Record every inspection in the service log together with "
+    "the operating hours and any observations about noise, vibration or leaks."
+).split()
+
+
+def _filler(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_FILLER) for _ in range(words)) + "."
+
+
+def make_pdf(path: str, pages: int, words_per_page: int = 350, seed: int = 0) -> List[Dict]:
+    """
+    Write a `pages`-page PDF to `path`. Every page carries one unique fact
+    ("The calibration code for unit U<n> is <code>.") buried in filler text.
+
+    Returns the labels: [{"question", "answer", "page"}], one per page.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    labels: List[Dict] = []
+    for p in range(1, pages + 1):
+        unit = f"U{p:05d}"
+        code = f"{rng.choice('ABCDEFGH')}{rng.randint(1000, 9999)}"
+        fact = f"The calibration code for unit {unit} is {code}."
+        half = words_per_page // 2
+        body = f"Section {p}. {_filler(rng, half)} {fact} {_filler(rng, half)}"
+
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), body, fontsize=9)
+        labels.append({"question": f"What is the calibration code for unit {unit}?", "answer": code, "page": p})
+    doc.save(path)
+    doc.close()
+    return labels
+
+
+def label_pairs(labels: List[Dict]) -> List[Tuple[str, int]]:
+    return [(l["question"], l["page"]) for l in labels]
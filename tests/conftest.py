@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# Settings and module-level paths are read when `app` is first imported, so
+# point them at a scratch directory before any test module imports it
+_WORKDIR = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["PERSIST_DIR"] = os.path.join(_WORKDIR, "persistence")
+os.environ["VECTOR_BACKEND"] = "mmap"
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["EMBED_CACHE_ENABLED"] = "false"  # tests count real embedder calls
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+os.environ["PRELOAD_MODELS"] = "false"
+os.environ["PDF_PARALLEL_MIN_PAGES"] = "0"
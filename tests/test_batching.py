@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+from app.services.batching import EmbeddingBatcher
+from benchmarks.fakes import FakeEmbedder
+
+
+class RecordingEmbedder(FakeEmbedder):
+    def __init__(self, delay_s: float = 0.0, fail: bool = False):
+        super().__init__(dim=16)
+        self.delay_s = delay_s
+        self.fail = fail
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed_batch(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+        time.sleep(self.delay_s)
+        if self.fail:
+            raise RuntimeError("encoder failed")
+        return super().embed_batch(texts)
+
+
+def _run(batcher, texts):
+    async def go():
+        return await asyncio.gather(*(batcher.embed(t) for t in texts))
+
+    return asyncio.run(go())
+
+
+def test_concurrent_calls_share_batches_and_get_their_own_rows():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(lambda: embedder, window_ms=20, max_batch=32)
+    texts = [f"question {i}" for i in range(10)]
+
+    vectors = _run(batcher, texts)
+
+    assert vectors == [embedder.embed_one(t) for t in texts]
+    assert len(embedder.batches) == 1
+    assert batcher.stats()["items"] == 10
+
+
+def test_batches_are_capped_at_max_batch():
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(lambda: embedder, window_ms=20, max_batch=4)
+
+    _run(batcher, [f"q{i}" for i in range(10)])
+
+    assert [len(b) for b in embedder.batches] == [4, 4, 2]
+    assert batcher.stats()["batch_size_max"] == 4
+
+
+def test_requests_queue_while_a_batch_is_encoding():
+    embedder = RecordingEmbedder(delay_s=0.05)
+    batcher = EmbeddingBatcher(lambda: embedder, window_ms=0, max_batch=32)
+
+    async def go():
+        first = asyncio.ensure_future(batcher.embed("first"))
+        await asyncio.sleep(0.01)  # "first" is encoding now
+        rest = await asyncio.gather(*(batcher.embed(f"q{i}") for i in range(5)))
+        return [await first, *rest]
+
+    assert len(asyncio.run(go())) == 6
+    assert [len(b) for b in embedder.batches] == [1, 5]
+
+
+def test_encoder_error_reaches_every_caller_and_the_worker_survives():
+    embedder = RecordingEmbedder(fail=True)
+    batcher = EmbeddingBatcher(lambda: embedder, window_ms=10)
+
+    async def go():
+        results = await asyncio.gather(*(batcher.embed(f"q{i}") for i in range(3)), return_exceptions=True)
+        embedder.fail = False
+        return results, await batcher.embed("after")
+
+    results, after = asyncio.run(go())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert after == embedder.embed_one("after")
+
+
+def test_cancelled_callers_are_not_encoded():
+    embedder = RecordingEmbedder(delay_s=0.05)
+    batcher = EmbeddingBatcher(lambda: embedder, window_ms=0, max_batch=32)
+
+    async def go():
+        busy = asyncio.ensure_future(batcher.embed("busy"))
+        await asyncio.sleep(0.01)
+        gone = asyncio.ensure_future(batcher.embed("gone"))
+        kept = asyncio.ensure_future(batcher.embed("kept"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        await busy
+        return await kept
+
+    assert asyncio.run(go()) == embedder.embed_one("kept")
+    assert embedder.batches == [["busy"], ["kept"]]
+
+
+def test_embedder_is_resolved_off_the_event_loop():
+    embedder = RecordingEmbedder()
+    load_threads = []
+
+    def slow_load():
+        load_threads.append(threading.current_thread())
+        time.sleep(0.2)  # model load on a cold process
+        return embedder
+
+    batcher = EmbeddingBatcher(slow_load, window_ms=0)
+
+    async def go():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        await batcher.embed("q")
+        ticker.cancel()
+        return ticks, threading.current_thread()
+
+    ticks, loop_thread = asyncio.run(go())
+    assert load_threads and load_threads[0] is not loop_thread
+    assert ticks >= 5  # the loop kept running while the model loaded
@@ -0,0 +1,42 @@
+import json
+
+from app.db.catalog import DocumentCatalog
+
+
+def test_lookups_parse_the_file_once(tmp_path, monkeypatch):
+    cat = DocumentCatalog(str(tmp_path / "documents.json"))
+    cat.put("a", {"doc_name": "a.pdf", "content_hash": "h1"})
+    cat.put("b", {"doc_name": "b.pdf", "content_hash": "h2"})
+
+    loads = []
+    real_load = json.load
+    monkeypatch.setattr(json, "load", lambda f: loads.append(1) or real_load(f))
+    for _ in range(50):
+        assert cat.find_by_hash("h2") == "b"
+        assert cat.get("a")["doc_name"] == "a.pdf"
+    assert cat.find_by_hash("missing") is None
+    assert loads == []
+
+
+def test_writes_from_another_process_are_picked_up(tmp_path):
+    path = str(tmp_path / "documents.json")
+    reader, writer = DocumentCatalog(path), DocumentCatalog(path)
+    writer.put("a", {"content_hash": "h1"})
+    assert reader.find_by_hash("h1") == "a"
+
+    writer.put("a", {"content_hash": "h2"})
+    writer.put("b", {"content_hash": "h1"})
+    assert reader.find_by_hash("h2") == "a"
+    assert reader.find_by_hash("h1") == "b"
+
+    writer.remove("a")
+    assert reader.get("a") is None
+    assert reader.doc_ids() == ["b"]
+
+
+def test_returned_records_do_not_alias_the_cache(tmp_path):
+    cat = DocumentCatalog(str(tmp_path / "documents.json"))
+    cat.put("a", {"chunks": 3})
+    cat.get("a")["chunks"] = 99
+    cat.all()["a"]["chunks"] = 99
+    assert cat.get("a")["chunks"] == 3
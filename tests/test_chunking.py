@@ -0,0 +1,64 @@
+from app.services.chunking import TokenChunker
+from benchmarks.fakes import FakeEmbedder
+
+count_tokens = FakeEmbedder().count_tokens
+
+
+def _chunk(pages, max_tokens, overlap_tokens=0):
+    chunker = TokenChunker(count_tokens, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    chunks = []
+    for page, text in pages:
+        chunks.extend(chunker.feed(page, text))
+    return chunks + chunker.flush()
+
+
+def _sentences(prefix, n, words=6):
+    return " ".join(f"{prefix} sentence {i} " + " ".join(["word"] * (words - 3)) + "." for i in range(n))
+
+
+def test_chunks_fit_the_token_budget():
+    chunks = _chunk([(1, _sentences("a", 40)), (2, _sentences("b", 40))], max_tokens=50, overlap_tokens=10)
+    assert len(chunks) > 4
+    assert all(count_tokens([c["text"]])[0] <= 50 for c in chunks)
+
+
+def test_every_sentence_is_kept_in_order_without_overlap():
+    text = _sentences("a", 30)
+    chunks = _chunk([(1, text)], max_tokens=40)
+    assert " ".join(c["text"] for c in chunks) == text
+
+
+def test_overlap_repeats_whole_trailing_sentences():
+    chunks = _chunk([(1, _sentences("a", 30))], max_tokens=40, overlap_tokens=10)
+    for prev, cur in zip(chunks, chunks[1:]):
+        last = prev["text"].rsplit(". ", 1)[-1]
+        assert cur["text"].startswith(last.rstrip("."))
+        assert count_tokens([last])[0] <= 10
+
+
+def test_chunks_span_pages_and_keep_positional_ids():
+    chunks = _chunk([(1, _sentences("a", 3)), (2, _sentences("b", 3)), (3, _sentences("c", 30))], max_tokens=40)
+    assert chunks[0]["page"] == 1 and chunks[0]["page_end"] == 2
+    ids = [(c["page"], c["index"]) for c in chunks]
+    assert len(set(ids)) == len(ids)
+    for i, c in enumerate(chunks):
+        assert c["page"] <= c["page_end"]
+        assert c["index"] == sum(1 for o in chunks[:i] if o["page"] == c["page"])
+
+
+def test_oversized_sentence_is_split_on_words():
+    long_sentence = " ".join(f"w{i}" for i in range(100)) + "."
+    chunks = _chunk([(1, long_sentence)], max_tokens=30)
+    assert len(chunks) >= 4
+    assert all(count_tokens([c["text"]])[0] <= 30 for c in chunks)
+    assert " ".join(c["text"] for c in chunks).split() == long_sentence.split()
+
+
+def test_pending_from_page_marks_text_not_yet_emitted():
+    chunker = TokenChunker(count_tokens, max_tokens=40)
+    assert chunker.pending_from_page is None
+    chunker.feed(1, _sentences("a", 2))
+    chunker.feed(2, _sentences("b", 20))
+    assert chunker.pending_from_page == 2
+    chunker.flush()
+    assert chunker.pending_from_page is None
@@ -0,0 +1,54 @@
+import json
+import time
+
+from app.services.jobs import FAILED, RUNNING, SUCCEEDED, JobStore
+
+
+def _on_disk(store):
+    with open(store.path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_progress_updates_are_throttled_but_milestones_are_written(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.json"), save_interval_s=60)
+    job = store.create({"filename": "a.pdf"})
+    store.update(job["job_id"], status=RUNNING)
+    store.update(job["job_id"], stage="embedding", pages_done=10)
+
+    for pages in range(11, 50):
+        store.update(job["job_id"], stage="embedding", pages_done=pages)
+
+    assert store.get(job["job_id"])["pages_done"] == 49
+    assert _on_disk(store)[job["job_id"]]["pages_done"] == 10
+    store.update(job["job_id"], status=SUCCEEDED, stage="done")
+    assert _on_disk(store)[job["job_id"]]["pages_done"] == 49
+
+
+def test_flush_writes_held_back_progress(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.json"), save_interval_s=60)
+    job = store.create({"filename": "a.pdf"})
+    store.update(job["job_id"], pages_done=7)
+    store.flush()
+    assert JobStore(store.path).get(job["job_id"])["pages_done"] == 7
+
+
+def test_finished_jobs_are_pruned_by_age_and_count(tmp_path):
+    path = tmp_path / "jobs.json"
+    now = time.time()
+    jobs = {
+        "old": {"job_id": "old", "status": SUCCEEDED, "updated_at": now - 100},
+        "failed": {"job_id": "failed", "status": FAILED, "updated_at": now - 3},
+        "done": {"job_id": "done", "status": SUCCEEDED, "updated_at": now - 2},
+        "stuck": {"job_id": "stuck", "status": RUNNING, "updated_at": now - 100},
+    }
+    path.write_text(json.dumps(jobs), encoding="utf-8")
+
+    store = JobStore(str(path), retention_s=50, max_finished=2)
+
+    assert store.get("old") is None  # past retention
+    assert set(_on_disk(store)) == {"failed", "done", "stuck"}  # pending jobs are never pruned
+
+    store.update("stuck", status=SUCCEEDED)
+    store.create({"filename": "new.pdf"})
+    assert store.get("failed") is None  # only the newest max_finished are kept
+    assert store.get("done") is not None and store.get("stuck") is not None
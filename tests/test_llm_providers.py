@@ -0,0 +1,213 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.services.llm_providers import (
+    LLMError,
+    LLMTimeoutError,
+    OpenAICompatibleLLM,
+    ResilientLLM,
+    SyncLLMAdapter,
+)
+from benchmarks.stub_llm_server import start_stub_server
+
+ANSWER = "This is a stub answer."
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, _ = start_stub_server(answer=ANSWER, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _resilient(server, max_connections: int = 10, **policy) -> ResilientLLM:
+    policy.setdefault("timeout_s", 5.0)
+    policy.setdefault("max_retries", 2)
+    policy.setdefault("backoff_base_s", 0.001)
+    policy.setdefault("backoff_max_s", 0.01)
+    llm = OpenAICompatibleLLM(
+        base_url=server.base_url,
+        model="stub",
+        client=httpx.Client(),
+        async_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections)),
+    )
+    return ResilientLLM(llm, **policy)
+
+
+async def _collect(llm: ResilientLLM) -> str:
+    return "".join([piece async for piece in llm.astream("question")])
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_generate_retries_transient_status(stub, status):
+    server = stub(fail_first=2, fail_status=status)
+    assert asyncio.run(_resilient(server).agenerate("question")) == ANSWER
+    assert server.requests == 3
+
+
+def test_generate_gives_up_after_max_retries(stub):
+    server = stub(fail_first=10, fail_status=503)
+    with pytest.raises(LLMError) as err:
+        asyncio.run(_resilient(server, max_retries=1).agenerate("question"))
+    assert err.value.retryable
+    assert server.requests == 2
+
+
+def test_client_errors_are_not_retried(stub):
+    server = stub(fail_first=1, fail_status=400)
+    with pytest.raises(LLMError) as err:
+        asyncio.run(_resilient(server).agenerate("question"))
+    assert not err.value.retryable
+    assert server.requests == 1
+
+
+def test_generate_deadline_is_retried_then_raised(stub):
+    server = stub(latency_ms=300)
+    t0 = time.perf_counter()
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(_resilient(server, timeout_s=0.05, max_retries=1).agenerate("question"))
+    assert time.perf_counter() - t0 < 0.5
+    assert server.requests == 2
+
+
+def test_stream_yields_tokens_in_order(stub):
+    server = stub(token_delay_ms=5)
+    assert asyncio.run(_collect(_resilient(server))) == ANSWER
+    assert server.requests == 1
+
+
+def test_stream_retries_before_first_token(stub):
+    server = stub(fail_first=1, fail_status=429)
+    assert asyncio.run(_collect(_resilient(server))) == ANSWER
+    assert server.requests == 2
+
+
+def test_stalled_stream_attempts_release_their_connection(stub):
+    # One pooled connection: a timed-out attempt that kept its response open
+    # would leave the retry (and the next call) waiting for the pool
+    server = stub(token_delay_ms=300)
+    llm = _resilient(server, max_connections=1, timeout_s=0.1, max_retries=2)
+
+    async def run():
+        with pytest.raises(LLMTimeoutError):
+            await _collect(llm)
+        server.token_delay_s = 0.0
+        return await asyncio.wait_for(_collect(llm), timeout=2.0)
+
+    assert asyncio.run(run()) == ANSWER
+    assert server.requests == 4
+
+
+def test_abandoned_stream_releases_its_connection(stub):
+    server = stub(token_delay_ms=20)
+    llm = _resilient(server, max_connections=1)
+
+    async def run():
+        stream = llm.astream("question")
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first, await asyncio.wait_for(llm.agenerate("question"), timeout=2.0)
+
+    assert asyncio.run(run()) == ("This", ANSWER)
+
+
+def test_concurrency_cap(stub):
+    server = stub(latency_ms=50)
+    llm = _resilient(server, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(llm.agenerate("question") for _ in range(6)))
+
+    assert asyncio.run(run()) == [ANSWER] * 6
+    assert server.max_inflight == 2
+
+
+class _SlowSelfTimedLLM:
+    """Blocking provider that enforces its own deadline (like the Gemini SDK)."""
+
+    enforces_timeout = True
+    model_name = "slow"
+
+    def generate(self, prompt: str) -> str:
+        time.sleep(0.2)
+        return "done"
+
+    def stream(self, prompt: str):
+        yield self.generate(prompt)
+
+
+def test_provider_deadline_replaces_outer_wait_for():
+    llm = ResilientLLM(SyncLLMAdapter(_SlowSelfTimedLLM()), timeout_s=0.05, max_retries=0)
+    assert asyncio.run(llm.agenerate("question")) == "done"
+
+
+class _TrackedStreamLLM:
+    """
+    Blocking provider whose stream records when it is closed. It keeps a
+    reference to every stream (like a client holding its connections), so
+    only an explicit close ends one, not garbage collection.
+    """
+
+    model_name = "tracked"
+
+    def __init__(self, stall_s: float = 0.0):
+        self.stall_s = stall_s
+        self.closed = threading.Event()
+        self.streams = []
+
+    def generate(self, prompt: str) -> str:
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt: str):
+        it = self._stream()
+        self.streams.append(it)
+        return it
+
+    def _stream(self):
+        try:
+            yield "first"
+            time.sleep(self.stall_s)
+            yield "second"
+        finally:
+            self.closed.set()
+
+
+def test_sync_stream_is_closed_when_the_consumer_stops_early():
+    provider = _TrackedStreamLLM()
+    llm = ResilientLLM(SyncLLMAdapter(provider), timeout_s=5.0)
+
+    async def run():
+        stream = llm.astream("question")
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) == "first"
+    assert provider.closed.wait(1.0)
+
+
+def test_sync_stream_stalled_past_the_deadline_is_closed_once_its_call_returns():
+    provider = _TrackedStreamLLM(stall_s=0.3)
+    llm = ResilientLLM(SyncLLMAdapter(provider), timeout_s=0.1, max_retries=0)
+
+    async def run():
+        pieces = []
+        with pytest.raises(LLMTimeoutError):
+            async for piece in llm.astream("question"):
+                pieces.append(piece)
+        return pieces
+
+    assert asyncio.run(run()) == ["first"]
+    assert provider.closed.wait(1.0)
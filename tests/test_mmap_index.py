@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app.db.mmap_index import MmapVectorIndex
+
+DIM = 8
+
+
+def _vectors(n, seed=0):
+    v = np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _add(index, doc_id, vectors, start=0):
+    ids = [f"{doc_id}:{i}" for i in range(start, start + len(vectors))]
+    metas = [{"doc_id": doc_id, "page": i, "chunk_id": cid} for i, cid in enumerate(ids, start)]
+    index.upsert(ids, [f"text {cid}" for cid in ids], metas, vectors.tolist())
+    return ids
+
+
+@pytest.fixture
+def index(tmp_path):
+    return MmapVectorIndex(str(tmp_path / "mmap"))
+
+
+def test_compaction_during_query_is_retried_on_the_new_epoch(index):
+    vecs = _vectors(20)
+    ids = _add(index, "a", vecs)
+    index.delete(ids[:10])
+    expected = index.query([vecs[15].tolist()], ["a"], 3)
+
+    inner = index._query
+    epochs = []
+
+    def compacting_query(q, doc_ids, top_k, epoch, empty):
+        epochs.append(epoch)
+        if len(epochs) == 1:
+            index.compact()  # the matrix this read started on is replaced underneath it
+        return inner(q, doc_ids, top_k, epoch, empty)
+
+    index._query = compacting_query
+    res = index.query([vecs[15].tolist()], ["a"], 3)
+
+    assert epochs == [0, 1]
+    assert res["ids"] == expected["ids"]
+    assert res["ids"][0][0] == ids[15]
+    np.testing.assert_allclose(res["distances"], expected["distances"], atol=1e-3)
+
+
+def _brute(vecs, q, k):
+    d = ((vecs - q) ** 2).sum(axis=1)
+    return list(np.argsort(d, kind="stable")[:k]), sorted(d)[:k]
+
+
+def test_query_matches_brute_force_within_a_scope(index):
+    a, b = _vectors(30, seed=1), _vectors(30, seed=2)
+    ids_a = _add(index, "a", a)
+    _add(index, "b", b)
+    q = _vectors(1, seed=3)[0]
+
+    res = index.query([q.tolist()], ["a"], 5)
+
+    order, dists = _brute(a, q, 5)
+    assert res["ids"][0] == [ids_a[i] for i in order]
+    np.testing.assert_allclose(res["distances"][0], dists, atol=5e-3)  # float16 storage
+    assert {m["doc_id"] for m in res["metadatas"][0]} == {"a"}
+    assert len(index.query([q.tolist()], None, 60)["ids"][0]) == 60
+
+
+def test_upsert_replaces_the_live_row(index):
+    vecs = _vectors(5)
+    ids = _add(index, "a", vecs)
+    index.upsert([ids[0]], ["new text"], [{"doc_id": "a", "page": 0}], [vecs[4].tolist()])
+
+    got = index.get([ids[0]], include_embeddings=True)
+    assert got["documents"] == ["new text"]
+    np.testing.assert_allclose(got["embeddings"][0], vecs[4], atol=1e-3)
+    assert sorted(index.chunk_ids("a")) == sorted(ids)
+    assert set(index.query([vecs[4].tolist()], ["a"], 2)["ids"][0]) == {ids[0], ids[4]}
+
+
+def test_delete_document_and_chunk_ids_after_page(index):
+    ids = _add(index, "a", _vectors(6))
+    _add(index, "b", _vectors(3, seed=1))
+    assert sorted(index.chunk_ids("a", after_page=3)) == sorted(ids[4:])
+
+    index.delete_document("a")
+
+    assert index.chunk_ids("a") == []
+    assert index.get(ids)["ids"] == []
+    assert index.query([_vectors(1)[0].tolist()], ["a"], 3)["ids"] == [[]]
+    assert len(index.query([_vectors(1)[0].tolist()], None, 10)["ids"][0]) == 3
+
+
+def test_compaction_drops_retired_rows_and_keeps_results(index, tmp_path):
+    vecs = _vectors(40)
+    ids = _add(index, "a", vecs)
+    index.delete(ids[::2])
+    q = _vectors(1, seed=5)[0].tolist()
+    before = index.query([q], ["a"], 5)
+
+    stats = index.compact()
+
+    assert (stats["rows_before"], stats["rows_after"]) == (40, 20)
+    assert stats["bytes_after"] == 20 * DIM * 2
+    assert index.query([q], ["a"], 5)["ids"] == before["ids"]
+    # A fresh instance (another worker process) reads the compacted state
+    reopened = MmapVectorIndex(str(tmp_path / "mmap"))
+    assert reopened.query([q], ["a"], 5)["ids"] == before["ids"]
+    assert sorted(reopened.chunk_ids("a")) == sorted(ids[1::2])
+
+
+def test_dimension_mismatch_is_rejected(index):
+    _add(index, "a", _vectors(2))
+    with pytest.raises(ValueError):
+        index.upsert(["x"], ["t"], [{"doc_id": "a"}], [[0.0] * (DIM + 1)])
@@ -0,0 +1,57 @@
+import numpy as np
+
+from app.core.config import settings
+from app.core.registry import registry
+from app.db import page_index as page_index_module
+from app.db.catalog import catalog
+from app.db.page_index import PageVectorIndex
+from app.db.vectorstore import VectorStore
+from benchmarks.fakes import FakeEmbedder
+
+
+def _build(index, doc_id, pages):
+    rng = np.random.default_rng(abs(hash(doc_id)) % 2**32)
+    index.build(doc_id, [(f"{doc_id}:{p}:0", p, p, rng.normal(size=4)) for p in range(1, pages + 1)])
+
+
+def test_covers_batches_large_scopes(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_index_module, "_SQL_BATCH", 3)
+    index = PageVectorIndex(str(tmp_path / "pages.sqlite3"))
+    docs = [f"d{i}" for i in range(7)]
+    for d in docs:
+        _build(index, d, pages=2)
+
+    assert index.covers(docs, min_pages=14)
+    assert not index.covers(docs, min_pages=15)
+    assert index.covers(docs + docs, min_pages=14)  # duplicates count once
+    assert not index.covers(docs + ["no-layer"], min_pages=1)
+    assert not index.covers([], min_pages=0)
+
+
+def test_top_pages_ranks_pages_across_documents(tmp_path):
+    index = PageVectorIndex(str(tmp_path / "pages.sqlite3"))
+    index.build("a", [("a:1:0", 1, 1, [1, 0, 0, 0]), ("a:2:0", 2, 2, [0, 1, 0, 0])])
+    index.build("b", [("b:1:0", 1, 2, [0, 0, 1, 0])])  # spans pages 1-2
+
+    # b's chunk covers both of b's pages; it is listed once
+    assert index.top_pages([0, 0.1, 1, 0], ["a", "b"], top_pages=3) == ["b:1:0", "a:2:0"]
+
+
+def test_scope_too_small_by_catalog_skips_the_layer_lookup(monkeypatch):
+    registry.override("embedder", FakeEmbedder())
+    small = settings.hierarchical_min_pages // 2
+    catalog.put("small-a", {"page_hashes": ["h"] * small})
+    catalog.put("small-b", {"page_hashes": ["h"] * (small - 1)})
+    lookups = []
+    monkeypatch.setattr(PageVectorIndex, "covers", lambda self, doc_ids, min_pages: lookups.append(doc_ids) or True)
+    try:
+        vs = VectorStore()
+        assert not vs.uses_pages(["small-a", "small-b"])
+        assert lookups == []
+        # A document without recorded pages leaves it to the layer
+        assert vs.uses_pages(["small-a", "unknown"])
+        assert lookups == [["small-a", "unknown"]]
+    finally:
+        catalog.remove("small-a")
+        catalog.remove("small-b")
+        registry.reset("embedder")
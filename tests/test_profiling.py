@@ -0,0 +1,61 @@
+import asyncio
+import pstats
+import sys
+
+import pytest
+
+from app.core.concurrency import BoundedExecutor
+from app.core.metrics import profile_to
+
+
+def hot_path_in_worker():
+    return sum(i * i for i in range(20000))
+
+
+def unrelated_worker_call():
+    return sum(range(20000))
+
+
+def _functions(path):
+    return {name for (_, _, name) in pstats.Stats(path).stats}
+
+
+def test_capture_includes_the_requests_worker_calls(tmp_path):
+    pool = BoundedExecutor("profiled", 2)
+
+    async def request():
+        with profile_to(str(tmp_path), "/api/query") as path:
+            await pool.run(hot_path_in_worker)
+        return path
+
+    path = asyncio.run(request())
+    pool.shutdown()
+    assert "hot_path_in_worker" in _functions(path)
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason="cProfile sees every thread from 3.12 on")
+def test_capture_excludes_other_requests_worker_calls(tmp_path):
+    pool = BoundedExecutor("profiled", 2)
+
+    async def other_request():
+        await asyncio.sleep(0.01)  # runs while the profiled request is in flight
+        await pool.run(unrelated_worker_call)
+
+    async def request():
+        other = asyncio.create_task(other_request())  # started outside the capture
+        with profile_to(str(tmp_path), "/api/query") as path:
+            await pool.run(hot_path_in_worker)
+            await other
+        return path
+
+    path = asyncio.run(request())
+    pool.shutdown()
+    assert "hot_path_in_worker" in _functions(path)
+    assert "unrelated_worker_call" not in _functions(path)
+
+
+def test_only_one_request_is_profiled_at_a_time(tmp_path):
+    with profile_to(str(tmp_path), "a") as first:
+        with profile_to(str(tmp_path), "b") as second:
+            pass
+    assert first and second is None
@@ -0,0 +1,70 @@
+import hashlib
+import random
+
+import fitz
+import pytest
+
+from app.core.registry import registry
+from app.db.catalog import catalog
+from app.db.vectorstore import VectorStore
+from app.services.ingestion import ingest_pdf
+from app.services.reindex import rebuild_index
+from benchmarks.fakes import FakeEmbedder
+
+_WORDS = "pump valve seal bearing rotor shaft housing gasket impeller coupling".split()
+
+
+@pytest.fixture
+def embedder():
+    registry.override("embedder", FakeEmbedder())
+    yield
+    registry.reset("embedder")
+
+
+def _pdf(path, pages, seed):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        text = f"Page {i}. " + " ".join(rng.choice(_WORDS) for _ in range(200))
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=8)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_rebuild_reextracts_documents_without_stored_page_text(tmp_path, embedder):
+    path = _pdf(tmp_path / "legacy.pdf", pages=3, seed=7)
+    with open(path, "rb") as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    doc = ingest_pdf(path, "legacy.pdf", content_hash=content_hash)
+    assert catalog.get(doc["doc_id"])["file_path"] == path
+    # As if ingested before the page text store existed
+    registry.get_page_store().delete_document(doc["doc_id"])
+
+    summary = rebuild_index(workers=1, restart=True)
+
+    assert summary["missing"] == {} and summary["failed"] == {}
+    assert registry.index_name(refresh=True) == summary["index"]
+    assert VectorStore().count_chunks(doc["doc_id"]) == doc["chunks"]
+    # The PDF's text is back in the page store for the next rebuild
+    assert registry.get_page_store().page_count(doc["doc_id"]) == 3
+
+
+def test_rebuild_finds_legacy_uploads_by_name(tmp_path, embedder, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # uploads live in ./uploads
+    (tmp_path / "uploads").mkdir()
+    path = _pdf(tmp_path / "uploads" / "0b5e6a1c_manual.pdf", pages=2, seed=8)
+    with open(path, "rb") as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    doc = ingest_pdf(path, "manual.pdf", content_hash=content_hash)
+    registry.get_page_store().delete_document(doc["doc_id"])
+    # A record written before the upload path was kept
+    rec = catalog.get(doc["doc_id"])
+    rec.pop("file_path")
+    catalog.remove(doc["doc_id"])
+    catalog.put(doc["doc_id"], rec)
+
+    summary = rebuild_index(workers=1, restart=True)
+
+    assert summary["missing"] == {}
+    assert VectorStore().count_chunks(doc["doc_id"]) == doc["chunks"]
@@ -0,0 +1,118 @@
+import random
+
+import fitz
+import pytest
+
+from app.core.registry import registry
+from app.db.catalog import catalog
+from app.db.vectorstore import VectorStore
+from app.services.ingestion import ingest_pdf
+from benchmarks.fakes import FakeEmbedder
+
+_WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda sigma tau".split()
+
+
+class CountingEmbedder(FakeEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.embedded = []
+
+    def embed_batch(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_batch(texts)
+
+
+@pytest.fixture
+def embedder():
+    fake = CountingEmbedder()
+    registry.override("embedder", fake)
+    yield fake
+    registry.reset("embedder")
+
+
+def _pages(n, seed=0):
+    rng = random.Random(seed)
+    return [f"Page {i} topic. " + " ".join(rng.choice(_WORDS) for _ in range(400)) + f" Fact {i}." for i in range(n)]
+
+
+def _pdf(path, texts):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=8)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _stored(doc_id):
+    vs = VectorStore()
+    res = vs.get_chunks(vs.backend.chunk_ids(doc_id))
+    return {text: (meta["page"], meta["page_end"]) for text, meta in zip(res["documents"], res["metadatas"])}
+
+
+def test_replace_with_inserted_page_reuses_shifted_chunks(tmp_path, embedder):
+    texts = _pages(8)
+    first = ingest_pdf(_pdf(tmp_path / "v1.pdf", texts), "doc.pdf")
+    before = _stored(first["doc_id"])
+    embedder.embedded.clear()
+
+    inserted = "Inserted page about the new warranty terms. " * 20
+    result = ingest_pdf(
+        _pdf(tmp_path / "v2.pdf", texts[:2] + [inserted] + texts[2:]),
+        "doc.pdf", doc_id=first["doc_id"], replace=True,
+    )
+    after = _stored(first["doc_id"])
+
+    # Only chunks touching the inserted page are embedded; everything after it moved a page down
+    assert len(embedder.embedded) == result["chunks"] - result["chunks_reused"]
+    assert len(embedder.embedded) <= 3
+    assert any("warranty" in t for t in embedder.embedded)
+    for text, (page, page_end) in before.items():
+        if text in after and page >= 3:
+            assert after[text] == (page + 1, page_end + 1)
+    assert VectorStore().count_chunks(first["doc_id"]) == result["chunks"]
+    assert catalog.get(first["doc_id"])["chunks"] == result["chunks"]
+
+
+def test_replace_with_edited_page_reembeds_only_that_page(tmp_path, embedder):
+    texts = _pages(6, seed=1)
+    first = ingest_pdf(_pdf(tmp_path / "v1.pdf", texts), "doc.pdf")
+    embedder.embedded.clear()
+
+    edited = list(texts)
+    edited[3] = edited[3].replace("Fact 3.", "Revised fact about pumps.")
+    result = ingest_pdf(_pdf(tmp_path / "v2.pdf", edited), "doc.pdf", doc_id=first["doc_id"], replace=True)
+
+    assert result["pages_changed"] == 1
+    assert result["chunks_reused"] == result["chunks"] - len(embedder.embedded)
+    assert 1 <= len(embedder.embedded) <= 2
+    assert all("pumps" in t or "Page 3" in t or "Page 4" in t for t in embedder.embedded)
+    assert result["chunks_deleted"] == len(embedder.embedded)
+    assert "pumps" in "".join(_stored(first["doc_id"]))
+
+
+def test_identical_revision_embeds_nothing(tmp_path, embedder):
+    path = _pdf(tmp_path / "v1.pdf", _pages(4, seed=2))
+    first = ingest_pdf(path, "doc.pdf")
+    embedder.embedded.clear()
+
+    result = ingest_pdf(path, "doc.pdf", doc_id=first["doc_id"], replace=True)
+
+    assert embedder.embedded == []
+    assert result["chunks_reused"] == result["chunks"] == first["chunks"]
+    assert result["chunks_deleted"] == 0
+
+
+def test_delete_then_query(tmp_path, embedder):
+    keep = ingest_pdf(_pdf(tmp_path / "keep.pdf", _pages(3, seed=3)), "keep.pdf")
+    gone = ingest_pdf(_pdf(tmp_path / "gone.pdf", _pages(3, seed=4)), "gone.pdf")
+    vs = VectorStore()
+    q = embedder.embed_one("alpha beta gamma")
+
+    assert vs.delete_document(gone["doc_id"])
+    assert vs.count_chunks(gone["doc_id"]) == 0
+    assert catalog.get(gone["doc_id"]) is None
+    assert vs.query(q, doc_ids=[gone["doc_id"]], top_k=5)["ids"][0] == []
+    found = {m["doc_id"] for m in vs.query(q, doc_ids=None, top_k=100)["metadatas"][0]}
+    assert keep["doc_id"] in found and gone["doc_id"] not in found
+    assert not vs.delete_document(gone["doc_id"])
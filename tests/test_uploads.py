@@ -0,0 +1,77 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import documents
+from app.core.concurrency import BoundedExecutor
+from app.core.registry import registry
+from app.db.catalog import catalog
+from app.services.jobs import FAILED, job_manager
+from benchmarks.fakes import FakeEmbedder
+
+PDF = b"%PDF-1.4 not really a pdf, never parsed by these tests"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # uploads go to ./uploads
+    registry.override("embedder", FakeEmbedder())
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/api")
+    yield TestClient(app)
+    registry.reset("embedder")
+
+
+def _upload_dir_files(tmp_path):
+    path = tmp_path / "uploads"
+    return sorted(os.listdir(path)) if path.exists() else []
+
+
+def test_failed_dedupe_lookup_leaves_no_part_file(client, tmp_path, monkeypatch):
+    def broken(content_hash):
+        raise RuntimeError("catalog unavailable")
+
+    monkeypatch.setattr(documents, "_find_duplicate", broken)
+    res = client.post("/api/upload", files={"file": ("a.pdf", PDF, "application/pdf")})
+
+    assert res.status_code == 500
+    assert _upload_dir_files(tmp_path) == []
+
+
+def test_duplicate_upload_reuses_the_document_and_keeps_nothing(client, tmp_path):
+    catalog.put("dup-doc", {"doc_name": "a.pdf", "content_hash": hashlib.sha256(PDF).hexdigest(), "chunks": 4})
+    try:
+        res = client.post("/api/upload", files={"file": ("copy.pdf", PDF, "application/pdf")})
+    finally:
+        catalog.remove("dup-doc")
+
+    assert res.status_code == 200
+    assert res.json()["doc_id"] == "dup-doc" and res.json()["chunks"] == 4
+    assert _upload_dir_files(tmp_path) == []
+
+
+def test_upload_matching_a_pending_job_is_not_stored_again(client, tmp_path):
+    pending = job_manager.store.create({
+        "filename": "a.pdf",
+        "file_path": str(tmp_path / "first_a.pdf"),
+        "content_hash": hashlib.sha256(PDF).hexdigest(),
+    })
+    try:
+        res = client.post("/api/upload", files={"file": ("a.pdf", PDF, "application/pdf")})
+    finally:
+        job_manager.store.update(pending["job_id"], status=FAILED)
+
+    assert res.status_code == 202
+    assert res.json()["job_id"] == pending["job_id"]
+    assert _upload_dir_files(tmp_path) == []
+
+
+def test_submit_after_shutdown_does_not_leak_a_queued_count():
+    pool = BoundedExecutor("test", 1)
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.submit(print)
+    assert pool.queued == 0